@@ -0,0 +1,404 @@
+"""
+Asynchronous worker fan out.
+
+In async mode the orchestrator starts every worker with InvocationType="Event" and returns instead of holding a
+RequestResponse invoke open for each one. Each worker writes a completion record under runs/{run_id}/results/ and
+adds its id to the run's item in the RUNS_TABLE DynamoDB table. The worker whose id completes the set claims the
+reduce step with a conditional write and invokes the orchestrator again to join the run.
+The run itself (dates, repo groups, report options) is kept at runs/{run_id}/run.json for the reducer.
+
+A worker that crashes never reports, so each run also has a deadline. The orchestrator's sweep_async_runs event,
+run on a schedule, claims and reduces every run past its deadline with whatever groups reported.
+
+LocalS3, LocalDynamoDB and LocalLambda stand in for S3, DynamoDB and Lambda so a run can be exercised offline.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+RUNS_BUCKET = "coincommit"
+RUNS_PREFIX = "runs/"
+# one item per run: group_count, deadline, completed_workers (string set) and reduce_claimed_at once claimed
+RUNS_TABLE = os.environ.get("RUNS_TABLE", "coincommit-runs")
+ASYNC_POLL_SECS = 10.0
+# past this long after dispatch the sweep reduces a run without its missing groups. Workers time out at 900s,
+# the rest covers queueing of throttled Event invokes
+ASYNC_RUN_DEADLINE_SECS = float(os.environ.get("ASYNC_RUN_DEADLINE_SECS", "1800"))
+# items expire through the table's TTL on expires_at
+RUN_ITEM_TTL_SECS = 14 * 24 * 3600
+
+COMPLETION_UPDATE = "ADD completed_workers :worker SET expires_at = if_not_exists(expires_at, :expires_at)"
+CLAIM_UPDATE = "SET reduce_claimed_at = :now, expires_at = if_not_exists(expires_at, :expires_at)"
+CLAIM_CONDITION = "attribute_not_exists(reduce_claimed_at)"
+OVERDUE_FILTER = "attribute_not_exists(reduce_claimed_at) AND #deadline < :now"
+
+
+def run_key(run_id: str) -> str:
+    return f"{RUNS_PREFIX}{run_id}/run.json"
+
+
+def results_prefix(run_id: str) -> str:
+    return f"{RUNS_PREFIX}{run_id}/results/"
+
+
+def completion_key(run_id: str, worker_id) -> str:
+    return f"{results_prefix(run_id)}{worker_id}.json"
+
+
+def _put_json(s3_client, key: str, body: Dict, **kwargs):
+    s3_client.put_object(Bucket=RUNS_BUCKET, Key=key, Body=json.dumps(body).encode("utf-8"), **kwargs)
+
+
+def _get_json(s3_client, key: str) -> Optional[Dict]:
+    try:
+        response = s3_client.get_object(Bucket=RUNS_BUCKET, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise e
+    return json.loads(response["Body"].read())
+
+
+def save_run(s3_client, run_id: str, run: Dict):
+    _put_json(s3_client, run_key(run_id), run)
+
+
+def load_run(s3_client, run_id: str) -> Optional[Dict]:
+    return _get_json(s3_client, run_key(run_id))
+
+
+def write_completion(s3_client, run_id: str, worker_id, record: Dict):
+    _put_json(s3_client, completion_key(run_id, worker_id), record)
+
+
+def _list_completion_keys(s3_client, run_id: str):
+    list_kwargs = {"Bucket": RUNS_BUCKET, "Prefix": results_prefix(run_id)}
+    while True:
+        response = s3_client.list_objects_v2(**list_kwargs)
+        for s3_object in response.get("Contents", []):
+            yield s3_object["Key"]
+        if not response.get("IsTruncated"):
+            return
+        list_kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def list_completions(s3_client, run_id: str, known: Optional[Dict[int, Dict]] = None) -> Dict[int, Dict]:
+    """
+    Completion records of a run by worker id, only records not already in known are downloaded
+    """
+    completions = dict(known) if known is not None else {}
+    for key in _list_completion_keys(s3_client, run_id):
+        worker_id = int(key.split("/")[-1].split(".")[0])
+        if worker_id not in completions:
+            completions[worker_id] = _get_json(s3_client, key)
+    return completions
+
+
+def _run_item_key(run_id: str) -> Dict:
+    return {"run_id": {"S": run_id}}
+
+
+def _expires_at() -> Dict:
+    return {"N": str(int(time.time() + RUN_ITEM_TTL_SECS))}
+
+
+def register_run(dynamodb, run_id: str, group_count: int, deadline: float):
+    dynamodb.put_item(
+        TableName=RUNS_TABLE,
+        Item={
+            **_run_item_key(run_id),
+            "group_count": {"N": str(group_count)},
+            "deadline": {"N": str(int(deadline))},
+            "expires_at": _expires_at(),
+        },
+    )
+
+
+def record_completion(dynamodb, run_id: str, worker_id) -> int:
+    """
+    Add worker_id to the run's completed set, returns how many distinct workers have completed. Adding to a set
+    is idempotent, so retried and hedged workers are only counted once.
+    """
+    response = dynamodb.update_item(
+        TableName=RUNS_TABLE,
+        Key=_run_item_key(run_id),
+        UpdateExpression=COMPLETION_UPDATE,
+        ExpressionAttributeValues={":worker": {"SS": [str(worker_id)]}, ":expires_at": _expires_at()},
+        ReturnValues="UPDATED_NEW",
+    )
+    return len(response["Attributes"]["completed_workers"]["SS"])
+
+
+def completed_count(dynamodb, run_id: str) -> int:
+    response = dynamodb.get_item(
+        TableName=RUNS_TABLE, Key=_run_item_key(run_id), ProjectionExpression="completed_workers", ConsistentRead=True
+    )
+    return len(response.get("Item", {}).get("completed_workers", {}).get("SS", []))
+
+
+def claim_reduce(dynamodb, run_id: str) -> bool:
+    """
+    Mark the run's reduce as claimed if nobody has yet, only the caller that does reduces the run
+    """
+    try:
+        dynamodb.update_item(
+            TableName=RUNS_TABLE,
+            Key=_run_item_key(run_id),
+            UpdateExpression=CLAIM_UPDATE,
+            ConditionExpression=CLAIM_CONDITION,
+            ExpressionAttributeValues={":now": {"N": str(time.time())}, ":expires_at": _expires_at()},
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return False
+        raise e
+    return True
+
+
+def overdue_runs(dynamodb, now: Optional[float] = None) -> List[str]:
+    """
+    Runs past their deadline whose reduce was never claimed
+    """
+    now = now if now is not None else time.time()
+    scan_kwargs = {
+        "TableName": RUNS_TABLE,
+        "FilterExpression": OVERDUE_FILTER,
+        "ExpressionAttributeNames": {"#deadline": "deadline"},
+        "ExpressionAttributeValues": {":now": {"N": str(now)}},
+        "ProjectionExpression": "run_id",
+    }
+    run_ids = []
+    while True:
+        response = dynamodb.scan(**scan_kwargs)
+        run_ids.extend(item["run_id"]["S"] for item in response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            return run_ids
+        scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def _invoke_reduce(lambda_client, reducer_function: str, run_id: str):
+    lambda_client.invoke(
+        FunctionName=reducer_function,
+        InvocationType="Event",
+        Payload=json.dumps({"reduce_run_id": run_id}),
+    )
+
+
+def sweep_overdue_runs(dynamodb, lambda_client, reducer_function: str, now: Optional[float] = None) -> List[str]:
+    """
+    Claim and trigger the reduce of every overdue run, returns the run ids triggered
+    """
+    triggered = []
+    for run_id in overdue_runs(dynamodb, now):
+        if claim_reduce(dynamodb, run_id):
+            print(f"run {run_id} is past its deadline, reducing it with the groups that reported")
+            _invoke_reduce(lambda_client, reducer_function, run_id)
+            triggered.append(run_id)
+    return triggered
+
+
+def wait_for_completions(
+    s3_client,
+    dynamodb,
+    run_id: str,
+    group_count: int,
+    seconds_left: Callable[[], float],
+    reserve_secs: float,
+    poll_secs: float = ASYNC_POLL_SECS,
+) -> Dict[int, Dict]:
+    """
+    Poll the run's completed count until every group has reported or seconds_left() drops under reserve_secs,
+    then download the completion records
+    """
+    while True:
+        reported = completed_count(dynamodb, run_id)
+        if reported >= group_count:
+            break
+        if seconds_left() - poll_secs < reserve_secs:
+            print(f"run {run_id}: {reported}/{group_count} groups reported, out of time to keep polling")
+            break
+        time.sleep(poll_secs)
+    return list_completions(s3_client, run_id)
+
+
+def complete_worker(
+    s3_client,
+    dynamodb,
+    lambda_client,
+    run_id: str,
+    worker_id,
+    record: Dict,
+    group_count: int,
+    reducer_function: str,
+) -> bool:
+    """
+    Worker side: record completion, and if this was the last group to report, trigger the reducer.
+    Returns True if this worker triggered it.
+    """
+    # the record goes first, the reducer must find it once the count says it is there
+    write_completion(s3_client, run_id, worker_id, record)
+    reported = record_completion(dynamodb, run_id, worker_id)
+    print(f"run {run_id}: {reported}/{group_count} groups reported")
+    if reported < group_count or not claim_reduce(dynamodb, run_id):
+        return False
+    _invoke_reduce(lambda_client, reducer_function, run_id)
+    return True
+
+
+class LocalS3:
+    """
+    In memory stand-in for the S3 calls used by async runs and the reports they reduce into.
+    ETags and conditional GETs behave like S3's, so s3_cache works against it.
+    """
+
+    def __init__(self):
+        self.objects: Dict[tuple, bytes] = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _etag(body: bytes) -> str:
+        return f'"{hashlib.md5(body).hexdigest()}"'
+
+    def put_object(self, Bucket: str, Key: str, Body, **kwargs):
+        with self.lock:
+            self.objects[(Bucket, Key)] = Body if isinstance(Body, bytes) else Body.encode("utf-8")
+        return {}
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, ExtraArgs: Optional[Dict] = None):
+        with open(Filename, "rb") as fp:
+            self.put_object(Bucket=Bucket, Key=Key, Body=fp.read())
+
+    def get_object(self, Bucket: str, Key: str, IfNoneMatch: Optional[str] = None, **kwargs):
+        with self.lock:
+            if (Bucket, Key) not in self.objects:
+                raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+            body = self.objects[(Bucket, Key)]
+        etag = self._etag(body)
+        if IfNoneMatch is not None and IfNoneMatch == etag:
+            raise ClientError({"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304}}, "GetObject")
+        return {"Body": io.BytesIO(body), "ETag": etag, "ContentLength": len(body)}
+
+    def head_object(self, Bucket: str, Key: str, **kwargs):
+        with self.lock:
+            if (Bucket, Key) not in self.objects:
+                raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+            body = self.objects[(Bucket, Key)]
+        return {"ETag": self._etag(body), "ContentLength": len(body)}
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs):
+        with self.lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", StartAfter: str = "", **kwargs):
+        with self.lock:
+            keys = sorted(
+                key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix) and key > StartAfter
+            )
+        return {"Contents": [{"Key": key} for key in keys], "IsTruncated": False}
+
+
+class LocalDynamoDB:
+    """
+    In memory stand-in for the DynamoDB calls made above, it only understands this module's expressions
+    """
+
+    def __init__(self):
+        self.items: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def put_item(self, TableName: str, Item: Dict, **kwargs):
+        with self.lock:
+            self.items[Item["run_id"]["S"]] = dict(Item)
+        return {}
+
+    def get_item(self, TableName: str, Key: Dict, **kwargs):
+        with self.lock:
+            item = self.items.get(Key["run_id"]["S"])
+            return {"Item": dict(item)} if item is not None else {}
+
+    def update_item(
+        self,
+        TableName: str,
+        Key: Dict,
+        UpdateExpression: str,
+        ExpressionAttributeValues: Dict,
+        ConditionExpression: Optional[str] = None,
+        **kwargs,
+    ):
+        with self.lock:
+            item = self.items.setdefault(Key["run_id"]["S"], dict(Key))
+            item.setdefault("expires_at", ExpressionAttributeValues[":expires_at"])
+            if UpdateExpression == COMPLETION_UPDATE:
+                workers = set(item.get("completed_workers", {}).get("SS", []))
+                workers.update(ExpressionAttributeValues[":worker"]["SS"])
+                item["completed_workers"] = {"SS": sorted(workers)}
+                return {"Attributes": {"completed_workers": item["completed_workers"]}}
+            if UpdateExpression == CLAIM_UPDATE and ConditionExpression == CLAIM_CONDITION:
+                if "reduce_claimed_at" in item:
+                    raise ClientError({"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem")
+                item["reduce_claimed_at"] = ExpressionAttributeValues[":now"]
+                return {}
+        raise ValueError(f"LocalDynamoDB doesn't support {UpdateExpression}")
+
+    def scan(self, TableName: str, FilterExpression: str, ExpressionAttributeValues: Dict, **kwargs):
+        if FilterExpression != OVERDUE_FILTER:
+            raise ValueError(f"LocalDynamoDB doesn't support {FilterExpression}")
+        now = float(ExpressionAttributeValues[":now"]["N"])
+        with self.lock:
+            items = [
+                {"run_id": item["run_id"]}
+                for item in self.items.values()
+                if "reduce_claimed_at" not in item and "deadline" in item and float(item["deadline"]["N"]) < now
+            ]
+        return {"Items": items}
+
+
+class _LocalContext:
+    def __init__(self, function_name: str, request_id: str, timeout_secs: float):
+        self.invoked_function_arn = function_name
+        self.aws_request_id = request_id
+        self.deadline = time.time() + timeout_secs
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int(max(0.0, self.deadline - time.time()) * 1000)
+
+
+class LocalLambda:
+    """
+    In process stand-in for lambda_client.invoke, Event invokes run on a background thread
+    """
+
+    def __init__(self, timeout_secs: float = 900.0):
+        self.handlers: Dict[str, Callable] = {}
+        self.threads = []
+        self.timeout_secs = timeout_secs
+        self.invocations = 0
+
+    def register(self, function_name: str, handler: Callable):
+        self.handlers[function_name] = handler
+
+    def invoke(self, FunctionName: str, InvocationType: str = "RequestResponse", Payload: str = "{}"):
+        self.invocations += 1
+        handler = self.handlers[FunctionName]
+        context = _LocalContext(FunctionName, f"local{self.invocations:08d}", self.timeout_secs)
+        event = json.loads(Payload)
+        if InvocationType == "Event":
+            thread = threading.Thread(target=handler, args=(event, context))
+            thread.start()
+            self.threads.append(thread)
+            return {"StatusCode": 202}
+        result = handler(event, context)
+        return {"StatusCode": 200, "Payload": io.BytesIO(json.dumps(result).encode("utf-8"))}
+
+    def join(self):
+        # handlers can invoke more handlers, wait until nothing is left running
+        while self.threads:
+            self.threads.pop(0).join()
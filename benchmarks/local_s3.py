@@ -0,0 +1,115 @@
+"""
+S3 stand-in backed by a directory, for benchmarks.
+
+Objects are files under root (key = relative path), writes go to write_root so a benchmark never changes its data
+set. ETags and conditional GETs behave like S3's, so s3_cache revalidates instead of downloading, and the bytes
+moved each way are counted.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+from typing import Dict, Optional
+
+from botocore.exceptions import ClientError
+
+
+class DirectoryS3:
+    def __init__(self, root: str, write_root: str):
+        self.root = root
+        self.write_root = write_root
+        self.lock = threading.Lock()
+        self.etags: Dict[str, tuple] = {}
+        self.reset_counters()
+
+    def reset_counters(self):
+        with self.lock:
+            self.counters = {
+                "get_requests": 0,
+                "not_modified": 0,
+                "put_requests": 0,
+                "bytes_downloaded": 0,
+                "bytes_uploaded": 0,
+            }
+
+    def _count(self, **increments):
+        with self.lock:
+            for name, increment in increments.items():
+                self.counters[name] += increment
+
+    def _path(self, key: str) -> Optional[str]:
+        for root in (self.write_root, self.root):
+            path = os.path.join(root, key)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def _etag(self, path: str) -> str:
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.etags.get(path)
+        if cached is not None and cached[0] == (stat.st_size, stat.st_mtime_ns):
+            return cached[1]
+        digest = hashlib.md5()
+        with open(path, "rb") as fp:
+            for chunk in iter(lambda: fp.read(1 << 20), b""):
+                digest.update(chunk)
+        etag = f'"{digest.hexdigest()}"'
+        with self.lock:
+            self.etags[path] = ((stat.st_size, stat.st_mtime_ns), etag)
+        return etag
+
+    def get_object(self, Bucket: str, Key: str, IfNoneMatch: Optional[str] = None, **kwargs):
+        path = self._path(Key)
+        if path is None:
+            self._count(get_requests=1)
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        etag = self._etag(path)
+        if IfNoneMatch is not None and IfNoneMatch == etag:
+            self._count(get_requests=1, not_modified=1)
+            raise ClientError(
+                {"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304}}, "GetObject"
+            )
+        size = os.path.getsize(path)
+        self._count(get_requests=1, bytes_downloaded=size)
+        return {"Body": open(path, "rb"), "ETag": etag, "ContentLength": size}
+
+    def head_object(self, Bucket: str, Key: str, **kwargs):
+        path = self._path(Key)
+        if path is None:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ETag": self._etag(path), "ContentLength": os.path.getsize(path)}
+
+    def download_file(self, Bucket: str, Key: str, Filename: str, **kwargs):
+        response = self.get_object(Bucket, Key)
+        with response["Body"] as body, open(Filename, "wb") as fp:
+            shutil.copyfileobj(body, fp)
+
+    def _write_path(self, key: str) -> str:
+        path = os.path.join(self.write_root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def put_object(self, Bucket: str, Key: str, Body, IfNoneMatch: Optional[str] = None, **kwargs):
+        if IfNoneMatch == "*" and self._path(Key) is not None:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "PutObject")
+        data = Body if isinstance(Body, bytes) else Body.encode("utf-8") if isinstance(Body, str) else Body.read()
+        with open(self._write_path(Key), "wb") as fp:
+            fp.write(data)
+        self._count(put_requests=1, bytes_uploaded=len(data))
+        return {}
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, **kwargs):
+        shutil.copyfile(Filename, self._write_path(Key))
+        self._count(put_requests=1, bytes_uploaded=os.path.getsize(Filename))
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = "", **kwargs):
+        keys = set()
+        for root in (self.root, self.write_root):
+            for dir_path, _, files in os.walk(root):
+                for file_name in files:
+                    key = os.path.relpath(os.path.join(dir_path, file_name), root)
+                    if key.startswith(Prefix):
+                        keys.add(key)
+        return {"Contents": [{"Key": key} for key in sorted(keys)], "IsTruncated": False}
@@ -0,0 +1,257 @@
+"""
+Offline benchmarks for the report join paths.
+
+Generates a synthetic data set (see synthetic_reports.py), serves it from a directory backed S3 stand-in and runs each
+join path in its own process, recording wall time, peak RSS and the bytes moved to and from S3.
+
+    python benchmarks/run_benchmarks.py [--tokens 2000] [--days 30] [--workers 40] [--seed 0]
+                                        [--cases join_reports,monthly_script] [--warm] [--no-save]
+
+Results are saved to benchmarks/results/{commit}.json and compared with the latest earlier commit that has results
+for the same parameters, differences past REGRESSION_THRESHOLD are flagged.
+"""
+
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+sys.path.append(REPO_ROOT)
+sys.path.append(BENCHMARK_DIR)
+
+from synthetic_reports import dataset_key, write_dataset
+
+DATA_DIR = os.path.join(BENCHMARK_DIR, ".data")
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, "results")
+# fixed so a data set is the same on every run
+END_DATE = date(2024, 1, 31)
+REGRESSION_THRESHOLD = 0.10
+COMPARED_METRICS = ("wall_secs", "peak_rss_mb", "bytes_downloaded", "bytes_uploaded")
+
+
+def _daily_paths(num_days: int) -> List[str]:
+    days = [END_DATE - timedelta(days=i) for i in range(num_days)]
+    return [f"s3://coincommit/reports/{day:%Y-%m-%d}/{day:%Y-%m-%d}.json" for day in reversed(days)]
+
+
+def _patch_orchestrator(s3):
+    import orchestrator_lambda
+
+    orchestrator_lambda._report_fetch_client = lambda: s3
+    return orchestrator_lambda
+
+
+def _patch_script(module_name: str, s3):
+    import importlib
+
+    script = importlib.import_module(f"scripts.{module_name}")
+    script.boto3 = types.SimpleNamespace(client=lambda *args, **kwargs: s3)
+    return script
+
+
+def case_join_worker_reports(s3, params):
+    orchestrator_lambda = _patch_orchestrator(s3)
+    results = [
+        json.dumps(
+            {
+                "worker_id": worker_id,
+                "worker_duration_secs": 60,
+                "report_path": f"s3://coincommit/workers/{END_DATE:%Y-%m-%d}/worker_{worker_id}.json",
+            }
+        ).encode("utf-8")
+        for worker_id in range(params["workers"])
+    ]
+    return lambda: orchestrator_lambda.join_worker_reports(results, datetime.combine(END_DATE, datetime.min.time()))
+
+
+def case_join_reports(s3, params):
+    orchestrator_lambda = _patch_orchestrator(s3)
+    paths = _daily_paths(params["days"])
+    return lambda: orchestrator_lambda.join_reports(paths, f"{END_DATE:%Y-%m-%d}", "bench_window", with_state=True)
+
+
+def case_join_reports_sketch(s3, params):
+    orchestrator_lambda = _patch_orchestrator(s3)
+    paths = _daily_paths(params["days"])
+    return lambda: orchestrator_lambda.join_reports(paths, f"{END_DATE:%Y-%m-%d}", "bench_window", sketch_mode=True)
+
+
+def case_join_reports_streaming(s3, params):
+    orchestrator_lambda = _patch_orchestrator(s3)
+    paths = _daily_paths(params["days"])
+    return lambda: orchestrator_lambda.join_reports_streaming(
+        paths, f"{END_DATE:%Y-%m-%d}", "bench_window", memory_budget_mb=64, with_state=True
+    )
+
+
+def case_weekly_script(s3, params):
+    script = _patch_script("create_weekly_reports", s3)
+    return lambda: script.download_combine_weekly_json_files(datetime.combine(END_DATE, datetime.min.time()))
+
+
+def case_monthly_script(s3, params):
+    script = _patch_script("create_monthly_reports", s3)
+    return lambda: script.download_combine_monthly_json_files(datetime.combine(END_DATE, datetime.min.time()))
+
+
+def case_monthly_script_streaming(s3, params):
+    script = _patch_script("create_monthly_reports", s3)
+    return lambda: script.download_combine_monthly_json_files(
+        datetime.combine(END_DATE, datetime.min.time()), memory_budget_mb=64
+    )
+
+
+CASES = {
+    "join_worker_reports": case_join_worker_reports,
+    "join_reports": case_join_reports,
+    "join_reports_sketch": case_join_reports_sketch,
+    "join_reports_streaming": case_join_reports_streaming,
+    "weekly_script": case_weekly_script,
+    "monthly_script": case_monthly_script,
+    "monthly_script_streaming": case_monthly_script_streaming,
+}
+
+
+def _peak_rss_mb() -> float:
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_case(case: str, data_dir: str, params: Dict, warm: bool) -> Dict:
+    """
+    Run one case in this process, the caller gives each case a fresh process so peak RSS is its own
+    """
+    from local_s3 import DirectoryS3
+
+    write_root = tempfile.mkdtemp(prefix="bench_s3_")
+    s3 = DirectoryS3(data_dir, write_root)
+    run = CASES[case](s3, params)
+    if warm:
+        # fills the report cache, the measured run then revalidates instead of downloading
+        run()
+        s3.reset_counters()
+
+    baseline_rss_mb = _peak_rss_mb()
+    start = time.perf_counter()
+    run()
+    wall_secs = time.perf_counter() - start
+    shutil.rmtree(write_root)
+    return dict(
+        case=case,
+        wall_secs=round(wall_secs, 3),
+        peak_rss_mb=round(_peak_rss_mb(), 1),
+        baseline_rss_mb=round(baseline_rss_mb, 1),
+        **s3.counters,
+    )
+
+
+def _git(*args: str) -> str:
+    return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True).stdout.strip()
+
+
+def _previous_results(commit: str, params: Dict) -> Optional[Dict]:
+    for earlier_commit in _git("rev-list", "--max-count=200", "HEAD").split():
+        if earlier_commit == commit:
+            continue
+        path = os.path.join(RESULTS_DIR, f"{earlier_commit}.json")
+        if os.path.exists(path):
+            with open(path, "r") as fp:
+                saved = json.load(fp)
+            if saved["params"] == params:
+                return saved
+    return None
+
+
+def compare(results: List[Dict], previous: Dict):
+    print(f"\ncompared with {previous['commit'][:10]}:")
+    previous_by_case = {result["case"]: result for result in previous["results"]}
+    for result in results:
+        if result["case"] not in previous_by_case:
+            continue
+        changes = []
+        for metric in COMPARED_METRICS:
+            before = previous_by_case[result["case"]][metric]
+            after = result[metric]
+            if before == 0:
+                continue
+            change = (after - before) / before
+            flag = " REGRESSION" if change > REGRESSION_THRESHOLD else ""
+            changes.append(f"{metric} {change:+.1%}{flag}")
+        print(f"  {result['case']:<28} {', '.join(changes)}")
+
+
+if __name__ == "__main__":
+    params = {
+        "tokens": int(sys.argv[sys.argv.index("--tokens") + 1]) if "--tokens" in sys.argv else 2000,
+        "days": int(sys.argv[sys.argv.index("--days") + 1]) if "--days" in sys.argv else 30,
+        "workers": int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else 40,
+        "seed": int(sys.argv[sys.argv.index("--seed") + 1]) if "--seed" in sys.argv else 0,
+        "warm": "--warm" in sys.argv,
+    }
+    data_dir = os.path.join(DATA_DIR, dataset_key(params["tokens"], params["days"], params["workers"], params["seed"]))
+
+    if "--child" in sys.argv:
+        case = sys.argv[sys.argv.index("--child") + 1]
+        result = run_case(case, data_dir, params, params["warm"])
+        print("BENCHMARK_RESULT " + json.dumps(result))
+        sys.exit(0)
+
+    if not os.path.isdir(data_dir):
+        partial_dir = data_dir + ".partial"
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        write_dataset(partial_dir, params["tokens"], params["days"], params["workers"], END_DATE, seed=params["seed"])
+        os.rename(partial_dir, data_dir)
+
+    cases = sys.argv[sys.argv.index("--cases") + 1].split(",") if "--cases" in sys.argv else list(CASES)
+    results = []
+    for case in cases:
+        with tempfile.TemporaryDirectory(prefix="bench_cache_") as cache_dir:
+            # a cache per case, cold unless --warm
+            env = dict(os.environ, S3_CACHE_DIR=cache_dir + "/")
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", case, *sys.argv[1:]],
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+        lines = [line for line in output.stdout.splitlines() if line.startswith("BENCHMARK_RESULT ")]
+        if output.returncode != 0 or len(lines) == 0:
+            print(f"{case} failed:\n{output.stderr[-3000:]}")
+            continue
+        result = json.loads(lines[-1][len("BENCHMARK_RESULT ") :])
+        results.append(result)
+        print(
+            f"{case:<28} {result['wall_secs']:>8.2f}s {result['peak_rss_mb']:>8.1f}mb peak rss "
+            f"{result['bytes_downloaded'] / (1 << 20):>8.1f}mb down {result['bytes_uploaded'] / (1 << 20):>8.1f}mb up"
+        )
+
+    commit = _git("rev-parse", "HEAD")
+    previous = _previous_results(commit, params)
+    if previous is not None:
+        compare(results, previous)
+
+    if "--no-save" not in sys.argv:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        results_path = os.path.join(RESULTS_DIR, f"{commit}.json")
+        with open(results_path, "w") as fp:
+            json.dump(
+                {
+                    "commit": commit,
+                    "dirty": _git("status", "--porcelain", "--untracked-files=no") != "",
+                    "created_at": datetime.utcnow().isoformat(),
+                    "params": params,
+                    "results": results,
+                },
+                fp,
+                indent=2,
+            )
+        print(f"saved results to {results_path}")
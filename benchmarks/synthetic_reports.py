@@ -0,0 +1,156 @@
+"""
+Synthetic worker and daily reports with production-like skew.
+
+Token activity, commits per token and commits per author all fall off with rank like a Zipf distribution: a handful
+of tokens have commits every day and most of the commits, most tokens show up now and then with a few, and a few
+authors make most of a token's commits. Generation is seeded, the same parameters always give the same reports.
+"""
+
+import json
+import os
+import random
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+EXTENSIONS = [".py", ".js", ".ts", ".go", ".rs", ".md", ".json", ".sol", ".c", ".cpp", ".yml", ".sh", ".java", ".rb"]
+EXTENSION_WEIGHTS = [30, 20, 12, 8, 7, 6, 5, 4, 3, 2, 2, 1, 1, 1]
+VERBS = ["fix", "add", "update", "remove", "refactor", "bump", "merge", "revert", "improve", "document"]
+NOUNS = ["parser", "wallet", "rpc", "consensus", "tests", "deps", "docs", "cli", "p2p", "mempool", "ci", "api"]
+# commits of one token on one day are capped, the largest tokens see a few hundred
+MAX_DAILY_COMMITS = 1500
+
+
+def _zipf_weights(n: int, exponent: float) -> List[float]:
+    return [1.0 / (rank + 1) ** exponent for rank in range(n)]
+
+
+class SyntheticCorpus:
+    def __init__(
+        self,
+        num_tokens: int,
+        seed: int = 0,
+        repos_per_token: int = 6,
+        authors_per_token: int = 80,
+        mean_daily_commits: float = 12.0,
+    ):
+        self.seed = seed
+        self.mean_daily_commits = mean_daily_commits
+        rng = random.Random(seed)
+        self.tokens = [f"TKN{rank}" for rank in range(num_tokens)]
+        self.repos = {}
+        self.authors = {}
+        self.methods = {}
+        for rank, token in enumerate(self.tokens):
+            # bigger projects have more repos and contributors
+            scale = max(1, int(10 / (rank + 1) ** 0.3))
+            self.repos[token] = [
+                f"https://github.com/{token.lower()}-org/repo{i}" for i in range(max(1, repos_per_token * scale // 4))
+            ]
+            self.authors[token] = [
+                f"dev{rng.randrange(10 ** 6)}@{token.lower()}.dev" for _ in range(authors_per_token * scale // 2 + 1)
+            ]
+            self.methods[token] = [f"{rng.choice(NOUNS)}_{rng.choice(VERBS)}_{i}" for i in range(200)]
+
+    def _day_commits(self, day_index: int) -> Dict[Tuple[str, str], List[Dict]]:
+        """
+        (token, repo) -> commits made on the day
+        """
+        rng = random.Random(self.seed * 100003 + day_index)
+        commits = defaultdict(list)
+        for rank, token in enumerate(self.tokens):
+            if rng.random() > min(1.0, 1.5 / (rank + 1) ** 0.35):
+                continue
+            num_commits = min(
+                MAX_DAILY_COMMITS,
+                max(1, int(rng.paretovariate(1.5) * self.mean_daily_commits * 4 / (rank + 1) ** 0.5)),
+            )
+            authors = self.authors[token]
+            author_weights = _zipf_weights(len(authors), 1.2)
+            repos = self.repos[token]
+            repo_weights = _zipf_weights(len(repos), 1.0)
+            for _ in range(num_commits):
+                repo = rng.choices(repos, repo_weights)[0]
+                sha = "%040x" % rng.getrandbits(160)
+                extension = rng.choices(EXTENSIONS, EXTENSION_WEIGHTS)[0]
+                insertions = int(rng.paretovariate(1.2) * 10)
+                deletions = int(rng.paretovariate(1.4) * 5)
+                commits[(token, repo)].append(
+                    {
+                        "sha": sha,
+                        "author": rng.choices(authors, author_weights)[0],
+                        "message": f"{rng.choice(VERBS)} {rng.choice(NOUNS)} ({sha[:7]})",
+                        "methods": rng.sample(self.methods[token], rng.randint(0, 4)),
+                        "extension": extension,
+                        "insertions": insertions,
+                        "deletions": deletions,
+                    }
+                )
+        return commits
+
+    def _report(self, slices: List[Tuple[str, str, List[Dict]]]) -> Dict:
+        by_token = defaultdict(list)
+        for token, repo, commits in slices:
+            by_token[token].append((repo, commits))
+
+        report = {}
+        for token, repo_commits in by_token.items():
+            commits = [commit for _, repo_slice in repo_commits for commit in repo_slice]
+            file_extensions = defaultdict(int)
+            loc_changes = {"insertions": defaultdict(int), "deletions": defaultdict(int), "net": defaultdict(int)}
+            for commit in commits:
+                file_extensions[commit["extension"]] += 1
+                loc_changes["insertions"][commit["extension"]] += commit["insertions"]
+                loc_changes["deletions"][commit["extension"]] += commit["deletions"]
+                loc_changes["net"][commit["extension"]] += commit["insertions"] - commit["deletions"]
+            report[token] = {
+                "commit_count": len(commits),
+                "lines_of_code": sum(commit["insertions"] - commit["deletions"] for commit in commits),
+                "commit_messages": [commit["message"] for commit in commits],
+                "distinct_authors": sorted({commit["author"] for commit in commits}),
+                "commit_urls": [
+                    f"{repo}/commit/{commit['sha']}" for repo, repo_slice in repo_commits for commit in repo_slice
+                ],
+                "changed_methods": sorted({method for commit in commits for method in commit["methods"]}),
+                "active_repos": sorted({repo for repo, _ in repo_commits}),
+                "file_extensions": dict(file_extensions),
+                "loc_changes_by_filetype": {action: dict(counts) for action, counts in loc_changes.items()},
+                "description": f"{token} is a synthetic token",
+                "project_created_cmc": "2021-01-01",
+            }
+        return report
+
+    def day_reports(self, day_index: int, num_workers: int) -> Tuple[Dict, List[Dict]]:
+        """
+        The daily report and the worker reports it is joined from, repos are spread over workers by hash
+        """
+        slices = [(token, repo, commits) for (token, repo), commits in self._day_commits(day_index).items()]
+        worker_slices = defaultdict(list)
+        for token, repo, commits in slices:
+            worker_slices[sum(map(ord, repo)) % num_workers].append((token, repo, commits))
+        return self._report(slices), [self._report(worker_slices[worker_id]) for worker_id in range(num_workers)]
+
+
+def dataset_key(num_tokens: int, num_days: int, num_workers: int, seed: int) -> str:
+    return f"t{num_tokens}_d{num_days}_w{num_workers}_s{seed}"
+
+
+def write_dataset(root: str, num_tokens: int, num_days: int, num_workers: int, end_date: date, seed: int = 0):
+    """
+    Write num_days of daily reports ending on end_date, laid out as in the coincommit bucket, plus the worker
+    reports of end_date under workers/{date}/
+    """
+    corpus = SyntheticCorpus(num_tokens, seed=seed)
+    for day_index in range(num_days):
+        day = end_date - timedelta(days=num_days - 1 - day_index)
+        date_str = day.strftime("%Y-%m-%d")
+        daily_report, worker_reports = corpus.day_reports(day_index, num_workers)
+        os.makedirs(os.path.join(root, "reports", date_str), exist_ok=True)
+        with open(os.path.join(root, "reports", date_str, f"{date_str}.json"), "w") as fp:
+            json.dump(daily_report, fp, indent=2)
+        if day == end_date:
+            os.makedirs(os.path.join(root, "workers", date_str), exist_ok=True)
+            for worker_id, worker_report in enumerate(worker_reports):
+                with open(os.path.join(root, "workers", date_str, f"worker_{worker_id}.json"), "w") as fp:
+                    json.dump(worker_report, fp)
+        print(f"generated {date_str}: {len(daily_report)} tokens")
@@ -0,0 +1,238 @@
+"""
+Memory bounded report merging.
+
+Reports are parsed one token at a time straight off the download stream, and partial aggregates are spilled to
+hash partitioned files under /tmp once they grow past a memory budget. The final pass merges one partition at a
+time and streams the output, so only about 1/partitions of the result is ever held in memory.
+"""
+
+import codecs
+import json
+import os
+import shutil
+import threading
+import zlib
+from typing import Dict, Iterator, Tuple
+
+from report_aggregation import SET_FIELDS, TokenStats
+from string_table import ENCODING_NAMES, decode_token, intern_strings
+
+STREAM_CHUNK_SIZE = 1 << 16
+SPILL_PARTITIONS = 16
+# rough per-token cost of the numeric fields and dict overhead, on top of the strings themselves
+TOKEN_OVERHEAD_BYTES = 2048
+
+
+class _StreamingObjectReader:
+    """
+    Incremental reader for a JSON object, values are parsed one at a time as the stream is read
+    """
+
+    def __init__(self, stream, chunk_size: int = STREAM_CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, min_size: int = 0) -> bool:
+        if self.eof:
+            return False
+        if self.pos > 0:
+            self.buffer = self.buffer[self.pos :]
+            self.pos = 0
+        target = max(len(self.buffer) + 1, min_size)
+        while len(self.buffer) < target:
+            chunk = self.stream.read(self.chunk_size)
+            if not chunk:
+                self.buffer += self.utf8.decode(b"", final=True)
+                self.eof = True
+                break
+            self.buffer += self.utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in " \t\n\r":
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                raise ValueError("unexpected end of report stream")
+
+    def _expect(self, char: str):
+        if self._peek() != char:
+            raise ValueError(f"expected {char!r} at report stream offset {self.pos}")
+        self.pos += 1
+
+    def read_value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number that ends the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # grow geometrically so a large value isn't re-parsed once per chunk
+            self._fill(min_size=2 * (len(self.buffer) - self.pos))
+
+    def items(self) -> Iterator[str]:
+        """
+        Yield the keys of the object at the current position, the caller must read each value before moving on
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.read_value()
+            self._expect(":")
+            yield key
+            if self._peek() == ",":
+                self.pos += 1
+                continue
+            self._expect("}")
+            return
+
+
+def iter_report_tokens(stream, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[Tuple[str, Dict]]:
+    """
+    Yield (token_name, token_data) from a report stream without loading the whole report.
+    Handles plain and string dictionary encoded reports, for the latter only the string table is held in memory.
+    """
+    reader = _StreamingObjectReader(stream, chunk_size)
+    strings = None
+    encoded = False
+    for key in reader.items():
+        if key == "__encoding__":
+            encoded = reader.read_value() in ENCODING_NAMES
+        elif encoded and key == "__strings__":
+            strings = intern_strings(reader.read_value())
+        elif encoded and key == "tokens":
+            for token_name in reader.items():
+                yield token_name, decode_token(reader.read_value(), strings)
+        else:
+            yield key, reader.read_value()
+
+
+def _estimate_size(token_data: Dict) -> int:
+    size = TOKEN_OVERHEAD_BYTES
+    for field in SET_FIELDS:
+        for value in token_data.get(field, []):
+            size += len(value) + 64
+    return size
+
+
+class SpillingAggregator:
+    """
+    Token aggregate that spills to hash partitioned files under spill_dir once memory_budget_bytes is exceeded
+    """
+
+    def __init__(
+        self, memory_budget_bytes: int, spill_dir: str = "/tmp/merge_spill/", partitions: int = SPILL_PARTITIONS
+    ):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.spill_dir = spill_dir
+        self.partitions = partitions
+        self.aggregate: Dict[str, TokenStats] = {}
+        self.estimated_bytes = 0
+        self.spills = 0
+        self.lock = threading.Lock()
+
+        if os.path.exists(spill_dir):
+            shutil.rmtree(spill_dir)
+        os.makedirs(spill_dir, exist_ok=True)
+
+    def _partition_path(self, partition: int) -> str:
+        return os.path.join(self.spill_dir, f"partition_{partition}.jsonl")
+
+    def add(self, token_name: str, token_data: Dict):
+        token_stats = TokenStats.from_token_data(token_data)
+        with self.lock:
+            if token_name in self.aggregate:
+                self.aggregate[token_name].merge(token_stats)
+            else:
+                self.aggregate[token_name] = token_stats
+            self.estimated_bytes += _estimate_size(token_data)
+            if self.estimated_bytes > self.memory_budget_bytes:
+                self._spill()
+
+    def _spill(self):
+        files = {}
+        try:
+            for token_name, token_stats in self.aggregate.items():
+                partition = zlib.crc32(token_name.encode("utf-8")) % self.partitions
+                if partition not in files:
+                    files[partition] = open(self._partition_path(partition), "a")
+                files[partition].write(json.dumps([token_name, token_stats.to_state()]) + "\n")
+        finally:
+            for fp in files.values():
+                fp.close()
+        print(f"spilled {len(self.aggregate)} tokens, ~{self.estimated_bytes // (1 << 20)}mb, to {self.spill_dir}")
+        self.aggregate = {}
+        self.estimated_bytes = 0
+        self.spills += 1
+
+    def iter_merged(self) -> Iterator[Tuple[str, TokenStats]]:
+        """
+        Final merge pass, yields every token exactly once. Only one partition is loaded at a time.
+        """
+        if self.spills == 0:
+            yield from self.aggregate.items()
+            return
+
+        self._spill()
+        for partition in range(self.partitions):
+            path = self._partition_path(partition)
+            if not os.path.exists(path):
+                continue
+            merged: Dict[str, TokenStats] = {}
+            with open(path, "r") as fp:
+                for line in fp:
+                    token_name, token_state = json.loads(line)
+                    token_stats = TokenStats.from_state(token_state)
+                    if token_name in merged:
+                        merged[token_name].merge(token_stats)
+                    else:
+                        merged[token_name] = token_stats
+            os.remove(path)
+            yield from merged.items()
+
+    def cleanup(self):
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+def write_report_stream(fp, items: Iterator[Tuple[str, TokenStats]], state_fp=None):
+    """
+    Write merged tokens out as a report one token at a time, and optionally the window state next to it
+    """
+    fp.write("{")
+    if state_fp is not None:
+        state_fp.write("{")
+    for i, (token_name, token_stats) in enumerate(items):
+        separator = "," if i > 0 else ""
+        fp.write(f"{separator}\n{json.dumps(token_name)}: {json.dumps(token_stats.to_token_data())}")
+        if state_fp is not None:
+            state_fp.write(f"{separator}{json.dumps(token_name)}: {json.dumps(token_stats.to_state())}")
+    fp.write("\n}")
+    if state_fp is not None:
+        state_fp.write("}")
+
+
+def stream_merge_reports(
+    streams: Iterator, memory_budget_bytes: int, spill_dir: str = "/tmp/merge_spill/"
+) -> SpillingAggregator:
+    """
+    Merge report streams (anything with read()) token by token into a spilling aggregate
+    """
+    aggregator = SpillingAggregator(memory_budget_bytes, spill_dir=spill_dir)
+    for stream in streams:
+        for token_name, token_data in iter_report_tokens(stream):
+            aggregator.add(token_name, token_data)
+    return aggregator
@@ -0,0 +1,220 @@
+"""
+Warm container git clone cache for the worker.
+
+Every repo a worker is responsible for is kept as a bare, blobless (--filter=blob:none) clone of its branches under
+/tmp/git_mirrors/, which survives across warm invocations and is brought up to date with an incremental fetch.
+A global gitconfig with url.<mirror>.insteadOf points the scraper's own clones at the local mirror over file://,
+and the mirror fetches the blobs a clone asks for from GitHub on demand, so after the first scrape a clone is a
+local copy plus whatever is new. Pull request and other non branch refs are never fetched.
+
+The mirror budget and the free space kept on /tmp are derived from the size of /tmp unless set explicitly. Least
+recently used mirrors are evicted to make room before cloning, and again at cleanup.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+GIT_MIRROR_DIR = os.environ.get("GIT_MIRROR_DIR", "/tmp/git_mirrors/")
+GIT_HOME_DIR = "/tmp/git_home/"
+# size budget for the mirrors, and free space to leave on /tmp for the scrape itself. Either defaults to a share of
+# /tmp (512mb unless the function's ephemeral storage is raised)
+GIT_MIRROR_CACHE_MB = float(os.environ["GIT_MIRROR_CACHE_MB"]) if "GIT_MIRROR_CACHE_MB" in os.environ else None
+TMP_MIN_FREE_MB = float(os.environ["TMP_MIN_FREE_MB"]) if "TMP_MIN_FREE_MB" in os.environ else None
+GIT_MIRROR_CACHE_SHARE = 0.5
+TMP_MIN_FREE_SHARE = 0.25
+# branches only, a --mirror clone also drags in every refs/pull/* ref GitHub keeps
+HEADS_REFSPEC = "+refs/heads/*:refs/heads/*"
+# a mirror's origin url, rewritten to the real url by the mirror's own config. The blobs a clone asks for are fetched
+# by a git that has the global gitconfig, and the real url would be rewritten to the mirror
+MIRROR_ORIGIN_ALIAS = "mirror-origin:"
+GIT_FETCH_CONCURRENCY = 8
+GIT_FETCH_TIMEOUT_SECS = 300
+
+
+def _dir_size(path: str) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            if not os.path.islink(file_path):
+                size += os.path.getsize(file_path)
+    return size
+
+
+def _git(*args: str):
+    # without the global gitconfig, its insteadOf rules would point a mirror's fetch at the mirror itself
+    env = {**os.environ, "GIT_CONFIG_GLOBAL": os.devnull}
+    subprocess.run(["git", *args], check=True, capture_output=True, timeout=GIT_FETCH_TIMEOUT_SECS, env=env)
+
+
+def tmp_limits(tmp_dir: str = "/tmp") -> Tuple[int, int]:
+    """
+    (mirror budget, free space to keep) in bytes for the /tmp at tmp_dir
+    """
+    total = shutil.disk_usage(tmp_dir).total
+    min_free = int(TMP_MIN_FREE_MB * (1 << 20)) if TMP_MIN_FREE_MB is not None else int(total * TMP_MIN_FREE_SHARE)
+    budget = int(GIT_MIRROR_CACHE_MB * (1 << 20)) if GIT_MIRROR_CACHE_MB is not None else int(
+        total * GIT_MIRROR_CACHE_SHARE
+    )
+    return max(0, min(budget, total - min_free)), min_free
+
+
+class GitMirrorCache:
+    def __init__(self, mirror_dir: str = GIT_MIRROR_DIR, budget_mb: Optional[float] = None, tmp_dir: str = "/tmp"):
+        self.mirror_dir = mirror_dir
+        self.tmp_dir = tmp_dir
+        os.makedirs(mirror_dir, exist_ok=True)
+        self.budget_bytes, self.min_free_bytes = tmp_limits(tmp_dir)
+        if budget_mb is not None:
+            self.budget_bytes = int(budget_mb * (1 << 20))
+        self.index_path = os.path.join(mirror_dir, "index.json")
+
+        self.index: Dict[str, Dict] = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r") as fp:
+                    self.index = json.load(fp)
+            except ValueError:
+                print(f"git mirror index at {self.index_path} is unreadable, starting empty")
+        self.index = {
+            repo_url: entry
+            for repo_url, entry in self.index.items()
+            if os.path.isdir(os.path.join(mirror_dir, entry["dir"]))
+        }
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(self.index, fp)
+        os.replace(tmp_path, self.index_path)
+
+    def mirror_path(self, repo_url: str) -> str:
+        return os.path.join(self.mirror_dir, hashlib.sha1(repo_url.encode("utf-8")).hexdigest() + ".git")
+
+    def _update(self, repo_url: str) -> Optional[bool]:
+        """
+        True if the mirror is current, False if there is none, None if an existing mirror couldn't be fetched
+        """
+        path = self.mirror_path(repo_url)
+        if os.path.isdir(path):
+            try:
+                _git("-C", path, "fetch", "--prune", "--no-tags", "--quiet", "origin")
+            except (subprocess.SubprocessError, OSError) as e:
+                # the mirror is still whole, it just can't be trusted to be current this time
+                print(f"git mirror fetch failed for {repo_url}, keeping the mirror: {e}")
+                return None
+            return True
+
+        if shutil.disk_usage(self.tmp_dir).free < self.min_free_bytes:
+            print(f"not mirroring {repo_url}, /tmp is down to its reserve")
+            return False
+        # cloned to the side so a failed clone never leaves a half written mirror in place
+        part_path = path[: -len(".git")] + ".part"
+        try:
+            _git("clone", "--bare", "--filter=blob:none", "--no-tags", "--quiet", repo_url, part_path)
+            _git("-C", part_path, "config", "remote.origin.fetch", HEADS_REFSPEC)
+            _git("-C", part_path, "config", f"url.{repo_url}.insteadOf", MIRROR_ORIGIN_ALIAS)
+            _git("-C", part_path, "config", "remote.origin.url", MIRROR_ORIGIN_ALIAS)
+            os.rename(part_path, path)
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"git mirror clone failed for {repo_url}: {e}")
+            shutil.rmtree(part_path, ignore_errors=True)
+            return False
+        return True
+
+    def _evict(self, keep=frozenset()) -> int:
+        """
+        Evict least recently used mirrors, other than those in keep, until the cache is within budget and /tmp has
+        its reserve free. Returns the number evicted.
+        """
+        total = sum(entry["size"] for entry in self.index.values())
+        evicted = 0
+        for repo_url, entry in sorted(self.index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.budget_bytes and shutil.disk_usage(self.tmp_dir).free >= self.min_free_bytes:
+                break
+            if repo_url in keep:
+                continue
+            shutil.rmtree(os.path.join(self.mirror_dir, entry["dir"]), ignore_errors=True)
+            total -= entry["size"]
+            del self.index[repo_url]
+            evicted += 1
+        return evicted
+
+    def prepare(self, repo_urls: List[str]) -> List[str]:
+        """
+        Create or fetch mirrors for repo_urls and point git at them, returns the repos that are served locally
+        """
+        # make room first, mirrors of this invocation's repos are the ones worth keeping
+        self._evict(keep=set(repo_urls))
+        with ThreadPoolExecutor(max_workers=GIT_FETCH_CONCURRENCY) as executor:
+            updated = list(executor.map(self._update, repo_urls))
+
+        now = time.time()
+        mirrored = []
+        for repo_url, ok in zip(repo_urls, updated):
+            if ok is None:
+                # kept for the next invocation's fetch, but not served stale
+                continue
+            if not ok:
+                self.index.pop(repo_url, None)
+                continue
+            path = self.mirror_path(repo_url)
+            self.index[repo_url] = {"dir": os.path.basename(path), "size": _dir_size(path), "last_used": now}
+            mirrored.append(repo_url)
+        self._save_index()
+        self._write_gitconfig(mirrored, [repo_url for repo_url in repo_urls if repo_url not in mirrored])
+        return mirrored
+
+    def _write_gitconfig(self, mirrored: List[str], not_mirrored: List[str]):
+        # insteadOf is a prefix match, don't let a mirror's url rewrite a longer url that has no mirror
+        lines = []
+        for repo_url in mirrored:
+            base_url = repo_url[: -len(".git")] if repo_url.endswith(".git") else repo_url
+            if any(other != repo_url and other.startswith(base_url) for other in not_mirrored):
+                continue
+            # file:// rather than a bare path: a local path clone copies the objects and can't fetch the missing blobs
+            lines.append(f'[url "file://{self.mirror_path(repo_url)}"]')
+            lines.append(f"\tinsteadOf = {base_url}.git")
+            lines.append(f"\tinsteadOf = {base_url}")
+
+        os.makedirs(GIT_HOME_DIR, exist_ok=True)
+        gitconfig_path = os.path.join(GIT_HOME_DIR, ".gitconfig")
+        with open(gitconfig_path, "w") as fp:
+            fp.write("\n".join(lines) + "\n")
+        # the Lambda home directory is read only, git picks the config up from either
+        os.environ["HOME"] = GIT_HOME_DIR
+        os.environ["GIT_CONFIG_GLOBAL"] = gitconfig_path
+        # newer git refuses to fetch missing objects from inside upload-pack, which is how the mirror serves blobs
+        os.environ["GIT_NO_LAZY_FETCH"] = "0"
+
+    def cleanup(self):
+        """
+        Clear /tmp except the mirror cache, then evict least recently used mirrors until the cache is within
+        budget and /tmp has its reserve free
+        """
+        keep = {os.path.normpath(self.mirror_dir), os.path.normpath(GIT_HOME_DIR)}
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.normpath(os.path.join(self.tmp_dir, name))
+            if path in keep:
+                continue
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+        # mirrors no index entry points at, and clones left behind by an invocation that died mid clone
+        indexed = {entry["dir"] for entry in self.index.values()}
+        for name in os.listdir(self.mirror_dir):
+            if (name.endswith(".git") and name not in indexed) or name.endswith(".part"):
+                shutil.rmtree(os.path.join(self.mirror_dir, name), ignore_errors=True)
+
+        evicted = self._evict()
+        self._save_index()
+        total = sum(entry["size"] for entry in self.index.values())
+        print(f"git mirror cache: {len(self.index)} mirrors, {total // (1 << 20)}mb, evicted {evicted}")
@@ -0,0 +1,591 @@
+"""
+Deployment packages for the Lambda functions.
+
+Dependencies are installed for the target runtime and stripped of what is never imported at run time (tests,
+__pycache__, type stubs and C sources, everything in dist-info that importlib.metadata doesn't read). Then
+everything is precompiled to bytecode for the target Python. The package directory is read only on Lambda, so
+without precompiled bytecode every cold start compiles each module it imports again.
+Requirements every handler shares are published once as a layer by make_layer.py and left out of the function
+packages.
+
+Builds are incremental. Source checkouts are cached per commit, and every handler's requirements are resolved
+together in one pip run into a wheelhouse, so all packages get the same versions. Stripped, precompiled
+site-packages trees are cached by a hash of their requirements. Nothing is reinstalled unless a requirement or the
+resolve changes. make_all.py builds the packages in parallel. A package whose content hash matches what the function
+already runs isn't uploaded.
+"""
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from git.repo.base import Repo
+
+TARGET_PYTHON = "python3.9"
+TARGET_RUNTIME = "python3.9"
+# where a layer's python packages go, /opt/python/lib/python3.9/site-packages on the function
+SITE_PACKAGES = "python/lib/python3.9/site-packages/"
+BUILD_DIR = "build/"
+DEPLOYMENT_BUCKET = "coincommit"
+DEPLOYMENT_PREFIX = "deployment-packages/"
+LAYER_NAME = "coincommit-shared-deps"
+LAYER_ZIP = "shared-deps-layer.zip"
+LAYER_MANIFEST_KEY = DEPLOYMENT_PREFIX + "shared-deps-layer.json"
+# what each function last had deployed by these scripts, {handler}.json
+DEPLOYED_PREFIX = DEPLOYMENT_PREFIX + "deployed/"
+BUILD_CACHE_DIR = os.environ.get("BUILD_CACHE_DIR", ".build_cache/")
+# bump when the strip or compile rules change so cached site-packages trees are rebuilt
+PACKAGING_VERSION = 1
+# cached source checkouts, wheelhouses and site-packages trees kept of each
+CACHED_ENTRIES = 6
+BUILD_CONCURRENCY = 4
+# function code plus its layers, unzipped
+LAMBDA_UNZIPPED_LIMIT_MB = 250
+
+BATCH_SCRAPER_REPO = "https://github.com/josemorenoo/batch_scraper.git"
+BIRDBOT_REPO = "https://github.com/josemorenoo/birdbot.git"
+
+HANDLERS = {
+    "orchestrator": {
+        "function_name": "scrape-master",
+        "zip": "orchestrator-deployment.zip",
+        "repo": BATCH_SCRAPER_REPO,
+        "package": "batch_scraper",
+        "files": [
+            "orchestrator_lambda.py",
+            "report_aggregation.py",
+            "sketches.py",
+            "string_table.py",
+            "external_merge.py",
+            "s3_cache.py",
+            "rollup_pyramid.py",
+            "repo_scheduling.py",
+            "async_fanout.py",
+            "repo_activity.py",
+            "lambda_runtime.py",
+            "tracing.py",
+            "manifest_index.py",
+            "manifest_versions.py",
+        ],
+    },
+    "worker": {
+        "function_name": "repo-scraper",
+        "zip": "batch-scraper-deployment.zip",
+        "repo": BATCH_SCRAPER_REPO,
+        "package": "batch_scraper",
+        "files": ["worker_lambda.py", "async_fanout.py", "git_mirror_cache.py", "lambda_runtime.py"],
+    },
+    "manifest-manager": {
+        "function_name": "manifest-manager",
+        "zip": "manifestmanager-deployment.zip",
+        "repo": BATCH_SCRAPER_REPO,
+        "package": "batch_scraper",
+        "files": ["repo_manifest_lambda.py", "manifest_versions.py", "manifest_index.py", "lambda_runtime.py"],
+    },
+    "birdbot": {
+        "function_name": "birdbot",
+        "zip": "birdbot-deployment.zip",
+        "repo": BIRDBOT_REPO,
+        "package": "birdbot",
+        "files": ["birdbot_lambda.py", "lambda_runtime.py"],
+    },
+}
+
+STRIP_DIRS = {"__pycache__", "tests", "test", ".git", ".github"}
+STRIP_SUFFIXES = (".pyi", ".pyx", ".pxd", ".c", ".h", ".cpp")
+# handlers can also list "exclude", paths under the package root they never import
+# importlib.metadata reads versions from METADATA and plugins from entry_points.txt
+KEEP_DIST_INFO = {"METADATA", "entry_points.txt", "top_level.txt"}
+
+_cache_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+_cache_locks_lock = threading.Lock()
+
+
+def _run(*args: str, cwd: Optional[str] = None) -> str:
+    return subprocess.run(list(args), cwd=cwd, check=True, capture_output=True, text=True).stdout
+
+
+def _dir_size(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            if not os.path.islink(file_path):
+                size += os.path.getsize(file_path)
+    return size
+
+
+def _mb(size: int) -> float:
+    return size / (1 << 20)
+
+
+def _hash(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _cache_lock(path: str) -> threading.Lock:
+    with _cache_locks_lock:
+        return _cache_locks[path]
+
+
+def _remove(path: str):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def distribution_name(name: str) -> str:
+    return re.sub(r"[-_.]+", "_", name).lower()
+
+
+def read_requirements(path: str) -> List[str]:
+    with open(path, "r") as req_file:
+        lines = [line.split("#")[0].strip() for line in req_file.readlines()]
+    return [line for line in lines if line]
+
+
+def _prune_cache(cache_dir: str, keep: int = CACHED_ENTRIES):
+    """
+    Keep the keep most recently used entries of cache_dir
+    """
+    entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if not name.endswith(".partial")]
+    for path in sorted(entries, key=os.path.getmtime, reverse=True)[keep:]:
+        _remove(path)
+
+
+def _load_s3_json(key: str) -> Optional[Dict]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = os.path.join(tmp_dir, os.path.basename(key))
+        try:
+            _run("aws", "s3", "cp", f"s3://{DEPLOYMENT_BUCKET}/{key}", local_path)
+        except subprocess.CalledProcessError:
+            return None
+        with open(local_path, "r") as fp:
+            return json.load(fp)
+
+
+def _save_s3_json(key: str, value: Dict):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = os.path.join(tmp_dir, os.path.basename(key))
+        with open(local_path, "w") as fp:
+            json.dump(value, fp, indent=2)
+        _run("aws", "s3", "cp", local_path, f"s3://{DEPLOYMENT_BUCKET}/{key}")
+
+
+def cached_source(repo_link: str, package: str) -> str:
+    """
+    Checkout of repo_link's HEAD without git metadata or tests, cloned again only when HEAD moves
+    """
+    commit = _run("git", "ls-remote", repo_link, "HEAD").split()[0]
+    sources_dir = os.path.join(BUILD_CACHE_DIR, "sources")
+    path = os.path.join(sources_dir, f"{package}-{commit}")
+    with _cache_lock(path):
+        if not os.path.isdir(path):
+            partial_path = path + ".partial"
+            _remove(partial_path)
+            repo = Repo.clone_from(repo_link, partial_path, depth=1)
+            # HEAD can move between ls-remote and the clone, name the checkout after what was cloned
+            path = os.path.join(sources_dir, f"{package}-{repo.head.commit.hexsha}")
+            strip_package(partial_path)
+            _remove(path)
+            os.rename(partial_path, path)
+            print(f"cloned {repo_link} at {repo.head.commit.hexsha}")
+        os.utime(path)
+        _prune_cache(sources_dir)
+    return path
+
+
+def prepare_sources() -> Dict[str, str]:
+    """
+    Checkout path per source repo of every handler
+    """
+    packages = {handler["repo"]: handler["package"] for handler in HANDLERS.values()}
+    with ThreadPoolExecutor(max_workers=len(packages)) as executor:
+        paths = executor.map(lambda item: cached_source(*item), packages.items())
+        return dict(zip(packages, paths))
+
+
+def handler_requirements(source_dir: str) -> List[str]:
+    # boto3 comes with the runtime, nothing here needs a newer one
+    return read_requirements(os.path.join(source_dir, "requirements.txt"))
+
+
+def _pip(*args: str, requirements: List[str]):
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as req_file:
+        req_file.write("\n".join(requirements) + "\n")
+    try:
+        _run(
+            TARGET_PYTHON, "-m", "pip", *args,
+            "--quiet", "--cache-dir", os.path.join(BUILD_CACHE_DIR, "pip"), "-r", req_file.name,
+        )
+    finally:
+        os.remove(req_file.name)
+
+
+def cached_wheelhouse(requirements: List[str]) -> Optional[str]:
+    """
+    Resolve requirements together in one pip run and download the result, installs of any subset then come from
+    here without going back to the index. None if they don't resolve together.
+    """
+    requirements = sorted(set(requirements))
+    wheels_dir = os.path.join(BUILD_CACHE_DIR, "wheels")
+    path = os.path.join(wheels_dir, _hash(TARGET_PYTHON, requirements))
+    with _cache_lock(path):
+        if not os.path.isdir(path):
+            partial_path = path + ".partial"
+            _remove(partial_path)
+            try:
+                _pip("download", "--dest", partial_path, requirements=requirements)
+            except subprocess.CalledProcessError as e:
+                print(f"the handlers' requirements don't resolve together, resolving each on its own:\n{e.stderr}")
+                return None
+            os.rename(partial_path, path)
+        os.utime(path)
+        _prune_cache(wheels_dir)
+    return path
+
+
+def install_requirements(requirements: List[str], target: str, wheelhouse: Optional[str] = None):
+    """
+    Install requirements into target for the target Python, from wheelhouse if there is one
+    """
+    if len(requirements) == 0:
+        return
+    offline = ["--no-index", "--find-links", wheelhouse] if wheelhouse is not None else []
+    _pip("install", "--target", target, *offline, requirements=requirements)
+
+
+def distribution_owners(site_packages: str) -> Dict[str, str]:
+    """
+    Top level entry in site_packages -> the distribution that installed it, read from the RECORD files
+    """
+    owners = {}
+    for entry in os.listdir(site_packages):
+        record_path = os.path.join(site_packages, entry, "RECORD")
+        if not entry.endswith(".dist-info") or not os.path.exists(record_path):
+            continue
+        name = distribution_name(entry[: -len(".dist-info")].split("-")[0])
+        with open(record_path, "r") as fp:
+            for line in fp:
+                top_level = line.split(",")[0].split("/")[0]
+                if top_level and top_level != "..":
+                    owners[top_level] = name
+    return owners
+
+
+def package_sizes(site_packages: str, owners: Dict[str, str]) -> Dict[str, int]:
+    """
+    Bytes on disk per distribution, anything no distribution owns is counted under its own name
+    """
+    sizes: Dict[str, int] = defaultdict(int)
+    for entry in os.listdir(site_packages):
+        name = owners.get(entry, entry[: -len(".py")] if entry.endswith(".py") else entry)
+        sizes[name] += _dir_size(os.path.join(site_packages, entry))
+    return dict(sizes)
+
+
+def strip_package(site_packages: str, exclude: Iterable[str] = ()) -> int:
+    """
+    Remove files never used at run time, plus the paths in exclude (relative to site_packages).
+    Returns the number of bytes removed.
+    """
+    before = _dir_size(site_packages)
+    for path in exclude:
+        _remove(os.path.join(site_packages, path))
+    # console scripts pip puts next to the packages with --target
+    _remove(os.path.join(site_packages, "bin"))
+
+    for root, dirs, files in os.walk(site_packages):
+        in_dist_info = root.endswith(".dist-info")
+        for dir_name in [dir_name for dir_name in dirs if dir_name in STRIP_DIRS or in_dist_info]:
+            shutil.rmtree(os.path.join(root, dir_name))
+            dirs.remove(dir_name)
+        for file_name in files:
+            if file_name.endswith(STRIP_SUFFIXES) or (in_dist_info and file_name not in KEEP_DIST_INFO):
+                os.remove(os.path.join(root, file_name))
+    return before - _dir_size(site_packages)
+
+
+def precompile(*paths: str):
+    """
+    Compile everything under paths to bytecode for the target Python.
+    Unchecked hash based pycs are used as is, timestamp based ones would be compiled again whenever the zip's 2 second
+    mtime resolution makes the source look newer. They are also the same from build to build, so are the packages.
+    """
+    result = subprocess.run(
+        [TARGET_PYTHON, "-m", "compileall", "-q", "-j", "0", "--invalidation-mode", "unchecked-hash", *paths],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        # usually a vendored python 2 file or a template with a .py suffix, those are never imported
+        print(f"some files didn't compile, they stay uncompiled:\n{result.stdout[-2000:]}")
+
+
+def cached_site_packages(requirements: List[str], wheelhouse: Optional[str]) -> Tuple[str, Dict]:
+    """
+    Installed, stripped and precompiled site-packages for requirements, reused while the requirements and the
+    resolve are the same. Returns (path, {"owners", "before"}) where before is the installed size per distribution.
+    """
+    trees_dir = os.path.join(BUILD_CACHE_DIR, "trees")
+    tree_dir = os.path.join(
+        trees_dir,
+        _hash(PACKAGING_VERSION, TARGET_PYTHON, sorted(requirements), os.path.basename(wheelhouse or "index")),
+    )
+    site_packages = os.path.join(tree_dir, "site-packages")
+    meta_path = os.path.join(tree_dir, "meta.json")
+    with _cache_lock(tree_dir):
+        if not os.path.exists(meta_path):
+            _remove(tree_dir)
+            os.makedirs(site_packages)
+            install_requirements(requirements, site_packages, wheelhouse)
+            owners = distribution_owners(site_packages)
+            before = package_sizes(site_packages, owners)
+            strip_package(site_packages)
+            precompile(site_packages)
+            # written last, a tree without it is a build that didn't finish
+            with open(meta_path, "w") as fp:
+                json.dump({"requirements": requirements, "owners": owners, "before": before}, fp)
+        os.utime(tree_dir)
+        _prune_cache(trees_dir)
+        with open(meta_path, "r") as fp:
+            return site_packages, json.load(fp)
+
+
+def tree_hash(root: str) -> str:
+    """
+    Content hash of every file under root, by relative path
+    """
+    digest = hashlib.sha256()
+    for dir_path, dirs, files in os.walk(root):
+        dirs.sort()
+        for file_name in sorted(files):
+            file_path = os.path.join(dir_path, file_name)
+            digest.update(os.path.relpath(file_path, root).encode("utf-8") + b"\0")
+            with open(file_path, "rb") as fp:
+                for chunk in iter(lambda: fp.read(1 << 20), b""):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_zip(zip_path: str, root: str) -> str:
+    zip_path = os.path.abspath(zip_path)
+    _remove(zip_path)
+    _run("zip", "-q", "-r", zip_path, ".", cwd=root)
+    return zip_path
+
+
+def print_size_report(title: str, before: Dict[str, int], after: Dict[str, int], zip_path: str, layer_bytes: int = 0):
+    # one print so reports of packages built in parallel don't interleave
+    lines = [f"\n{title}", f"  {'distribution':<40} {'installed mb':>14} {'packaged mb':>14}"]
+    for name in sorted(set(before) | set(after), key=lambda name: after.get(name, 0), reverse=True):
+        lines.append(f"  {name:<40} {_mb(before.get(name, 0)):>14.1f} {_mb(after.get(name, 0)):>14.1f}")
+    unzipped = sum(after.values()) + layer_bytes
+    lines.append(
+        f"  unzipped {_mb(sum(before.values())):.1f}mb -> {_mb(sum(after.values())):.1f}mb, "
+        f"zipped {_mb(os.path.getsize(zip_path)):.1f}mb"
+    )
+    if layer_bytes > 0:
+        lines.append(f"  with the shared layer {_mb(unzipped):.1f}mb")
+    lines.append(f"  {round(100 * _mb(unzipped) / LAMBDA_UNZIPPED_LIMIT_MB, 1)}% of the {LAMBDA_UNZIPPED_LIMIT_MB}mb limit")
+    print("\n".join(lines))
+
+
+def load_layer_manifest() -> Optional[Dict]:
+    """
+    The shared layer make_layer.py last published, None if there isn't one
+    """
+    layer = _load_s3_json(LAYER_MANIFEST_KEY)
+    if layer is None:
+        print("no shared dependency layer published, packaging every dependency with the function")
+    return layer
+
+
+def build_function_package(
+    handler_name: str, source_dir: str, layer: Optional[Dict] = None, wheelhouse: Optional[str] = None
+) -> Tuple[str, Optional[str], str]:
+    """
+    Build the deployment zip for handler_name, leaving out what the shared layer provides.
+    Returns (zip path, layer version arn to attach or None, content hash of the package).
+    """
+    handler = HANDLERS[handler_name]
+    requirements = handler_requirements(source_dir)
+
+    # only attach the layer if the handler needs everything in it, it counts against the size limit
+    layer_arn = None
+    layer_distributions = set()
+    if layer is not None and set(layer["requirements"]) <= set(requirements):
+        layer_arn = layer["layer_version_arn"]
+        layer_distributions = set(layer["distributions"])
+        requirements = [requirement for requirement in requirements if requirement not in layer["requirements"]]
+    site_packages, meta = cached_site_packages(requirements, wheelhouse)
+
+    build_dir = os.path.join(BUILD_DIR, handler_name)
+    _remove(build_dir)
+    shutil.copytree(site_packages, build_dir, symlinks=True)
+    # the remaining requirements can depend on something in the layer, pip installs it again
+    for entry, name in meta["owners"].items():
+        if name in layer_distributions:
+            _remove(os.path.join(build_dir, entry))
+    shutil.copytree(source_dir, os.path.join(build_dir, handler["package"]))
+    for path in handler.get("exclude", []):
+        _remove(os.path.join(build_dir, path))
+    for file_name in handler["files"]:
+        shutil.copy(file_name, build_dir)
+    precompile(
+        os.path.join(build_dir, handler["package"]), *[os.path.join(build_dir, name) for name in handler["files"]]
+    )
+
+    artifact_hash = tree_hash(build_dir)
+    zip_path = make_zip(handler["zip"], build_dir)
+    print_size_report(
+        f"{handler_name} package",
+        meta["before"],
+        package_sizes(build_dir, meta["owners"]),
+        zip_path,
+        layer["unzipped_bytes"] if layer_arn is not None else 0,
+    )
+    shutil.rmtree(build_dir)
+    return zip_path, layer_arn, artifact_hash
+
+
+def deploy_function_package(handler_name: str, zip_path: str, layer_arn: Optional[str], artifact_hash: str) -> bool:
+    """
+    Upload and deploy zip_path unless the function already runs this exact package, returns whether it deployed
+    """
+    function_name = HANDLERS[handler_name]["function_name"]
+    deployed_key = f"{DEPLOYED_PREFIX}{handler_name}.json"
+    layers = [layer_arn] if layer_arn is not None else []
+
+    deployed = _load_s3_json(deployed_key)
+    config = json.loads(_run("aws", "lambda", "get-function-configuration", "--function-name", function_name))
+    current_layers = [function_layer["Arn"] for function_layer in config.get("Layers", [])]
+    # CodeSha256 catches code deployed some other way since
+    if (
+        deployed is not None
+        and deployed["artifact_sha256"] == artifact_hash
+        and deployed["code_sha256"] == config["CodeSha256"]
+        and current_layers == layers
+    ):
+        print(f"{function_name} already runs this package, skipping the upload")
+        return False
+
+    key = DEPLOYMENT_PREFIX + os.path.basename(zip_path)
+    _run("aws", "s3", "cp", zip_path, f"s3://{DEPLOYMENT_BUCKET}/{key}")
+    _run(
+        "aws", "lambda", "update-function-code",
+        "--function-name", function_name, "--s3-bucket", DEPLOYMENT_BUCKET, "--s3-key", key,
+    )
+    # a function takes no configuration update while its code update is in progress
+    _run("aws", "lambda", "wait", "function-updated", "--function-name", function_name)
+    if current_layers != layers:
+        _run("aws", "lambda", "update-function-configuration", "--function-name", function_name, "--layers", *layers)
+        _run("aws", "lambda", "wait", "function-updated", "--function-name", function_name)
+
+    config = json.loads(_run("aws", "lambda", "get-function-configuration", "--function-name", function_name))
+    _save_s3_json(
+        deployed_key,
+        {
+            "artifact_sha256": artifact_hash,
+            "code_sha256": config["CodeSha256"],
+            "layers": layers,
+            "deployed_at": datetime.utcnow().isoformat(),
+        },
+    )
+    print(f"deployed {zip_path} to {function_name}" + (f" with layer {layer_arn}" if layer_arn else ""))
+    return True
+
+
+def all_requirements(sources: Dict[str, str]) -> List[str]:
+    return sorted({requirement for path in sources.values() for requirement in handler_requirements(path)})
+
+
+def build_all(handler_names: List[str], deploy: bool = True) -> List[str]:
+    """
+    Build, and unless deploy is off deploy, the packages for handler_names in parallel. Returns the zip paths.
+    Requirements are always resolved across every handler, so a package built alone matches one built with the rest.
+    """
+    layer = load_layer_manifest()
+    sources = prepare_sources()
+    wheelhouse = cached_wheelhouse(all_requirements(sources))
+
+    def build(handler_name: str) -> str:
+        source_dir = sources[HANDLERS[handler_name]["repo"]]
+        zip_path, layer_arn, artifact_hash = build_function_package(handler_name, source_dir, layer, wheelhouse)
+        if deploy:
+            deploy_function_package(handler_name, zip_path, layer_arn, artifact_hash)
+        return zip_path
+
+    with ThreadPoolExecutor(max_workers=BUILD_CONCURRENCY) as executor:
+        return list(executor.map(build, handler_names))
+
+
+def shared_requirements(sources: Dict[str, str]) -> List[str]:
+    """
+    Requirements every handler has in common
+    """
+    shared = None
+    for path in sources.values():
+        requirements = set(handler_requirements(path))
+        shared = requirements if shared is None else shared & requirements
+    return sorted(shared)
+
+
+def build_layer_package(requirements: List[str], wheelhouse: Optional[str] = None) -> Tuple[str, Dict]:
+    """
+    Build the shared dependency layer zip, returns (zip path, manifest without the layer arn)
+    """
+    site_packages, meta = cached_site_packages(requirements, wheelhouse)
+    build_dir = os.path.join(BUILD_DIR, "layer")
+    _remove(build_dir)
+    shutil.copytree(site_packages, os.path.join(build_dir, SITE_PACKAGES), symlinks=True)
+    zip_path = make_zip(LAYER_ZIP, build_dir)
+
+    after = package_sizes(os.path.join(build_dir, SITE_PACKAGES), meta["owners"])
+    print_size_report("shared dependency layer", meta["before"], after, zip_path)
+    manifest = {
+        "requirements": requirements,
+        "distributions": sorted(set(meta["owners"].values())),
+        "unzipped_bytes": sum(after.values()),
+        "artifact_sha256": tree_hash(build_dir),
+    }
+    shutil.rmtree(build_dir)
+    return zip_path, manifest
+
+
+def publish_layer(zip_path: str, manifest: Dict) -> Dict:
+    """
+    Publish a new layer version unless the last one published has the same content
+    """
+    published_manifest = _load_s3_json(LAYER_MANIFEST_KEY)
+    if published_manifest is not None and published_manifest.get("artifact_sha256") == manifest["artifact_sha256"]:
+        print(f"{published_manifest['layer_version_arn']} has the same content, not publishing")
+        return published_manifest
+
+    key = DEPLOYMENT_PREFIX + os.path.basename(zip_path)
+    _run("aws", "s3", "cp", zip_path, f"s3://{DEPLOYMENT_BUCKET}/{key}")
+    published = json.loads(
+        _run(
+            "aws", "lambda", "publish-layer-version",
+            "--layer-name", LAYER_NAME,
+            "--content", f"S3Bucket={DEPLOYMENT_BUCKET},S3Key={key}",
+            "--compatible-runtimes", TARGET_RUNTIME,
+            "--description", ", ".join(manifest["requirements"])[:256],
+        )
+    )
+    manifest = dict(manifest, layer_version_arn=published["LayerVersionArn"])
+    _save_s3_json(LAYER_MANIFEST_KEY, manifest)
+    print(f"published {manifest['layer_version_arn']}")
+    return manifest
@@ -0,0 +1,130 @@
+"""
+Shared runtime for the Lambda handlers.
+
+Secrets are cached for SECRETS_TTL_SECS so warm invocations skip the Secrets Manager round trip, and AWS clients
+are created once per (service, connection pool size) and reused across invocations and threads. Clients, unlike
+boto3 resources and sessions, are thread safe, they are created from one session under a lock since sessions
+aren't. warm_up starts setup work on background threads at the top of a handler.
+
+Heavy dependencies (batch_scraper, birdbot and what they pull in) are imported with lazy_import, which defers the
+import to first use so code paths that don't need them skip the cost on a cold start. LAZY_IMPORTS=0 imports
+everything at module load again, see scripts/profile_imports.py.
+"""
+
+import importlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+SECRET_NAME = "coincommitsecrets"
+REGION_NAME = "us-west-1"
+SECRETS_TTL_SECS = float(os.environ.get("SECRETS_TTL_SECS", "900"))
+SETUP_CONCURRENCY = 8
+LAZY_IMPORTS = os.environ.get("LAZY_IMPORTS", "1") != "0"
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_secrets: Optional[Dict[str, str]] = None
+_secrets_fetched_at = 0.0
+_setup_executor = None
+
+
+def _get_session():
+    global _session
+    if _session is None:
+        _session = boto3.session.Session()
+    return _session
+
+
+def get_client(service_name: str, max_pool_connections: int = 10, config: Optional[Config] = None):
+    """
+    Shared client for service_name with a connection pool of max_pool_connections, pass config for anything else.
+    Size the pool to the number of threads that use the client at once.
+    """
+    key = (service_name, max_pool_connections, id(config) if config is not None else None)
+    with _lock:
+        if key not in _clients:
+            client_config = Config(region_name=REGION_NAME, max_pool_connections=max_pool_connections)
+            if config is not None:
+                client_config = client_config.merge(config)
+            _clients[key] = _get_session().client(service_name, config=client_config)
+        return _clients[key]
+
+
+def get_secrets(force_refresh: bool = False) -> Dict[str, str]:
+    global _secrets, _secrets_fetched_at
+    with _lock:
+        if not force_refresh and _secrets is not None and time.time() - _secrets_fetched_at < SECRETS_TTL_SECS:
+            return _secrets
+
+    client = get_client("secretsmanager")
+    try:
+        get_secret_value_response = client.get_secret_value(SecretId=SECRET_NAME)
+    except ClientError as e:
+        # For a list of exceptions thrown, see
+        # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
+        print("STS get_secrets:", e)
+        raise e
+
+    # Decrypts secret using the associated KMS key.
+    secrets = json.loads(get_secret_value_response["SecretString"])
+    with _lock:
+        _secrets = secrets
+        _secrets_fetched_at = time.time()
+    return secrets
+
+
+def warm_up(**tasks: Callable) -> Dict[str, Future]:
+    """
+    Start independent setup steps (secrets, clients, manifest downloads, ...) concurrently.
+    Returns a future per task name, call .result() where the value is first needed.
+    """
+    global _setup_executor
+    with _lock:
+        if _setup_executor is None:
+            _setup_executor = ThreadPoolExecutor(max_workers=SETUP_CONCURRENCY)
+    return {name: _setup_executor.submit(task) for name, task in tasks.items()}
+
+
+class LazyImport:
+    """
+    Stand in for a module or module attribute that is imported on first use
+    """
+
+    def __init__(self, module_name: str, attr: Optional[str] = None):
+        self.module_name = module_name
+        self.attr = attr
+        self.target = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.target is None:
+                module = importlib.import_module(self.module_name)
+                self.target = getattr(module, self.attr) if self.attr is not None else module
+            return self.target
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(self.load(), name)
+
+
+def lazy_import(module_name: str, attr: Optional[str] = None) -> LazyImport:
+    """
+    from module_name import attr, deferred until first use unless LAZY_IMPORTS is off.
+    warm_up(name=target.load) starts the import in the background instead.
+    """
+    target = LazyImport(module_name, attr)
+    if not LAZY_IMPORTS:
+        target.load()
+    return target
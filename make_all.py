@@ -0,0 +1,23 @@
+"""
+Build and deploy every Lambda function package in parallel.
+
+    python make_all.py [orchestrator worker manifest-manager birdbot] [--no-deploy]
+
+Checkouts, the dependency resolve and installed site-packages are cached in .build_cache/ and reused until a source
+commit or requirement changes, and a package is only uploaded if its content differs from what the function runs.
+"""
+
+import sys
+import time
+
+from lambda_packaging import HANDLERS, build_all
+
+if __name__ == "__main__":
+    handler_names = [arg for arg in sys.argv[1:] if not arg.startswith("--")] or list(HANDLERS)
+    unknown = [name for name in handler_names if name not in HANDLERS]
+    if len(unknown) > 0:
+        raise Exception(f"unknown handlers {unknown}, choose from {list(HANDLERS)}")
+
+    start = time.time()
+    zip_paths = build_all(handler_names, deploy="--no-deploy" not in sys.argv)
+    print(f"built {len(zip_paths)} packages in {round(time.time() - start, 1)}s")
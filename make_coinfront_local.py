@@ -8,6 +8,8 @@ import boto3
 
 from scripts.create_weekly_reports import download_combine_weekly_json_files
 from scripts.create_monthly_reports import download_combine_monthly_json_files
+from s3_cache import get_cache
+from string_table import decode_report, is_encoded
 
 
 if __name__ == "__main__":
@@ -64,10 +66,24 @@ if __name__ == "__main__":
     monthly_report_local_path = f"/tmp/monthly_raw.json"
 
 
+    # the cache also serves the weekly/monthly aggregation below, which read the same daily report
+    cache = get_cache()
     print(f"downloading s3://{bucket}/{s3_object} to {daily_report_local_path}")
-    s3_client.download_file(bucket, s3_object, daily_report_local_path)
-    s3_client.download_file(bucket, f"reports/{report_date_str}/weekly_raw.json", weekly_report_local_path)
-    s3_client.download_file(bucket, f"reports/{report_date_str}/monthly_raw.json", monthly_report_local_path)
+    for object_name, local_path in [
+        (s3_object, daily_report_local_path),
+        (f"reports/{report_date_str}/weekly_raw.json", weekly_report_local_path),
+        (f"reports/{report_date_str}/monthly_raw.json", monthly_report_local_path),
+    ]:
+        if not cache.download_file(s3_client, bucket, object_name, local_path):
+            raise Exception(f"s3://{bucket}/{object_name} does not exist")
+
+    # the frontend reads plain reports, expand any that were written string dictionary encoded
+    for raw_report_local_path in [weekly_report_local_path, monthly_report_local_path]:
+        with open(raw_report_local_path, "r") as fp:
+            raw_report = json.load(fp)
+        if is_encoded(raw_report):
+            with open(raw_report_local_path, "w") as fp:
+                json.dump(decode_report(raw_report), fp, indent=2)
 
     print(os.listdir("/tmp"))
 
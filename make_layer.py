@@ -0,0 +1,19 @@
+from lambda_packaging import (
+    all_requirements,
+    build_layer_package,
+    cached_wheelhouse,
+    prepare_sources,
+    publish_layer,
+    shared_requirements,
+)
+
+# dependencies every handler needs go into one layer, rebuild the function packages after publishing a new one
+sources = prepare_sources()
+requirements = shared_requirements(sources)
+if len(requirements) == 0:
+    print("the handlers have no requirements in common, nothing to put in a layer")
+else:
+    print(f"shared requirements: {requirements}")
+    # same resolve as the function packages, so the layer has the versions they were built against
+    zip_path, manifest = build_layer_package(requirements, cached_wheelhouse(all_requirements(sources)))
+    publish_layer(zip_path, manifest)
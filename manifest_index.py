@@ -0,0 +1,247 @@
+"""
+Indexed SQLite companion of the repo manifest.
+
+The manifest manager builds it from the JSON manifest and publishes it next to it, the orchestrator looks repos up
+by token, URL, size and last activity with indexed queries and streams the candidate set into grouping, instead of
+downloading and parsing the whole JSON.
+
+The index reads one manifest layout, a token to its repos, each with its size in MB and, if known, the time of its
+last push as ISO 8601:
+
+    {"BTC": {"repos": [{"repo_url": "https://github.com/bitcoin/bitcoin", "size_mb": 512.0,
+                        "last_activity": "2024-03-04T12:00:00Z"}]}}
+
+Anything else, including a repo without a size, raises ManifestFormatError rather than being guessed at, so a change
+to the manifest stops the index from being published and the orchestrator groups with the Orchestrator instead.
+"""
+
+import heapq
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+MANIFEST_INDEX_KEY = "assets/repo_manifest.sqlite"
+MANIFEST_INDEX_SCHEMA = 2
+INSERT_BATCH_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE repos (repo_url TEXT PRIMARY KEY, size_mb REAL NOT NULL, last_activity TEXT);
+CREATE TABLE token_repos (token TEXT NOT NULL, repo_url TEXT NOT NULL, PRIMARY KEY (token, repo_url));
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+# built after the bulk insert, cheaper than maintaining them row by row
+INDEXES = """
+CREATE INDEX repos_size ON repos (size_mb);
+CREATE INDEX repos_activity ON repos (last_activity);
+CREATE INDEX token_repos_repo ON token_repos (repo_url);
+"""
+
+
+class ManifestFormatError(ValueError):
+    pass
+
+
+def _timestamp(value: str) -> str:
+    """
+    ISO 8601 as a sortable UTC "%Y-%m-%dT%H:%M:%SZ"
+    """
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _read_repo(token: str, item) -> Tuple[str, float, Optional[str]]:
+    if not isinstance(item, dict) or not isinstance(item.get("repo_url"), str) or not item["repo_url"]:
+        raise ManifestFormatError(f"{token}: repo entry without a repo_url: {item!r}")
+    repo_url = item["repo_url"]
+    size_mb = item.get("size_mb")
+    if isinstance(size_mb, bool) or not isinstance(size_mb, (int, float)):
+        raise ManifestFormatError(f"{token}: {repo_url} has no size_mb: {size_mb!r}")
+    last_activity = item.get("last_activity")
+    if last_activity is not None:
+        try:
+            last_activity = _timestamp(last_activity)
+        except (TypeError, AttributeError, ValueError):
+            raise ManifestFormatError(f"{token}: {repo_url} has an unreadable last_activity: {last_activity!r}")
+    return repo_url, float(size_mb), last_activity
+
+
+def iter_manifest_repos(manifest) -> Iterator[Tuple[str, Tuple[str, float, Optional[str]]]]:
+    """
+    (token, (repo_url, size_mb, last_activity)) for every repo in the manifest
+    """
+    if not isinstance(manifest, dict):
+        raise ManifestFormatError(f"manifest is a {type(manifest).__name__}, expected tokens by name")
+    for token, entry in manifest.items():
+        if not isinstance(entry, dict) or not isinstance(entry.get("repos"), list):
+            raise ManifestFormatError(f"{token}: no repos list")
+        for item in entry["repos"]:
+            yield token, _read_repo(token, item)
+
+
+def build_index(manifest_path: str, index_path: Optional[str] = None, sha256: Optional[str] = None) -> str:
+    """
+    Write the index of the manifest at manifest_path, next to it unless index_path is given. Returns its path.
+    """
+    index_path = index_path if index_path is not None else os.path.splitext(manifest_path)[0] + ".sqlite"
+    tmp_path = f"{index_path}.part"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    with open(manifest_path, "r") as fp:
+        manifest = json.load(fp)
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.executescript("PRAGMA journal_mode = OFF; PRAGMA synchronous = OFF;" + SCHEMA)
+        repos: Dict[str, Tuple[float, Optional[str]]] = {}
+        token_repos: List[Tuple[str, str]] = []
+        for token, (repo_url, size_mb, last_activity) in iter_manifest_repos(manifest):
+            token_repos.append((token, repo_url))
+            # a repo listed under several tokens keeps its largest size and latest activity
+            if repo_url in repos:
+                known_size, known_activity = repos[repo_url]
+                size_mb = max(known_size, size_mb)
+                last_activity = max((time for time in (known_activity, last_activity) if time), default=None)
+            repos[repo_url] = (size_mb, last_activity)
+        del manifest
+
+        rows = [(repo_url, size_mb, last_activity) for repo_url, (size_mb, last_activity) in repos.items()]
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            connection.executemany("INSERT INTO repos VALUES (?, ?, ?)", rows[start : start + INSERT_BATCH_SIZE])
+        for start in range(0, len(token_repos), INSERT_BATCH_SIZE):
+            connection.executemany(
+                "INSERT OR IGNORE INTO token_repos VALUES (?, ?)", token_repos[start : start + INSERT_BATCH_SIZE]
+            )
+        connection.executescript(INDEXES)
+        meta = {
+            "schema": str(MANIFEST_INDEX_SCHEMA),
+            "built_at": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "manifest_sha256": sha256 or "",
+            "repos": str(len(rows)),
+        }
+        connection.executemany("INSERT INTO meta VALUES (?, ?)", list(meta.items()))
+        connection.commit()
+        connection.execute("VACUUM")
+    finally:
+        connection.close()
+    os.replace(tmp_path, index_path)
+    print(f"indexed {len(repos)} repos of {len({token for token, _ in token_repos})} tokens")
+    return index_path
+
+
+def publish_index(s3, manifest_path: str, sha256: str, bucket: str = "coincommit") -> bool:
+    """
+    Build and upload the index of the manifest with content hash sha256, unless the published index already is it
+    """
+    metadata = {"sha256": sha256, "schema": str(MANIFEST_INDEX_SCHEMA)}
+    try:
+        published = s3.head_object(Bucket=bucket, Key=MANIFEST_INDEX_KEY)["Metadata"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise e
+        published = None
+    if published == metadata:
+        print("manifest index is current, skipping upload")
+        return False
+    index_path = build_index(manifest_path, sha256=sha256)
+    s3.upload_file(index_path, bucket, MANIFEST_INDEX_KEY, ExtraArgs={"Metadata": metadata})
+    print(f"published manifest index, {round(os.path.getsize(index_path) / (1 << 20), 2)}mb")
+    return True
+
+
+class ManifestIndex:
+    def __init__(self, index_path: str):
+        # read only, several threads may plan groups at once
+        self.connection = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True, check_same_thread=False)
+        self.meta = dict(self.connection.execute("SELECT key, value FROM meta"))
+        if int(self.meta.get("schema", "0")) != MANIFEST_INDEX_SCHEMA:
+            self.connection.close()
+            raise ValueError(f"manifest index schema {self.meta.get('schema')}, expected {MANIFEST_INDEX_SCHEMA}")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def repo(self, repo_url: str) -> Optional[Dict]:
+        row = self.connection.execute(
+            "SELECT repo_url, size_mb, last_activity FROM repos WHERE repo_url = ?", (repo_url,)
+        ).fetchone()
+        if row is None:
+            return None
+        tokens = self.connection.execute("SELECT token FROM token_repos WHERE repo_url = ?", (repo_url,))
+        tokens = [token for (token,) in tokens]
+        return {"repo_url": row[0], "size_mb": row[1], "last_activity": row[2], "tokens": tokens}
+
+    def token_repos(self, token: str) -> List[str]:
+        rows = self.connection.execute("SELECT repo_url FROM token_repos WHERE token = ?", (token,))
+        return [repo_url for (repo_url,) in rows]
+
+    def iter_repos(
+        self,
+        tokens: Optional[List[str]] = None,
+        min_size_mb: Optional[float] = None,
+        max_size_mb: Optional[float] = None,
+        active_since: Optional[datetime] = None,
+        largest_first: bool = False,
+    ) -> Iterator[Tuple[str, float, Optional[str]]]:
+        """
+        Stream (repo_url, size_mb, last_activity) of the matching repos. Repos with no known activity time always
+        count as active.
+        """
+        clauses = []
+        params: List = []
+        if tokens is not None:
+            clauses.append(
+                f"repo_url IN (SELECT repo_url FROM token_repos WHERE token IN ({', '.join('?' for _ in tokens)}))"
+            )
+            params.extend(tokens)
+        if min_size_mb is not None:
+            clauses.append("size_mb >= ?")
+            params.append(min_size_mb)
+        if max_size_mb is not None:
+            clauses.append("size_mb <= ?")
+            params.append(max_size_mb)
+        if active_since is not None:
+            clauses.append("(last_activity IS NULL OR last_activity >= ?)")
+            params.append(active_since.strftime("%Y-%m-%dT%H:%M:%SZ"))
+        query = "SELECT repo_url, size_mb, last_activity FROM repos"
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        if largest_first:
+            query += " ORDER BY size_mb DESC"
+        yield from self.connection.execute(query, params)
+
+
+def pack_repos(
+    repos: Iterator[Tuple[str, float, Optional[str]]], mem_limit_mb: float
+) -> Tuple[List[List[str]], List[float]]:
+    """
+    Pack streamed repos into groups under mem_limit_mb, each into the least loaded group if it fits there (worst fit,
+    so groups come out about even), decreasing if the stream is largest first. A repo larger than the limit gets a
+    group of its own.
+    """
+    groups: List[List[str]] = []
+    sizes: List[float] = []
+    # (size, group index)
+    loads: List[Tuple[float, int]] = []
+    for repo_url, size_mb, _ in repos:
+        if loads and loads[0][0] + size_mb <= mem_limit_mb:
+            i = loads[0][1]
+            groups[i].append(repo_url)
+            sizes[i] += size_mb
+            heapq.heapreplace(loads, (sizes[i], i))
+        else:
+            groups.append([repo_url])
+            sizes.append(size_mb)
+            heapq.heappush(loads, (size_mb, len(groups) - 1))
+    return groups, sizes
@@ -0,0 +1,90 @@
+"""
+Change detected repo manifest publishing.
+
+The manifest is published to assets/repo_manifest.json only when its content hash changes.
+assets/repo_manifest_versions.json holds the hash of the published manifest and the day each version was published.
+
+assets/repo_manifest_{date}.json is still written every day for its readers, as a server side copy of the published
+manifest, so an unchanged manifest is never uploaded from the Lambda.
+"""
+
+import hashlib
+import json
+from datetime import date, datetime
+from typing import Dict, Optional
+
+from botocore.exceptions import ClientError
+
+MANIFEST_BUCKET = "coincommit"
+MANIFEST_KEY = "assets/repo_manifest.json"
+MANIFEST_VERSIONS_KEY = "assets/repo_manifest_versions.json"
+MANIFEST_DATED_KEY = "assets/repo_manifest_{date}.json"
+
+
+def manifest_hash(manifest) -> str:
+    # key order doesn't change the hash
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+def _get_json(s3, key: str) -> Optional[Dict]:
+    try:
+        response = s3.get_object(Bucket=MANIFEST_BUCKET, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise e
+    return json.loads(response["Body"].read())
+
+
+def _put_json(s3, key: str, value):
+    body = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    s3.put_object(Bucket=MANIFEST_BUCKET, Key=key, Body=body, ContentType="application/json")
+
+
+def _copy_dated(s3, date_str: str):
+    s3.copy_object(
+        Bucket=MANIFEST_BUCKET,
+        Key=MANIFEST_DATED_KEY.format(date=date_str),
+        CopySource={"Bucket": MANIFEST_BUCKET, "Key": MANIFEST_KEY},
+    )
+
+
+def load_versions(s3) -> Dict:
+    versions = _get_json(s3, MANIFEST_VERSIONS_KEY)
+    if versions is None:
+        return {"sha256": None, "versions": []}
+    return versions
+
+
+def publish_manifest(s3, local_manifest_path: str, today: Optional[date] = None) -> Dict:
+    """
+    Publish the manifest ManifestManager wrote to local_manifest_path, skipping the upload if it is unchanged.
+    Returns what was done, for the handler's response.
+    """
+    today = today if today is not None else datetime.now().date()
+    date_str = today.strftime("%Y-%m-%d")
+    with open(local_manifest_path, "r") as fp:
+        manifest = json.load(fp)
+    sha256 = manifest_hash(manifest)
+
+    versions = load_versions(s3)
+    if versions["sha256"] == sha256:
+        print(f"manifest unchanged ({sha256[:12]}), skipping upload")
+        _copy_dated(s3, date_str)
+        return {"changed": False, "sha256": sha256}
+
+    s3.upload_file(
+        local_manifest_path,
+        MANIFEST_BUCKET,
+        MANIFEST_KEY,
+        ExtraArgs={"Metadata": {"sha256": sha256}, "ContentType": "application/json"},
+    )
+    _copy_dated(s3, date_str)
+
+    # one version per day, a second publish on the same day replaces it
+    entries = [version for version in versions["versions"] if version["date"] != date_str]
+    entries.append({"date": date_str, "sha256": sha256})
+    entries.sort(key=lambda version: version["date"])
+    _put_json(s3, MANIFEST_VERSIONS_KEY, {"sha256": sha256, "versions": entries})
+    print(f"published manifest {sha256[:12]} for {date_str}")
+    return {"changed": True, "sha256": sha256}
@@ -1,270 +1,421 @@
+import hashlib
 import json
-import boto3
-from datetime import datetime, timedelta
-from typing import Dict, List
-from concurrent.futures import ThreadPoolExecutor
-from concurrent.futures import as_completed
 import os
-import shutil
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import as_completed
+import random
+import threading
 import time
 
 from botocore.exceptions import ClientError
 from botocore.config import Config
 
-from batch_scraper.orchestrator import Orchestrator
-
+from async_fanout import (
+    ASYNC_RUN_DEADLINE_SECS,
+    claim_reduce,
+    list_completions,
+    load_run,
+    register_run,
+    save_run,
+    sweep_overdue_runs,
+    wait_for_completions,
+    write_completion,
+)
+from external_merge import SpillingAggregator, iter_report_tokens, write_report_stream
+from repo_activity import ACTIVITY_INDEX_KEY, ACTIVITY_SLACK, filter_active, refresh_index
+from repo_scheduling import default_prediction, makespan, plan_groups, predict_secs, record_durations
+from report_aggregation import (
+    TokenStats,
+    add_exact_lists,
+    add_report,
+    fill_exact_lists,
+    load_state,
+    merge_aggregates,
+    serialize_report,
+    serialize_sketches,
+    serialize_state,
+    subtract_report,
+    top_tokens,
+)
+from rollup_pyramid import CHILD_LEVEL, child_keys, decompose_range, period_key
+from lambda_runtime import get_client, get_secrets, lazy_import, warm_up
+from manifest_index import MANIFEST_INDEX_KEY, ManifestIndex, pack_repos
+from manifest_versions import load_versions
+from s3_cache import get_cache
+from string_table import decode_report, encode_report
+from tracing import count, get_tracer, record, span, start_trace, traced
+
+# batch_scraper (and the git libraries under it) is only needed to group repos, range reports, reduces and window
+# backfills never load it
+Orchestrator = lazy_import("batch_scraper.orchestrator", "Orchestrator")
+
+# invokes block for as long as the worker runs, retries are handled in _invoke_with_retry
 boto_config = Config(
     retries={"max_attempts": 0},
     read_timeout=900,
     connect_timeout=900,
-    region_name="us-west-1",
-    max_pool_connections=50,
 )
-lambda_client = boto3.client("lambda", config=boto_config)
-s3_client = boto3.resource("s3")
 
+# max number of reports downloaded at once when joining
+REPORT_FETCH_CONCURRENCY = 16
 
-def get_secrets() -> Dict[str, str]:
-    secret_name = "coincommitsecrets"
-    region_name = "us-west-1"
+# precomputed week/month/quarter/year rollups, see rollup_pyramid.py
+ROLLUP_PREFIX = "reports/rollups/"
 
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
 
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
-        # For a list of exceptions thrown, see
-        # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
-        print("STS get_secrets:", e)
-        raise e
+# per repo EWMA of scrape time, fed back into grouping, see repo_scheduling.py
+DURATION_HISTORY_KEY = "assets/repo_duration_history.json"
+LAMBDA_MEM_LIMIT_MB = 800.0
+
+# worker fan out: cap on in-flight invocations, throttle retries and hedging of stragglers
+MAX_INFLIGHT_WORKERS = 50
+INVOKE_MAX_ATTEMPTS = 6
+INVOKE_BACKOFF_BASE_SECS = 1.0
+INVOKE_BACKOFF_CAP_SECS = 30.0
+THROTTLE_ERROR_CODES = ("TooManyRequestsException", "ThrottlingException", "EC2ThrottledException")
+# a group still running past this percentile of finished groups' latency gets a duplicate invocation
+HEDGE_PERCENTILE = 0.9
+# don't trust the percentile until this many groups have finished
+HEDGE_MIN_FINISHED = 3
+FAN_OUT_POLL_SECS = 5.0
+
+WORKER_FUNCTION = "arn:aws:lambda:us-west-1:665809458133:function:repo-scraper"
+# async runs: time kept back from polling for the reduce step when the orchestrator waits on its own run
+ASYNC_REDUCE_RESERVE_SECS = 300.0
+
+# time kept back from the worker phase for the join, rollups and windows. Past it the run is joined as it stands,
+# marked partial and can be finished by invoking again with resume_run_id
+DEADLINE_RESERVE_SECS = 240.0
 
-    # Decrypts secret using the associated KMS key.
-    secrets = get_secret_value_response["SecretString"]
-    return json.loads(secrets)
+REPO_MANIFEST_KEY = "assets/repo_manifest.json"
+# repo groupings keyed by manifest ETag and scrape window, reused instead of downloading and parsing the manifest
+# while it is unchanged. The manifest is only republished when its content changes, see manifest_versions.py
+REPO_GROUPS_PREFIX = "assets/repo_groups/"
+REPO_GROUPS_CACHE = os.environ.get("REPO_GROUPS_CACHE", "1") != "0"
+# per day backfill: day pipelines running at once, they share one cap on in-flight worker invocations
+BACKFILL_CONCURRENT_DAYS = 4
+# key of the GitHub token in coincommitsecrets used by the opt-in activity filter, unset makes unauthenticated lookups
+ACTIVITY_TOKEN_SECRET_KEY = os.environ.get("ACTIVITY_TOKEN_SECRET_KEY")
 
 
-def _update_master_report(master_report, token_name, token_data):
-    if token_name not in master_report:
-        master_report[token_name] = token_data
+def _split_s3_path(s3_path: str) -> Tuple[str, str]:
+    report_path_pieces = s3_path.split("/")
+    return report_path_pieces[2], "/".join(report_path_pieces[3:])
+
+
+def _download_report(s3_client, report_location: str, cache: bool = True) -> Optional[Dict]:
+    """
+    Fetch a report from S3 in a single round trip and parse it, returns None if the report does not exist.
+    Cached reports are revalidated by ETag instead of downloaded again, see s3_cache.py.
+    """
+    bucket, report_path = _split_s3_path(report_location)
+    with span("report_download", cached=cache):
+        if cache:
+            data = get_cache().get_bytes(s3_client, bucket, report_path)
+            if data is None:
+                print(f"Report not found: {report_location}")
+                return None
+            return decode_report(json.loads(data))
+
+        try:
+            response = s3_client.get_object(Bucket=bucket, Key=report_path)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                print(f"Report not found: {report_location}")
+                return None
+            raise e
+
+        count("s3_bytes_downloaded", response.get("ContentLength", 0), "Bytes")
+        return decode_report(json.load(response["Body"]))
+
+
+def _fetch_reports(
+    s3_client,
+    report_locations: List[str],
+    max_workers: int = REPORT_FETCH_CONCURRENCY,
+    cache: bool = True,
+    download=_download_report,
+):
+    """
+    Download reports concurrently, yielding (report_location, report) as each one arrives.
+    Missing reports are skipped.
+    """
+    if len(report_locations) == 0:
         return
 
-    # Aggregate data for existing token
-    for key in ["commit_count", "lines_of_code", "commit_messages", "distinct_authors", "commit_urls", "changed_methods", "active_repos"]:
-        master_report[token_name][key] += token_data[key]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(report_locations))) as executor:
+        futures = {
+            executor.submit(download, s3_client, report_location, cache): report_location
+            for report_location in report_locations
+        }
+        for future in as_completed(futures):
+            report = future.result()
+            if report is not None:
+                yield futures[future], report
+
+
+def _upload_file(s3_client, local_path: str, object_name: str):
+    count("s3_bytes_uploaded", os.path.getsize(local_path), "Bytes")
+    s3_client.upload_file(local_path, "coincommit", object_name)
 
-    # File extensions
-    for fext_name, fext_count in token_data["file_extensions"].items():
-        master_report[token_name]["file_extensions"].setdefault(fext_name, 0)
-        master_report[token_name]["file_extensions"][fext_name] += fext_count
 
-    # LOC changes by filetype
-    for fext_action, fext_data in token_data["loc_changes_by_filetype"].items():
-        if fext_action not in master_report[token_name]["loc_changes_by_filetype"]:
-            master_report[token_name]["loc_changes_by_filetype"][fext_action] = fext_data
+def _sketch_sidecar_path(report_location: str) -> str:
+    return report_location[: -len(".json")] + ".sketches.json"
+
+
+def _download_report_with_sketches(s3_client, report_location: str, cache: bool = True):
+    """
+    A report and its sketch sidecar, None if the report does not exist. Reports from before sketch mode (or
+    written without it) have no sidecar and get their sketches built from their lists.
+    """
+    report = _download_report(s3_client, report_location, cache)
+    if report is None:
+        return None
+    return report, _download_report(s3_client, _sketch_sidecar_path(report_location), cache)
+
+
+def _report_fetch_client():
+    # shared across threads and warm invocations, sized to the fetch concurrency
+    return get_client("s3", max_pool_connections=REPORT_FETCH_CONCURRENCY)
+
+
+def _runs_client():
+    # async run counters and reduce claims, see async_fanout.py
+    return get_client("dynamodb")
+
+
+def _lambda_client(max_inflight: int = MAX_INFLIGHT_WORKERS):
+    # one connection per in-flight worker invoke
+    return get_client("lambda", max_pool_connections=max_inflight, config=boto_config)
+
+
+def _window_state_path(report_date_str: str, report_name: str) -> str:
+    return f"s3://coincommit/reports/{report_date_str}/{report_name}.state.json"
+
+
+def _upload_report(
+    s3_client,
+    aggregate: Dict[str, TokenStats],
+    report_date_str: str,
+    report_name: str,
+    with_state: bool = False,
+    string_table: bool = False,
+):
+    """
+    Serialize an aggregate and upload it, with_state also uploads the counted form so the next window can slide from it.
+    string_table writes the report string dictionary encoded, the state is always encoded.
+    """
+    master_report = serialize_report(aggregate)
+    master_report_local_path = f"/tmp/{report_name}.json"
+    with open(master_report_local_path, "w") as fp:
+        if string_table:
+            json.dump(encode_report(master_report), fp)
         else:
-            for fext_name, fext_count in fext_data.items():
-                master_report[token_name]["loc_changes_by_filetype"][fext_action].setdefault(fext_name, 0)
-                master_report[token_name]["loc_changes_by_filetype"][fext_action][fext_name] += fext_count
+            json.dump(master_report, fp, indent=2)
+        print(f"Dumped report to {master_report_local_path}")
+
+    object_name = f"reports/{report_date_str}/{report_name}.json"
+    _upload_file(s3_client, master_report_local_path, object_name)
+    print(f"Uploaded {master_report_local_path} to {object_name}")
 
-def join_reports(s3_report_paths: List[str], report_date_str: str, report_name: str):
+    if with_state:
+        state_local_path = f"/tmp/{report_name}.state.json"
+        with open(state_local_path, "w") as fp:
+            json.dump(encode_report(serialize_state(aggregate)), fp)
+        _, state_object_name = _split_s3_path(_window_state_path(report_date_str, report_name))
+        _upload_file(s3_client, state_local_path, state_object_name)
+
+    return master_report
+
+
+def join_reports(
+    s3_report_paths: List[str],
+    report_date_str: str,
+    report_name: str,
+    with_state: bool = False,
+    sketch_mode: bool = False,
+    string_table: bool = False,
+    s3_client=None,
+) -> Dict[str, TokenStats]:
     """
     Given a list of S3 report paths, combine them into a single JSON file.  If a report does not exist in S3, skip it
+
+    sketch_mode merges distinct counts as sketches and only keeps exact lists for the top tokens, which takes a
+    second pass over the reports but keeps memory flat no matter how long the window is. Tokens outside the top
+    SKETCH_EXACT_TOP_N lose every list field (commit_messages, changed_methods included) and only keep
+    distinct_counts, see report_aggregation.py.
     """
     print(f"Joining the following reports into {report_name}:")
     print(*s3_report_paths, sep="\n")
 
-    master_report = {}
-    assembly_dir = "/tmp/reports_to_join/"
-    if not os.path.exists(assembly_dir):
-        os.makedirs(assembly_dir, exist_ok=True)
-
-    s3_client = boto3.client('s3')
+    aggregate = {}
+    s3_client = s3_client if s3_client is not None else _report_fetch_client()
 
-    for report_location in s3_report_paths:
-        report_path_pieces = report_location.split("/")
-        bucket = report_path_pieces[2]
-        report_path = "/".join(report_path_pieces[3:])
-        local_report_path = os.path.join(assembly_dir, report_path_pieces[-1])
+    # merge each report as soon as it arrives
+    if sketch_mode:
+        for _, (report, sketches) in _fetch_reports(
+            s3_client, s3_report_paths, download=_download_report_with_sketches
+        ):
+            with span("merge"):
+                add_report(aggregate, report, sketch_only=True, sketches=sketches)
+    else:
+        for _, report in _fetch_reports(s3_client, s3_report_paths):
+            with span("merge"):
+                add_report(aggregate, report)
+
+    if sketch_mode:
+        displayed_tokens = top_tokens(aggregate)
+        exact = {}
+        for _, report in _fetch_reports(s3_client, s3_report_paths):
+            add_exact_lists(exact, report, displayed_tokens)
+        fill_exact_lists(aggregate, exact)
+
+    _upload_report(
+        s3_client, aggregate, report_date_str, report_name, with_state=with_state, string_table=string_table
+    )
+    return aggregate
 
 
-        # Check if report exists in S3
-        try:
-            s3_client.head_object(Bucket=bucket, Key=report_path)
-        except ClientError:
-            # Skip this report if it does not exist
-            print(f"Report not found: {report_location}")
-            continue
+def _stream_report_into(s3_client, report_location: str, aggregator: SpillingAggregator) -> bool:
+    """
+    Parse a report token by token off its cached copy on disk, returns False if the report does not exist
+    """
+    bucket, report_path = _split_s3_path(report_location)
+    cached_report = get_cache().open(s3_client, bucket, report_path)
+    if cached_report is None:
+        print(f"Report not found: {report_location}")
+        return False
+
+    with cached_report:
+        for token_name, token_data in iter_report_tokens(cached_report):
+            aggregator.add(token_name, token_data)
+    return True
+
+
+def join_reports_streaming(
+    s3_report_paths: List[str],
+    report_date_str: str,
+    report_name: str,
+    memory_budget_mb: float,
+    with_state: bool = False,
+    s3_client=None,
+):
+    """
+    join_reports for windows too big to hold in memory: reports are parsed incrementally and partial aggregates
+    spill to /tmp past memory_budget_mb, then the output is written in a final streaming merge pass
+    """
+    print(f"Stream joining the following reports into {report_name}, memory budget {memory_budget_mb}mb:")
+    print(*s3_report_paths, sep="\n")
 
-        # Download and process the report
-        s3_client.download_file(bucket, report_path, local_report_path)
-        with open(local_report_path, "r") as f:
-            worker_report = json.load(f)
-            for token_name, token_data in worker_report.items():
-                _update_master_report(master_report, token_name, token_data)
+    s3_client = s3_client if s3_client is not None else _report_fetch_client()
+    aggregator = SpillingAggregator(int(memory_budget_mb * (1 << 20)))
+    if len(s3_report_paths) > 0:
+        with ThreadPoolExecutor(max_workers=min(REPORT_FETCH_CONCURRENCY, len(s3_report_paths))) as executor:
+            for future in [
+                executor.submit(_stream_report_into, s3_client, report_location, aggregator)
+                for report_location in s3_report_paths
+            ]:
+                future.result()
 
-    # Upload master report
     master_report_local_path = f"/tmp/{report_name}.json"
+    state_local_path = f"/tmp/{report_name}.state.json"
     with open(master_report_local_path, "w") as fp:
-        json.dump(master_report, fp, indent=2)
-        print(f"Dumped report to {master_report_local_path}")
+        if with_state:
+            with open(state_local_path, "w") as state_fp:
+                write_report_stream(fp, aggregator.iter_merged(), state_fp=state_fp)
+        else:
+            write_report_stream(fp, aggregator.iter_merged())
+    aggregator.cleanup()
+    print(f"Dumped report to {master_report_local_path}, spilled {aggregator.spills} times")
 
     object_name = f"reports/{report_date_str}/{report_name}.json"
-    s3_client.upload_file(master_report_local_path, "coincommit", object_name)
+    _upload_file(s3_client, master_report_local_path, object_name)
     print(f"Uploaded {master_report_local_path} to {object_name}")
 
+    if with_state:
+        _, state_object_name = _split_s3_path(_window_state_path(report_date_str, report_name))
+        _upload_file(s3_client, state_local_path, state_object_name)
+
+
+def _record_duration(durations, decoded_result):
+    # tally durations for performance tuning
+    duration_sec = round(int(decoded_result["worker_duration_secs"]), 3)
+    worker_id = decoded_result["worker_id"]
+    record("worker_duration_secs", float(decoded_result["worker_duration_secs"]))
+    durations.append(
+        (
+            "id_" + str(worker_id),
+            str(duration_sec) + " secs",
+            "aka " + str(round(float(duration_sec) / 60.0, 2)) + " mins",
+        )
+    )
 
-def join_worker_reports(results: str, report_date: str):
-    # clean working directory
-    assembly_dir = "/tmp/report_pieces/"
-    if os.path.exists(assembly_dir):
-        shutil.rmtree(assembly_dir)
-    if not os.path.exists(assembly_dir):
-        os.makedirs(assembly_dir, exist_ok=True)
 
-    master_report = {}
-    durations = []
-    for worker_result in results:
-        decoded_result = json.loads(worker_result.decode("utf-8"))
+def _load_duration_history(s3_client) -> Dict[str, Dict]:
+    history_bytes = get_cache().get_bytes(s3_client, "coincommit", DURATION_HISTORY_KEY)
+    if history_bytes is None:
+        return {}
+    return json.loads(history_bytes)
 
-        # tally durations for performance tuning
-        duration_sec = round(int(decoded_result["worker_duration_secs"]), 3)
-        worker_id = decoded_result["worker_id"]
-        durations.append(
-            (
-                "id_" + str(worker_id),
-                str(duration_sec) + " secs",
-                "aka " + str(round(float(duration_sec) / 60.0, 2)) + " mins",
-            )
-        )
 
-        # download and extract report
-        report_path_pieces = decoded_result["report_path"].split("/")
-        bucket = report_path_pieces[2]
-        report_path = "/".join(report_path_pieces[3:])
-        local_report_path = assembly_dir + report_path_pieces[-1]
-        s3_client.Bucket(bucket).download_file(report_path, local_report_path)
-
-        with open(local_report_path, "r") as f:
-            worker_report = json.load(f)
-            for token_name, token_data in worker_report.items():
-                if token_name in master_report:
-                    master_report[token_name]["commit_count"] += token_data[
-                        "commit_count"
-                    ]
-                    master_report[token_name]["lines_of_code"] += token_data[
-                        "lines_of_code"
-                    ]
-                    master_report[token_name]["commit_messages"] += token_data[
-                        "commit_messages"
-                    ]
-
-                    master_report[token_name]["distinct_authors"] += token_data[
-                        "distinct_authors"
-                    ]
-
-                    master_report[token_name]["commit_urls"] += token_data[
-                        "commit_urls"
-                    ]
-
-                    master_report[token_name]["changed_methods"] += token_data[
-                        "changed_methods"
-                    ]
-
-                    master_report[token_name]["active_repos"] += token_data[
-                        "active_repos"
-                    ]
-
-                    for fext_name, fext_count in token_data["file_extensions"].items():
-                        if fext_name in master_report[token_name]["file_extensions"]:
-                            master_report[token_name]["file_extensions"][
-                                fext_name
-                            ] += fext_count
-                        else:
-                            master_report[token_name]["file_extensions"][
-                                fext_name
-                            ] = fext_count
-
-                    for fext_action, fext_data in token_data[
-                        "loc_changes_by_filetype"
-                    ].items():
-                        for fext_name, fext_count in fext_data.items():
-                            if (
-                                fext_action
-                                not in master_report[token_name][
-                                    "loc_changes_by_filetype"
-                                ]
-                            ):
-                                master_report[token_name]["loc_changes_by_filetype"][
-                                    fext_action
-                                ] = token_data["loc_changes_by_filetype"][fext_action]
-                            else:
-                                if (
-                                    fext_name
-                                    in master_report[token_name][
-                                        "loc_changes_by_filetype"
-                                    ][fext_action]
-                                ):
-                                    master_report[token_name][
-                                        "loc_changes_by_filetype"
-                                    ][fext_action][fext_name] += fext_count
-                                else:
-                                    master_report[token_name][
-                                        "loc_changes_by_filetype"
-                                    ][fext_action][fext_name] = fext_count
-                else:
-                    master_report[token_name] = {}
-                    master_report[token_name]["commit_count"] = token_data[
-                        "commit_count"
-                    ]
-                    master_report[token_name]["lines_of_code"] = token_data[
-                        "lines_of_code"
-                    ]
-                    master_report[token_name]["commit_messages"] = token_data[
-                        "commit_messages"
-                    ]
-
-                    master_report[token_name]["distinct_authors"] = token_data[
-                        "distinct_authors"
-                    ]
-
-                    master_report[token_name]["commit_urls"] = token_data["commit_urls"]
-
-                    master_report[token_name]["changed_methods"] = token_data[
-                        "changed_methods"
-                    ]
-
-                    master_report[token_name]["file_extensions"] = token_data[
-                        "file_extensions"
-                    ]
-
-                    master_report[token_name]["loc_changes_by_filetype"] = token_data[
-                        "loc_changes_by_filetype"
-                    ]
-
-                    master_report[token_name]["active_repos"] = token_data[
-                        "active_repos"
-                    ]
-
-                    # these don't need to be appended, just assigned
-                    master_report[token_name]["description"] = token_data["description"]
-                    master_report[token_name]["project_created_cmc"] = token_data[
-                        "project_created_cmc"
-                    ]
+def _save_duration_history(s3_client, history: Dict[str, Dict]):
+    s3_client.put_object(
+        Bucket="coincommit", Key=DURATION_HISTORY_KEY, Body=json.dumps(history).encode("utf-8")
+    )
+    print(f"saved duration history for {len(history)} repos")
+
 
+def _upload_daily_report(
+    aggregate: Dict[str, TokenStats], report_date: datetime, with_sketches: bool = False, s3_client=None
+):
+    s3_client = s3_client if s3_client is not None else _report_fetch_client()
     report_date_str = report_date.strftime("%Y-%m-%d")
+    master_report = serialize_report(aggregate)
     master_report_local_path = f"/tmp/{report_date_str}.json"
     with open(master_report_local_path, "w") as fp:
         json.dump(master_report, fp, indent=2)
         print(f"dumped report to {master_report_local_path}")
 
     object_name = f"reports/{report_date_str}/{report_date_str}.json"
-    s3_client.Bucket("coincommit").upload_file(master_report_local_path, object_name)
+    _upload_file(s3_client, master_report_local_path, object_name)
+
+    # sketches go in a sidecar so the daily report itself stays the same size in sketch mode
+    if with_sketches:
+        sketches_local_path = f"/tmp/{report_date_str}.sketches.json"
+        with open(sketches_local_path, "w") as fp:
+            json.dump(serialize_sketches(aggregate), fp, separators=(",", ":"))
+        sketches_object_name = f"reports/{report_date_str}/{report_date_str}.sketches.json"
+        _upload_file(s3_client, sketches_local_path, sketches_object_name)
+    return master_report
+
+
+def join_worker_reports(results: str, report_date: str):
+    """
+    Join finished worker results after the fact, master_lambda_handler merges them as workers return instead
+    """
+    fetch_client = _report_fetch_client()
+    report_paths = []
+    durations = []
+    for worker_result in results:
+        decoded_result = json.loads(worker_result.decode("utf-8"))
+        _record_duration(durations, decoded_result)
+        report_paths.append(decoded_result["report_path"])
+
+    aggregate = {}
+    # worker reports are only ever read once, don't let them push daily reports out of the cache
+    for _, worker_report in _fetch_reports(fetch_client, report_paths, cache=False):
+        with span("merge"):
+            add_report(aggregate, worker_report)
+
+    master_report = _upload_daily_report(aggregate, report_date)
     print("durations: ", durations)
+    return master_report
 
 
-def dump_empty_report(report_date: datetime):
+def dump_empty_report(report_date: datetime, s3_client=None):
+    s3_client = s3_client if s3_client is not None else _report_fetch_client()
     report_date_str = report_date.strftime("%Y-%m-%d")
 
     master_report = {}
@@ -274,70 +425,673 @@ def dump_empty_report(report_date: datetime):
         print(f"dumped EMPTY report to {master_report_local_path}")
 
     object_name = f"reports/{report_date_str}/{report_date_str}.json"
-    s3_client.Bucket("coincommit").upload_file(master_report_local_path, object_name)
+    _upload_file(s3_client, master_report_local_path, object_name)
+
 
-def _get_date_range(days: int):
+def _as_date(day) -> date:
+    return day.date() if isinstance(day, datetime) else day
+
+
+def _get_date_range(days: int, end_date: Optional[date] = None):
     """
-    Generator function to yield dates for the given range.
+    Generator function to yield dates for the given range, ending on end_date (today if not given).
     """
-    end_date = datetime.now().date()
+    end_date = _as_date(end_date) if end_date is not None else datetime.now().date()
     start_date = end_date - timedelta(days=days)
-    
+
     for n in range((end_date - start_date).days + 1):
         yield (start_date + timedelta(n)).strftime("%Y-%m-%d")
 
-def _generate_windowed_report(range_days, report_name):
-    today_str = datetime.now().date().strftime("%Y-%m-%d")
-    report_range = _get_date_range(days=range_days)
+
+def _daily_report_path(report_date_str: str) -> str:
+    return f"s3://coincommit/reports/{report_date_str}/{report_date_str}.json"
+
+
+def _slide_window(window: Dict[str, TokenStats], incoming_report, outgoing_report) -> bool:
+    """
+    Move a window forward by one day: add the day that entered the window, subtract the one that left it.
+    False if the outgoing day isn't what was added to the window, it was regenerated since.
+    """
+    add_report(window, incoming_report)
+    return subtract_report(window, outgoing_report)
+
+
+def _generate_windowed_report(
+    range_days,
+    report_name,
+    report_date=None,
+    day_report=None,
+    full_rebuild=False,
+    sketch_mode=False,
+    string_table=False,
+    memory_budget_mb=None,
+    s3_client=None,
+):
+    """
+    Build the window ending on report_date (today if not given). When the previous day's window exists
+    it is slid forward by one day, otherwise every daily report in the window is joined from scratch.
+
+    day_report is the already merged daily report for report_date, if the caller has it in memory.
+    Sketches can't be slid, so sketch_mode always joins the full window.
+    With memory_budget_mb a full join goes through the streaming, spill to disk merge.
+    """
+    report_date = _as_date(report_date) if report_date is not None else datetime.now().date()
+    report_date_str = report_date.strftime("%Y-%m-%d")
+    s3_client = s3_client if s3_client is not None else _report_fetch_client()
+
+    if sketch_mode:
+        return join_reports(
+            [_daily_report_path(day_str) for day_str in _get_date_range(days=range_days, end_date=report_date)],
+            report_date_str=report_date_str,
+            report_name=report_name,
+            sketch_mode=True,
+            string_table=string_table,
+            s3_client=s3_client,
+        )
+
+    if not full_rebuild:
+        previous_date_str = (report_date - timedelta(days=1)).strftime("%Y-%m-%d")
+        outgoing_date_str = (report_date - timedelta(days=range_days + 1)).strftime("%Y-%m-%d")
+        previous_window_path = _window_state_path(previous_date_str, report_name)
+        outgoing_report_path = _daily_report_path(outgoing_date_str)
+        day_report_path = _daily_report_path(report_date_str)
+
+        # fetch everything the slide needs at once, the previous window is usually there
+        report_locations = [previous_window_path, outgoing_report_path]
+        if day_report is None:
+            report_locations.append(day_report_path)
+        fetched = dict(_fetch_reports(s3_client, report_locations))
+
+        previous_window = fetched.get(previous_window_path)
+        if previous_window is not None:
+            previous_window = load_state(previous_window)
+            print(f"Sliding {report_name} from {previous_date_str} to {report_date_str}")
+            if day_report is None:
+                day_report = fetched.get(day_report_path)
+            outgoing_report = fetched.get(outgoing_report_path)
+
+            if _slide_window(previous_window, day_report, outgoing_report):
+                _upload_report(
+                    s3_client, previous_window, report_date_str, report_name, with_state=True, string_table=string_table
+                )
+                return previous_window
+            print(f"{outgoing_date_str} changed since it entered {report_name}, rebuilding the full window")
+        else:
+            print(f"No {report_name} state for {previous_date_str}, rebuilding the full window")
+
     s3_report_paths = [
-        f"s3://coincommit/reports/{report_date_str}/{report_date_str}.json"
-        for report_date_str in report_range
+        _daily_report_path(day_str)
+        for day_str in _get_date_range(days=range_days, end_date=report_date)
     ]
-    join_reports(
-        s3_report_paths, report_date_str=today_str, report_name=report_name
+    if memory_budget_mb is not None:
+        return join_reports_streaming(
+            s3_report_paths,
+            report_date_str=report_date_str,
+            report_name=report_name,
+            memory_budget_mb=memory_budget_mb,
+            with_state=True,
+            s3_client=s3_client,
+        )
+    return join_reports(
+        s3_report_paths,
+        report_date_str=report_date_str,
+        report_name=report_name,
+        with_state=True,
+        string_table=string_table,
+        s3_client=s3_client,
     )
 
-def master_lambda_handler(event, context):
-    secrets: Dict[str, str] = get_secrets()
 
-    if "backfilling" in event:
-        backfilling = bool(event["backfilling"])
-    else:
-        backfilling = False
+def backfill_windowed_reports(start_date, end_date, range_days, report_name, string_table=False, s3_client=None):
+    """
+    Regenerate the window report for every date in [start_date, end_date] in one sliding pass.
+    Each daily report is downloaded once and dropped as soon as it leaves the window.
+    """
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+    s3_client = s3_client if s3_client is not None else _report_fetch_client()
+
+    first_window = list(_get_date_range(days=range_days, end_date=start_date))
+    daily_reports = {
+        report_location.split("/")[-2]: report
+        for report_location, report in _fetch_reports(
+            s3_client, [_daily_report_path(day_str) for day_str in first_window]
+        )
+    }
 
-    start = time.time()
-    if "start_date" in event and "end_date" in event:
-        # pass in start and end to orchestrator for backfilling
-        start_date: datetime = datetime.strptime(event["start_date"], "%Y-%m-%d")
-        end_date: datetime = datetime.strptime(event["end_date"], "%Y-%m-%d")
-        print(
-            f'Dates Passed In: orchestrating for {start_date.strftime("%Y-%m-%d")} thru {end_date.strftime("%Y-%m-%d")}'
+    window = {}
+    for day_str in first_window:
+        add_report(window, daily_reports.get(day_str))
+    _upload_report(
+        s3_client, window, start_date.strftime("%Y-%m-%d"), report_name, with_state=True, string_table=string_table
+    )
+
+    for n in range(1, (end_date - start_date).days + 1):
+        report_date = start_date + timedelta(days=n)
+        report_date_str = report_date.strftime("%Y-%m-%d")
+        outgoing_date_str = (report_date - timedelta(days=range_days + 1)).strftime("%Y-%m-%d")
+
+        day_report = _download_report(s3_client, _daily_report_path(report_date_str))
+        if day_report is not None:
+            daily_reports[report_date_str] = day_report
+
+        if not _slide_window(window, day_report, daily_reports.pop(outgoing_date_str, None)):
+            print(f"{outgoing_date_str} didn't subtract cleanly from {report_name}, regenerated during the backfill?")
+        _upload_report(
+            s3_client, window, report_date_str, report_name, with_state=True, string_table=string_table
+        )
+
+    print(f"backfilled {report_name} for {start_date} thru {end_date}")
+
+
+def _later_window_states(s3_client, report_date, range_days: int) -> Dict[str, List[date]]:
+    """
+    Dates in (report_date, report_date + range_days] that have a window state, by report name. Those windows were
+    slid from a version of report_date's daily report.
+    """
+    report_date = _as_date(report_date)
+    last_date_str = (report_date + timedelta(days=range_days)).strftime("%Y-%m-%d")
+    states: Dict[str, List[date]] = {}
+    # "~" sorts after every file name, so the listing starts at the next day's folder
+    start_after = f"reports/{report_date.strftime('%Y-%m-%d')}/~"
+    kwargs = {"Bucket": "coincommit", "Prefix": "reports/", "StartAfter": start_after}
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        for s3_object in response.get("Contents", []):
+            day_str, file_name = s3_object["Key"][len("reports/") :].split("/", 1)
+            if day_str > last_date_str:
+                return states
+            if file_name.endswith(".state.json") and "/" not in file_name:
+                report_name = file_name[: -len(".state.json")]
+                states.setdefault(report_name, []).append(datetime.strptime(day_str, "%Y-%m-%d").date())
+        if not response.get("IsTruncated"):
+            return states
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def _rebuild_windows_covering(report_date, string_table=False, s3_client=None):
+    """
+    Rebuild the windows after report_date that include it, once its daily report was regenerated. Left alone they
+    would keep the old version and subtract the new one when it leaves them.
+    """
+    report_date = _as_date(report_date)
+    s3_client = s3_client if s3_client is not None else _report_fetch_client()
+    states = _later_window_states(s3_client, report_date, 30)
+    for range_days, report_name in ((7, "weekly_raw"), (30, "monthly_raw")):
+        covering = [day for day in states.get(report_name, []) if day <= report_date + timedelta(days=range_days)]
+        if len(covering) == 0:
+            continue
+        print(f"{report_date} was regenerated, rebuilding {report_name} through {max(covering)}")
+        backfill_windowed_reports(
+            report_date + timedelta(days=1),
+            max(covering),
+            range_days,
+            report_name,
+            string_table=string_table,
+            s3_client=s3_client,
         )
+
+
+def _rollup_key(level: str, key: str, sealed: bool) -> str:
+    # a rollup is sealed once every child of its period is in, only sealed rollups are used to answer ranges
+    suffix = "state.json" if sealed else "partial.state.json"
+    return f"{ROLLUP_PREFIX}{level}/{key}.{suffix}"
+
+
+def _list_sealed_rollups(s3_client) -> set:
+    sealed = set()
+    kwargs = {"Bucket": "coincommit", "Prefix": ROLLUP_PREFIX}
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        for s3_object in response.get("Contents", []):
+            level, file_name = s3_object["Key"][len(ROLLUP_PREFIX) :].split("/", 1)
+            if file_name.endswith(".state.json") and not file_name.endswith(".partial.state.json"):
+                sealed.add((level, file_name[: -len(".state.json")]))
+        if not response.get("IsTruncated"):
+            return sealed
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+
+def _load_rollup(s3_client, level: str, key: str) -> Optional[Dict]:
+    for sealed in (True, False):
+        rollup = _download_report(s3_client, f"s3://coincommit/{_rollup_key(level, key, sealed)}")
+        if rollup is not None:
+            return rollup
+    return None
+
+
+def _rollup_aggregate(rollup: Dict) -> Dict[str, TokenStats]:
+    return load_state(decode_report(rollup["state"]))
+
+
+def _save_rollup(s3_client, level: str, key: str, children: List[str], aggregate, sealed: bool):
+    rollup = {
+        "level": level,
+        "period": key,
+        "children": sorted(children),
+        "sealed": sealed,
+        "state": encode_report(serialize_state(aggregate)),
+    }
+    s3_client.put_object(Bucket="coincommit", Key=_rollup_key(level, key, sealed), Body=json.dumps(rollup))
+    if sealed:
+        s3_client.delete_object(Bucket="coincommit", Key=_rollup_key(level, key, sealed=False))
+    print(f"saved {'sealed' if sealed else 'partial'} {level} rollup {key} with {len(children)} pieces")
+
+
+def _child_aggregate(s3_client, level: str, key: str) -> Optional[Dict[str, TokenStats]]:
+    if level == "day":
+        report = _download_report(s3_client, _daily_report_path(key))
+        return add_report({}, report) if report is not None else None
+    rollup = _load_rollup(s3_client, level, key)
+    return _rollup_aggregate(rollup) if rollup is not None else None
+
+
+def _add_to_rollup(s3_client, level: str, key: str, child_key: str, child_aggregate) -> Tuple[bool, Dict]:
+    """
+    Fold one child (a day, month or quarter) into its rollup, returns whether the rollup is sealed and its aggregate
+    """
+    rollup = _load_rollup(s3_client, level, key)
+    if rollup is None:
+        children, aggregate = [], {}
+    elif child_key in rollup["children"]:
+        # the child was regenerated, its old version can't be taken out so rebuild from the other children
+        print(f"{child_key} is already in {level} rollup {key}, rebuilding it")
+        children, aggregate = [], {}
+        for other_key in rollup["children"]:
+            if other_key == child_key:
+                continue
+            other_aggregate = _child_aggregate(s3_client, CHILD_LEVEL[level], other_key)
+            if other_aggregate is not None:
+                aggregate = merge_aggregates([aggregate, other_aggregate])
+                children.append(other_key)
     else:
-        # just use today's date
-        end_date: datetime = datetime.strptime(
-            datetime.now().strftime("%Y-%m-%d"), "%Y-%m-%d"
+        children, aggregate = rollup["children"], _rollup_aggregate(rollup)
+
+    aggregate = merge_aggregates([aggregate, child_aggregate])
+    children.append(child_key)
+    # children can arrive in any order (backfills, retries), so only a rollup that has all of them is complete
+    sealed = set(child_keys(level, key)) <= set(children)
+    _save_rollup(s3_client, level, key, children, aggregate, sealed)
+    if not sealed and rollup is not None and rollup["sealed"]:
+        # a rebuild lost a child, the sealed copy would otherwise shadow this one
+        s3_client.delete_object(Bucket="coincommit", Key=_rollup_key(level, key, sealed=True))
+    return sealed, aggregate
+
+
+def update_rollups(report_date, day_report: Optional[Dict], s3_client=None):
+    """
+    Add a daily report to its week and month rollups, and carry sealed months up into quarters and years
+    """
+    s3_client = s3_client if s3_client is not None else _report_fetch_client()
+    day = _as_date(report_date)
+    day_key = period_key("day", day)
+
+    _add_to_rollup(s3_client, "week", period_key("week", day), day_key, add_report({}, day_report))
+    month_sealed, month_aggregate = _add_to_rollup(
+        s3_client, "month", period_key("month", day), day_key, add_report({}, day_report)
+    )
+    if not month_sealed:
+        return
+    quarter_sealed, quarter_aggregate = _add_to_rollup(
+        s3_client, "quarter", period_key("quarter", day), period_key("month", day), month_aggregate
+    )
+    if not quarter_sealed:
+        return
+    _add_to_rollup(s3_client, "year", period_key("year", day), period_key("quarter", day), quarter_aggregate)
+
+
+def range_report(start_date, end_date, report_name: str) -> Dict[str, TokenStats]:
+    """
+    Report for any [start_date, end_date] built from the fewest sealed rollups plus daily reports for the edges
+    """
+    start_date, end_date = _as_date(start_date), _as_date(end_date)
+    s3_client = _report_fetch_client()
+
+    sealed = _list_sealed_rollups(s3_client)
+    pieces = decompose_range(start_date, end_date, lambda level, key: (level, key) in sealed)
+    print(f"{start_date} thru {end_date} is made of {len(pieces)} pieces: {pieces}")
+
+    locations = {}
+    for level, key in pieces:
+        if level == "day":
+            locations[_daily_report_path(key)] = level
+        else:
+            locations[f"s3://coincommit/{_rollup_key(level, key, sealed=True)}"] = level
+
+    aggregate = {}
+    for location, report in _fetch_reports(s3_client, list(locations)):
+        if locations[location] == "day":
+            add_report(aggregate, report)
+        else:
+            aggregate = merge_aggregates([aggregate, _rollup_aggregate(report)])
+
+    _upload_report(s3_client, aggregate, end_date.strftime("%Y-%m-%d"), report_name)
+    return aggregate
+
+
+def _finish_daily_reports(
+    daily_aggregate: Dict[str, TokenStats],
+    has_results: bool,
+    end_date: datetime,
+    options: Dict,
+    windows: bool = True,
+    s3_client=None,
+):
+    """
+    Everything after the worker reports are joined: the daily report, rollups and the weekly/monthly windows
+    """
+    s3_client = s3_client if s3_client is not None else _report_fetch_client()
+    if not has_results:
+        dump_empty_report(report_date=end_date, s3_client=s3_client)
+        # an empty day still has to count towards sealing its rollups
+        with span("update_rollups"):
+            update_rollups(end_date, {}, s3_client=s3_client)
+        if windows:
+            with span("rebuild_later_windows"):
+                _rebuild_windows_covering(end_date, string_table=options["string_table"], s3_client=s3_client)
+        return
+
+    with span("upload_daily_report"):
+        daily_report = _upload_daily_report(
+            daily_aggregate, report_date=end_date, with_sketches=options["sketch_mode"], s3_client=s3_client
         )
-        start_date = end_date - timedelta(1)
-        start_date: datetime = datetime.strptime(
-            start_date.strftime("%Y-%m-%d"), "%Y-%m-%d"
+
+    # keep the week/month/quarter/year rollups current
+    with span("update_rollups"):
+        update_rollups(end_date, daily_report, s3_client=s3_client)
+    if not windows:
+        return
+
+    # make weekly raw report
+    with span("window_report", report_name="weekly_raw"):
+        _generate_windowed_report(
+            7,
+            "weekly_raw",
+            report_date=end_date,
+            day_report=daily_report,
+            full_rebuild=options["rebuild_windows"],
+            string_table=options["string_table"],
+            memory_budget_mb=options["merge_memory_budget_mb"],
+            s3_client=s3_client,
         )
 
-        print(
-            f"Today's date inferred: orchestrating for {start_date.strftime('%Y-%m-%d')} thru {end_date.strftime('%Y-%m-%d')}"
+    # make monthly raw report
+    with span("window_report", report_name="monthly_raw"):
+        _generate_windowed_report(
+            30,
+            "monthly_raw",
+            report_date=end_date,
+            day_report=daily_report,
+            full_rebuild=options["rebuild_windows"],
+            sketch_mode=options["sketch_mode"],
+            string_table=options["string_table"],
+            memory_budget_mb=options["merge_memory_budget_mb"],
+            s3_client=s3_client,
         )
 
-    orch = Orchestrator(
-        start_date=start_date,
-        end_date=end_date,
-        sts_secrets=secrets,
-        lambda_mem_limit_mb=800.0,
-        backfilling=backfilling,
-        download_manifest_from_s3=True,
+    # a past day run again, by a resume, a forced backfill or a rerun, is in windows already built after it
+    with span("rebuild_later_windows"):
+        _rebuild_windows_covering(end_date, string_table=options["string_table"], s3_client=s3_client)
+
+
+def _save_new_run(
+    s3, run_id: str, repo_url_groups: List[List[str]], start_date: datetime, end_date: datetime, options: Dict
+):
+    save_run(
+        s3,
+        run_id,
+        {
+            "start_date": start_date.strftime("%Y-%m-%d"),
+            "end_date": end_date.strftime("%Y-%m-%d"),
+            "repo_url_groups": repo_url_groups,
+            "options": options,
+            "dispatched_at": time.time(),
+        },
+    )
+
+
+def _report_status_key(report_date_str: str) -> str:
+    return f"reports/{report_date_str}/{report_date_str}.status.json"
+
+
+def _upload_report_status(
+    s3,
+    end_date: datetime,
+    run_id: str,
+    group_count: int,
+    unfinished_groups: List[int],
+    manifest_version: Optional[str] = None,
+):
+    """
+    Sidecar next to the daily report saying whether it covers every repo group, and which manifest it was scraped with
+    """
+    report_date_str = end_date.strftime("%Y-%m-%d")
+    status = {
+        "run_id": run_id,
+        "partial": len(unfinished_groups) > 0,
+        "total_groups": group_count,
+        "unfinished_groups": unfinished_groups,
+        "manifest_version": manifest_version,
+        "generated_at": datetime.now().isoformat(),
+    }
+    s3.put_object(
+        Bucket="coincommit",
+        Key=_report_status_key(report_date_str),
+        Body=json.dumps(status).encode("utf-8"),
+    )
+
+
+def _manifest_version(s3) -> Optional[str]:
+    # the ETag of the manifest group_repos downloads
+    try:
+        return s3.head_object(Bucket="coincommit", Key=REPO_MANIFEST_KEY)["ETag"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return None
+        raise e
+
+
+def _load_activity_index(s3_client) -> Dict[str, Dict]:
+    index_bytes = get_cache().get_bytes(s3_client, "coincommit", ACTIVITY_INDEX_KEY)
+    if index_bytes is None:
+        return {}
+    return json.loads(index_bytes)
+
+
+def _drop_inactive_repos(repo_url_groups, repo_group_sizes, start_date, secrets):
+    """
+    Refresh the activity index for the candidate repos and drop the ones with no pushes since start_date
+    """
+    s3 = _report_fetch_client()
+    activity_index = _load_activity_index(s3)
+    repo_urls = [repo_url for group in repo_url_groups for repo_url in group]
+    # the GitHub token is whichever coincommitsecrets entry ACTIVITY_TOKEN_SECRET_KEY names
+    github_token = secrets[ACTIVITY_TOKEN_SECRET_KEY] if ACTIVITY_TOKEN_SECRET_KEY is not None else None
+    if refresh_index(activity_index, repo_urls, token=github_token) > 0:
+        s3.put_object(Bucket="coincommit", Key=ACTIVITY_INDEX_KEY, Body=json.dumps(activity_index).encode("utf-8"))
+
+    active_groups, active_sizes, dropped = filter_active(repo_url_groups, repo_group_sizes, activity_index, start_date)
+    print(
+        f"activity index: dropped {dropped} of {len(repo_urls)} repos with no pushes since {start_date}, "
+        f"{len(repo_url_groups)} -> {len(active_groups)} groups"
+    )
+    return active_groups, active_sizes
+
+
+def _repo_groups_dir(manifest_version: str) -> str:
+    # ETags come quoted
+    return REPO_GROUPS_PREFIX + manifest_version.strip('"') + "/"
+
+
+def _repo_groups_key(manifest_version: str, start_date, end_date, backfilling) -> str:
+    window = [start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")]
+    key = json.dumps([manifest_version, *window, backfilling, LAMBDA_MEM_LIMIT_MB])
+    return f"{_repo_groups_dir(manifest_version)}{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+
+def _prune_repo_groups(s3, manifest_version: str) -> int:
+    """
+    Delete the groups saved for earlier manifests, which no run looks up again. Returns the number deleted.
+    """
+    current = _repo_groups_dir(manifest_version)
+    stale = []
+    kwargs = {"Bucket": "coincommit", "Prefix": REPO_GROUPS_PREFIX}
+    while True:
+        response = s3.list_objects_v2(**kwargs)
+        for s3_object in response.get("Contents", []):
+            if not s3_object["Key"].startswith(current):
+                stale.append(s3_object["Key"])
+        if not response.get("IsTruncated"):
+            break
+        kwargs["ContinuationToken"] = response["NextContinuationToken"]
+    for key in stale:
+        s3.delete_object(Bucket="coincommit", Key=key)
+    return len(stale)
+
+
+def _group_repos_from_index(s3, start_date, end_date, backfilling):
+    """
+    Size based repo groups streamed from the indexed manifest, with the size of every repo in them.
+    None if the index can't stand in for the Orchestrator's grouping: none is published, it was built from another
+    manifest than the published one, or the run is a backfill or a window that ends before the published manifest,
+    which the Orchestrator plans against the manifest as it was.
+    """
+    if backfilling:
+        print("backfilling, grouping from the manifest")
+        return None
+    versions = load_versions(s3)
+    if versions["sha256"] is None:
+        print("no published manifest version, grouping from the manifest")
+        return None
+    published_on = datetime.strptime(versions["versions"][-1]["date"], "%Y-%m-%d")
+    if end_date < published_on:
+        print(f"window ends before the manifest of {versions['versions'][-1]['date']}, grouping from the manifest")
+        return None
+
+    with get_cache().pinned(s3, "coincommit", MANIFEST_INDEX_KEY) as index_path:
+        if index_path is None:
+            print("no manifest index, grouping from the manifest")
+            return None
+        try:
+            index = ManifestIndex(index_path)
+        except ValueError as e:
+            print(f"unusable manifest index, grouping from the manifest: {e}")
+            return None
+        with span("manifest_index_grouping"), index:
+            if index.meta["manifest_sha256"] != versions["sha256"]:
+                print(
+                    f"manifest index is of manifest {index.meta['manifest_sha256'][:12]}, "
+                    f"published is {versions['sha256'][:12]}, grouping from the manifest"
+                )
+                return None
+            # repos whose last push is before the window can't have commits in it
+            candidates = index.iter_repos(active_since=start_date - ACTIVITY_SLACK, largest_first=True)
+            repo_sizes = {}
+
+            def sized(candidates):
+                for repo_url, size_mb, last_activity in candidates:
+                    repo_sizes[repo_url] = size_mb
+                    yield repo_url, size_mb, last_activity
+
+            urls, group_sizes = pack_repos(sized(candidates), LAMBDA_MEM_LIMIT_MB)
+    print(f"grouped {sum(len(group) for group in urls)} of {index.meta['repos']} repos from the manifest index")
+    return urls, group_sizes, repo_sizes
+
+
+def _group_repos(
+    start_date,
+    end_date,
+    secrets,
+    backfilling,
+    manifest_version: Optional[str] = None,
+    manifest_index: bool = False,
+):
+    """
+    The Orchestrator's size based repo groups. While the manifest is unchanged, groups saved by an earlier run for
+    the same window are reused and the manifest isn't downloaded at all.
+    With manifest_index the groups are packed from the indexed manifest instead.
+    Returns (groups, group sizes, repo sizes), repo sizes are only known for groups from the index and None otherwise.
+    """
+    s3 = _report_fetch_client()
+    if manifest_index:
+        groups = _group_repos_from_index(s3, start_date, end_date, backfilling)
+        if groups is not None:
+            return groups
+    groups_key = None
+    if REPO_GROUPS_CACHE:
+        manifest_version = manifest_version if manifest_version is not None else _manifest_version(s3)
+        if manifest_version is not None:
+            groups_key = _repo_groups_key(manifest_version, start_date, end_date, backfilling)
+            # immutable once written, so a warm container revalidates it with a 304
+            groups_bytes = get_cache().get_bytes(s3, "coincommit", groups_key)
+            if groups_bytes is not None:
+                groups = json.loads(groups_bytes)
+                count("repo_groups_cache_hits")
+                print(f"reusing repo groups for manifest {manifest_version}")
+                return groups["urls"], groups["sizes"], None
+
+    # download_manifest_from_s3: the constructor fetches the repo manifest
+    with span("manifest_download"):
+        orch = Orchestrator(
+            start_date=start_date,
+            end_date=end_date,
+            sts_secrets=secrets,
+            lambda_mem_limit_mb=LAMBDA_MEM_LIMIT_MB,
+            backfilling=backfilling,
+            download_manifest_from_s3=True,
+        )
+    with span("group_repos"):
+        urls, group_sizes = orch.group_repos()
+
+    # only saved if the manifest didn't change under the download
+    if groups_key is not None and _manifest_version(s3) == manifest_version:
+        s3.put_object(
+            Bucket="coincommit",
+            Key=groups_key,
+            Body=json.dumps({"manifest_version": manifest_version, "urls": urls, "sizes": group_sizes}).encode("utf-8"),
+        )
+        pruned = _prune_repo_groups(s3, manifest_version)
+        if pruned:
+            print(f"deleted {pruned} repo groups saved for earlier manifests")
+    return urls, group_sizes, None
+
+
+def _plan_repo_groups(
+    start_date,
+    end_date,
+    secrets,
+    backfilling,
+    duration_history,
+    context,
+    activity_filter: bool = False,
+    manifest_version: Optional[str] = None,
+    manifest_index: bool = False,
+) -> List[List[str]]:
+    urls, group_sizes, repo_sizes = _group_repos(
+        start_date, end_date, secrets, backfilling, manifest_version=manifest_version, manifest_index=manifest_index
     )
-    urls, group_sizes = orch.group_repos()
     repo_url_groups: List[List[str]] = urls
     repo_group_sizes: List[float] = group_sizes
+
+    # groups from the index already leave out repos last pushed before the window
+    if activity_filter and repo_sizes is None and len(repo_url_groups) > 0:
+        with span("activity_filter", repos=sum(len(group) for group in repo_url_groups)):
+            repo_url_groups, repo_group_sizes = _drop_inactive_repos(
+                repo_url_groups, repo_group_sizes, start_date, secrets
+            )
+
+    # regroup by predicted runtime so the slowest worker finishes as early as possible
+    if len(duration_history) > 0 and len(repo_url_groups) > 0:
+        with span("plan_groups"):
+            planned_groups, planned_sizes = plan_groups(
+                repo_url_groups, repo_group_sizes, duration_history, LAMBDA_MEM_LIMIT_MB, repo_sizes=repo_sizes
+            )
+        size_makespan = makespan(repo_url_groups, duration_history)
+        planned_makespan = makespan(planned_groups, duration_history)
+        print(
+            f"duration aware grouping: predicted makespan {round(size_makespan, 1)}s -> {round(planned_makespan, 1)}s"
+        )
+        if planned_makespan < size_makespan:
+            repo_url_groups, repo_group_sizes = planned_groups, planned_sizes
     print(
         f"calculated repo groupings for workers, seconds remaining: {context.get_remaining_time_in_millis()/1000.0}"
     )
@@ -349,74 +1103,789 @@ def master_lambda_handler(event, context):
         print(
             f"\nsending {len(repo_group)} repos to worker {i}, max potential size: {round(group_size,2)}mb"
         )
-
-    def invoke_worker(repo_group, worker_id):
+    return repo_url_groups
+
+
+def dispatch_async_run(
+    run_id: str,
+    repo_url_groups: List[List[str]],
+    start_date: datetime,
+    end_date: datetime,
+    options: Dict,
+    s3=None,
+    invoke_client=None,
+    dynamodb=None,
+):
+    """
+    Save and register the run, then start every worker with an Event invoke. Workers report to
+    runs/{run_id}/results/ and count themselves in the runs table.
+    """
+    s3 = s3 if s3 is not None else _report_fetch_client()
+    dynamodb = dynamodb if dynamodb is not None else _runs_client()
+    _save_new_run(s3, run_id, repo_url_groups, start_date, end_date, options)
+    register_run(dynamodb, run_id, len(repo_url_groups), time.time() + ASYNC_RUN_DEADLINE_SECS)
+    for worker_id, repo_group in enumerate(repo_url_groups):
         params = {
             "repos_responsible_for": repo_group,
             "start_date": start_date.strftime("%Y-%m-%d"),
             "end_date": end_date.strftime("%Y-%m-%d"),
             "worker_id": worker_id,
+            "run_id": run_id,
+            "group_count": len(repo_url_groups),
+        }
+        _invoke_with_retry(WORKER_FUNCTION, params, invocation_type="Event", client=invoke_client)
+    print(f"run {run_id}: dispatched {len(repo_url_groups)} workers")
+
+
+def reduce_async_run(run_id: str, s3=None, completions: Optional[Dict[int, Dict]] = None) -> Dict:
+    """
+    Join the worker reports of an async run and generate the daily, rollup and window reports from them
+    """
+    s3 = s3 if s3 is not None else _report_fetch_client()
+    run = load_run(s3, run_id)
+    if run is None:
+        raise ValueError(f"no async run {run_id}")
+    if completions is None:
+        completions = list_completions(s3, run_id)
+
+    valid_records = {
+        worker_id: record for worker_id, record in completions.items() if "report_path" in record
+    }
+    invalid_records = [record for record in completions.values() if "report_path" not in record]
+    missing = [i for i in range(len(run["repo_url_groups"])) if i not in completions]
+    print(f"run {run_id}: {len(valid_records)} valid, {len(invalid_records)} invalid, {len(missing)} missing")
+
+    daily_aggregate = {}
+    durations = []
+    report_paths = [record["report_path"] for record in valid_records.values()]
+    for _, worker_report in _fetch_reports(s3, report_paths, cache=False):
+        with span("merge"):
+            add_report(daily_aggregate, worker_report)
+    for record in valid_records.values():
+        _record_duration(durations, record)
+
+    if len(valid_records) > 0:
+        print("durations: ", durations)
+        duration_history = _load_duration_history(s3)
+        worker_durations = {
+            int(worker_id): float(record["worker_duration_secs"])
+            for worker_id, record in valid_records.items()
+            if not record.get("duration_recorded")
+        }
+        _save_duration_history(s3, record_durations(duration_history, run["repo_url_groups"], worker_durations))
+
+    end_date = datetime.strptime(run["end_date"], "%Y-%m-%d")
+    get_tracer().set_property("run_id", run_id)
+    with span("finish_daily_reports"):
+        _finish_daily_reports(daily_aggregate, len(valid_records) > 0, end_date, run["options"], s3_client=s3)
+    unfinished_groups = [i for i in range(len(run["repo_url_groups"])) if i not in valid_records]
+    _upload_report_status(s3, end_date, run_id, len(run["repo_url_groups"]), unfinished_groups)
+    return {
+        "run_id": run_id,
+        "results_count": len(completions),
+        "valid_results_count": len(valid_records),
+        "invalid_results_count": len(invalid_records),
+        "invalid_results": invalid_records,
+        "missing_groups": missing,
+        "duration": round(time.time() - run["dispatched_at"], 3),
+        "report": f'{run["end_date"]}.json',
+    }
+
+
+def _invoke_with_retry(function_name: str, payload: Dict, invocation_type: str = "RequestResponse", client=None):
+    """
+    Lambda invoke, throttles are retried with full jitter exponential backoff
+    """
+    client = client if client is not None else _lambda_client()
+    for attempt in range(INVOKE_MAX_ATTEMPTS):
+        try:
+            return client.invoke(
+                FunctionName=function_name,
+                InvocationType=invocation_type,
+                Payload=json.dumps(payload),
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in THROTTLE_ERROR_CODES or attempt == INVOKE_MAX_ATTEMPTS - 1:
+                raise e
+            backoff = random.uniform(0, min(INVOKE_BACKOFF_CAP_SECS, INVOKE_BACKOFF_BASE_SECS * 2**attempt))
+            print(f"invoke throttled ({e.response['Error']['Code']}), retrying in {round(backoff, 1)}s")
+            count("worker_invoke_throttles")
+            time.sleep(backoff)
+
+
+def _invoke_worker(
+    repo_group: List[str],
+    worker_id: int,
+    start_date: datetime,
+    end_date: datetime,
+    run_id: str,
+    group_count: int,
+    fetch_client,
+    worker_slots: Optional[threading.BoundedSemaphore] = None,
+    invoke_client=None,
+):
+    """
+    Invoke one worker and download its report, returns (worker_result, worker_report or None).
+    worker_slots caps invocations shared by several runs. invoke_client should have a connection per in-flight invoke.
+    """
+    params = {
+        "repos_responsible_for": repo_group,
+        "start_date": start_date.strftime("%Y-%m-%d"),
+        "end_date": end_date.strftime("%Y-%m-%d"),
+        "worker_id": worker_id,
+        # workers checkpoint their own completion, so groups still running at the deadline aren't lost
+        "run_id": run_id,
+        "group_count": group_count,
+    }
+    if worker_slots is not None:
+        with worker_slots, span("worker_invoke", worker_id=worker_id, repos=len(repo_group)):
+            response = _invoke_with_retry(WORKER_FUNCTION, params, client=invoke_client)
+            worker_result = response["Payload"].read()
+    else:
+        with span("worker_invoke", worker_id=worker_id, repos=len(repo_group)):
+            response = _invoke_with_retry(WORKER_FUNCTION, params, client=invoke_client)
+            worker_result = response["Payload"].read()
+
+    # download the worker's report in this thread so it is ready to merge when the worker returns
+    decoded_result = json.loads(worker_result.decode("utf-8"))
+    worker_report = None
+    if isinstance(decoded_result, dict) and "report_path" in decoded_result:
+        worker_report = _download_report(fetch_client, decoded_result["report_path"], cache=False)
+    return worker_result, worker_report
+
+
+def _latency_percentile(latencies: List[float], percentile: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+
+def _fan_out_workers(
+    invoke_worker,
+    repo_url_groups: List[List[str]],
+    max_inflight: int = MAX_INFLIGHT_WORKERS,
+    hedge_percentile: Optional[float] = HEDGE_PERCENTILE,
+    worker_ids: Optional[List[int]] = None,
+    seconds_left=None,
+    predicted_secs: Optional[List[float]] = None,
+):
+    """
+    Run invoke_worker(repo_group, worker_id) for every group (or just worker_ids) with at most max_inflight calls
+    running at once, yielding (worker_id, (worker_result, worker_report)) as each group finishes.
+
+    Once a group has been running longer than hedge_percentile of the finished groups' latencies a duplicate is
+    launched, whichever copy returns a report first wins. A group that fails without a duplicate is invoked once more,
+    it only counts as failed once both copies have. Losing copies are left to finish in the background.
+
+    With seconds_left (time left before the deadline), groups whose predicted_secs don't fit aren't started and the
+    generator stops once the deadline passes, whatever is still running is abandoned.
+    """
+    pending = list(worker_ids) if worker_ids is not None else list(range(len(repo_url_groups)))
+    pending.reverse()
+    target = len(pending)
+    running = {}  # future -> (worker_id, started)
+    copies = {worker_id: 0 for worker_id in pending}
+    skipped = 0
+    hedged = set()
+    finished = set()
+    latencies = []
+
+    executor = ThreadPoolExecutor(max_workers=max_inflight)
+
+    def submit(worker_id):
+        running[executor.submit(invoke_worker, repo_url_groups[worker_id], worker_id)] = (worker_id, time.time())
+        copies[worker_id] += 1
+
+    try:
+        while len(finished) + skipped < target:
+            while pending and len(running) < max_inflight:
+                worker_id = pending.pop()
+                if seconds_left is not None and predicted_secs is not None:
+                    if seconds_left() < predicted_secs[worker_id]:
+                        print(f"worker {worker_id} predicted to take {round(predicted_secs[worker_id])}s, "
+                              f"past the deadline, leaving it for a resume")
+                        skipped += 1
+                        continue
+                submit(worker_id)
+            if len(running) == 0:
+                continue
+
+            if seconds_left is not None and seconds_left() <= 0:
+                print(f"deadline reached with {len(running)} invocations running, {len(pending)} groups not started")
+                return
+
+            done, _ = wait(list(running), timeout=FAN_OUT_POLL_SECS, return_when=FIRST_COMPLETED)
+            for future in done:
+                worker_id, started = running.pop(future)
+                copies[worker_id] -= 1
+                if worker_id in finished:
+                    # the other copy of a hedged group already won
+                    continue
+
+                try:
+                    worker_result, worker_report = future.result()
+                except Exception as e:
+                    print(f"worker {worker_id} invoke failed: {e}")
+                    worker_result, worker_report = json.dumps({"error": str(e)}).encode("utf-8"), None
+
+                if worker_report is None and copies[worker_id] > 0:
+                    # a hedge is still running, wait for it
+                    continue
+                if worker_report is None and worker_id not in hedged:
+                    # failed without a second copy, give it one more go
+                    print(f"worker {worker_id} returned no report, invoking it again")
+                    hedged.add(worker_id)
+                    pending.append(worker_id)
+                    continue
+                finished.add(worker_id)
+                latencies.append(time.time() - started)
+                yield worker_id, (worker_result, worker_report)
+
+            # hedge stragglers, new groups have priority over duplicates
+            if hedge_percentile is None or pending or len(latencies) < HEDGE_MIN_FINISHED:
+                continue
+            threshold = _latency_percentile(latencies, hedge_percentile)
+            if seconds_left is not None and seconds_left() < threshold:
+                # a duplicate wouldn't finish before the deadline
+                continue
+            now = time.time()
+            for worker_id, started in list(running.values()):
+                if len(running) >= max_inflight:
+                    break
+                if worker_id in hedged or worker_id in finished or now - started <= threshold:
+                    continue
+                print(f"worker {worker_id} running {round(now - started)}s, past p{int(hedge_percentile * 100)} "
+                      f"of {round(threshold)}s, launching a hedge")
+                count("worker_hedges")
+                hedged.add(worker_id)
+                submit(worker_id)
+    finally:
+        executor.shutdown(wait=False)
+
+
+def _day_is_current(s3, report_date_str: str, manifest_version: Optional[str]) -> bool:
+    """
+    True if the day's report is complete and was scraped with the current manifest
+    """
+    try:
+        response = s3.get_object(Bucket="coincommit", Key=_report_status_key(report_date_str))
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return False
+        raise e
+    status = json.loads(response["Body"].read())
+    return not status["partial"] and manifest_version is not None and status.get("manifest_version") == manifest_version
+
+
+# the batch_scraper Orchestrator isn't known to be thread safe, and concurrent days share week/month rollups
+_planning_lock = threading.Lock()
+_finish_lock = threading.Lock()
+
+
+def _backfill_day(
+    day: datetime,
+    secrets: Dict[str, str],
+    duration_history: Dict[str, Dict],
+    options: Dict,
+    worker_slots: threading.BoundedSemaphore,
+    max_inflight: int,
+    seconds_left,
+    manifest_version: Optional[str],
+    context,
+    activity_filter: bool = False,
+    manifest_index: bool = False,
+) -> Dict:
+    """
+    Scrape, join and write one day of a per day backfill: reports/{day}/{day}.json, its status and rollups
+    """
+    start_date, end_date = day - timedelta(1), day
+    report_date_str = end_date.strftime("%Y-%m-%d")
+    run_client = _report_fetch_client()
+    with _planning_lock:
+        repo_url_groups = _plan_repo_groups(
+            start_date,
+            end_date,
+            secrets,
+            True,
+            duration_history,
+            context,
+            activity_filter=activity_filter,
+            manifest_version=manifest_version,
+            manifest_index=manifest_index,
+        )
+
+    run_id = f"{report_date_str}-{context.aws_request_id[0:8]}"
+    if len(repo_url_groups) > 0:
+        _save_new_run(run_client, run_id, repo_url_groups, start_date, end_date, options)
+        claim_reduce(_runs_client(), run_id)
+
+    def invoke_worker(repo_group, worker_id):
+        return _invoke_worker(
+            repo_group,
+            worker_id,
+            start_date,
+            end_date,
+            run_id,
+            len(repo_url_groups),
+            run_client,
+            worker_slots,
+            invoke_client=_lambda_client(max_inflight),
+        )
+
+    daily_aggregate = {}
+    worker_durations = {}
+    # time spent waiting for a shared worker slot would count as latency, so backfill days don't hedge
+    for worker_id, (worker_result, worker_report) in _fan_out_workers(
+        invoke_worker, repo_url_groups, max_inflight=max_inflight, hedge_percentile=None, seconds_left=seconds_left
+    ):
+        if worker_report is None:
+            print(f"{report_date_str} worker {worker_id} returned no report: {worker_result}")
+            continue
+        decoded_result = json.loads(worker_result.decode("utf-8"))
+        # backfill_days saves the duration
+        write_completion(run_client, run_id, worker_id, dict(decoded_result, duration_recorded=True))
+        worker_durations[worker_id] = float(decoded_result["worker_duration_secs"])
+        with span("merge"):
+            add_report(daily_aggregate, worker_report)
+
+    unfinished_groups = [i for i in range(len(repo_url_groups)) if i not in worker_durations]
+    with _finish_lock:
+        _finish_daily_reports(daily_aggregate, len(worker_durations) > 0, end_date, options, windows=False)
+    _upload_report_status(
+        run_client, end_date, run_id, len(repo_url_groups), unfinished_groups, manifest_version=manifest_version
+    )
+    print(f"backfilled {report_date_str}: {len(worker_durations)}/{len(repo_url_groups)} groups")
+    return {
+        "date": report_date_str,
+        "run_id": run_id,
+        "repo_url_groups": repo_url_groups,
+        "worker_durations": worker_durations,
+        "unfinished_groups": unfinished_groups,
+    }
+
+
+def backfill_days(
+    start_date: datetime,
+    end_date: datetime,
+    secrets: Dict[str, str],
+    options: Dict,
+    context,
+    max_concurrent_days: int = BACKFILL_CONCURRENT_DAYS,
+    max_inflight_workers: int = MAX_INFLIGHT_WORKERS,
+    deadline_reserve_secs: float = DEADLINE_RESERVE_SECS,
+    force: bool = False,
+    activity_filter: bool = False,
+    manifest_index: bool = False,
+) -> Dict:
+    """
+    Backfill [start_date, end_date] as one scrape per day, several days at a time under one cap on in-flight workers.
+    Days already scraped in full with the current manifest are skipped, so invoking again with the same range
+    picks up whatever didn't fit before the deadline. Windows are regenerated once every day is in.
+    A day that raises is reported under failed_days with its error and stays in remaining_days.
+    """
+    s3 = _report_fetch_client()
+    manifest_version = _manifest_version(s3)
+    days = [start_date + timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+    todo = [day for day in days if force or not _day_is_current(s3, day.strftime("%Y-%m-%d"), manifest_version)]
+    print(f"backfilling {len(todo)} of {len(days)} days, manifest version {manifest_version}")
+
+    duration_history = _load_duration_history(s3)
+    worker_slots = threading.BoundedSemaphore(max_inflight_workers)
+
+    def seconds_left():
+        return context.get_remaining_time_in_millis() / 1000.0 - deadline_reserve_secs
+
+    def run_day(day):
+        if seconds_left() <= 0:
+            return None
+        return _backfill_day(
+            day,
+            secrets,
+            duration_history,
+            options,
+            worker_slots,
+            max_inflight_workers,
+            seconds_left,
+            manifest_version,
+            context,
+            activity_filter=activity_filter,
+            manifest_index=manifest_index,
+        )
+
+    finished_days = []
+    failed_days = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrent_days, len(todo)))) as executor:
+        futures = {executor.submit(run_day, day): day.strftime("%Y-%m-%d") for day in todo}
+        for future in as_completed(futures):
+            # one failing day must not take the results of the others down with it
+            try:
+                day_result = future.result()
+            except Exception as e:
+                print(f"backfill of {futures[future]} failed: {e}")
+                failed_days[futures[future]] = str(e)
+                continue
+            if day_result is not None:
+                finished_days.append(day_result)
+
+    for day_result in finished_days:
+        record_durations(duration_history, day_result["repo_url_groups"], day_result["worker_durations"])
+    if len(finished_days) > 0:
+        _save_duration_history(s3, duration_history)
+
+    done = {day_result["date"] for day_result in finished_days if len(day_result["unfinished_groups"]) == 0}
+    remaining_days = [day.strftime("%Y-%m-%d") for day in todo if day.strftime("%Y-%m-%d") not in done]
+    if len(remaining_days) == 0 and len(done) > 0:
+        backfill_windowed_reports(start_date, end_date, 7, "weekly_raw", string_table=options["string_table"])
+        backfill_windowed_reports(start_date, end_date, 30, "monthly_raw", string_table=options["string_table"])
+        _rebuild_windows_covering(end_date, string_table=options["string_table"])
+    else:
+        print(f"{len(remaining_days)} days left, invoke again with the same range to finish them")
+
+    return {
+        "backfilled_days": sorted(done),
+        "skipped_days": [day.strftime("%Y-%m-%d") for day in days if day not in todo],
+        "remaining_days": remaining_days,
+        "failed_days": failed_days,
+        "manifest_version": manifest_version,
+    }
+
+
+def master_lambda_handler(event, context):
+    tracer = start_trace("orchestrator", request_id=context.aws_request_id)
+    try:
+        with span("invocation"):
+            return _handle_event(event, context)
+    finally:
+        tracer.flush()
+
+
+def _handle_event(event, context):
+    if "range_report" in event:
+        # answer a custom date range from the rollup pyramid, no scraping
+        range_request = event["range_report"]
+        range_report(
+            datetime.strptime(range_request["start_date"], "%Y-%m-%d"),
+            datetime.strptime(range_request["end_date"], "%Y-%m-%d"),
+            range_request["report_name"],
+        )
+        return {"range_report": f'reports/{range_request["end_date"]}/{range_request["report_name"]}.json'}
+
+    if "reduce_run_id" in event:
+        # the last worker of an async run reports in here
+        return reduce_async_run(event["reduce_run_id"])
+
+    if "sweep_async_runs" in event and bool(event["sweep_async_runs"]):
+        # scheduled: reduce async runs that are past their deadline because a worker never reported
+        return {
+            "reduced_runs": sweep_overdue_runs(_runs_client(), _lambda_client(), context.invoked_function_arn)
         }
-        response = lambda_client.invoke(
-            FunctionName="arn:aws:lambda:us-west-1:665809458133:function:repo-scraper",
-            InvocationType="RequestResponse",
-            Payload=json.dumps(params),
+
+    if "backfill_windows" in event and bool(event["backfill_windows"]):
+        # only regenerate weekly_raw/monthly_raw for an existing range of daily reports
+        start_date: datetime = datetime.strptime(event["start_date"], "%Y-%m-%d")
+        end_date: datetime = datetime.strptime(event["end_date"], "%Y-%m-%d")
+        string_table = "string_table" in event and bool(event["string_table"])
+        backfill_windowed_reports(start_date, end_date, 7, "weekly_raw", string_table=string_table)
+        backfill_windowed_reports(start_date, end_date, 30, "monthly_raw", string_table=string_table)
+        return {"backfilled_windows": f'{event["start_date"]} thru {event["end_date"]}'}
+
+    # cap on concurrent worker invocations
+    if "max_inflight_workers" in event:
+        max_inflight_workers = int(event["max_inflight_workers"])
+    else:
+        max_inflight_workers = MAX_INFLIGHT_WORKERS
+
+    # plan groups from the indexed manifest instead of the Orchestrator's grouping
+    if "manifest_index" in event:
+        manifest_index = bool(event["manifest_index"])
+    else:
+        manifest_index = False
+
+    # secrets, clients and the state the run starts from don't depend on each other, fetch them together
+    setup = warm_up(
+        secrets=traced("secrets", get_secrets),
+        # sized to the in-flight cap, a smaller pool would block invokes past it
+        lambda_client=lambda: _lambda_client(max_inflight_workers),
+        duration_history=traced("duration_history_download", lambda: _load_duration_history(_report_fetch_client())),
+        manifest_version=lambda: _manifest_version(_report_fetch_client()),
+    )
+    if "resume_run_id" not in event and not manifest_index:
+        # this run groups with the Orchestrator, unless the groups are cached. Resumes reuse the run's groups and the
+        # index path only loads it to fall back, so both import it on first use
+        warm_up(batch_scraper=traced("batch_scraper_import", lambda: Orchestrator.load()))
+    with span("setup_wait"):
+        secrets: Dict[str, str] = setup["secrets"].result()
+
+    if "backfilling" in event:
+        backfilling = bool(event["backfilling"])
+    else:
+        backfilling = False
+
+    if "rebuild_windows" in event:
+        rebuild_windows = bool(event["rebuild_windows"])
+    else:
+        rebuild_windows = False
+
+    # sketch mode: daily reports get a distinct count sketch sidecar and the monthly window is joined from them
+    if "sketch_mode" in event:
+        sketch_mode = bool(event["sketch_mode"])
+    else:
+        sketch_mode = False
+
+    # write window reports string dictionary encoded
+    if "string_table" in event:
+        string_table = bool(event["string_table"])
+    else:
+        string_table = False
+
+    # memory budget for full window joins, past it partial aggregates spill to /tmp
+    if "merge_memory_budget_mb" in event:
+        merge_memory_budget_mb = float(event["merge_memory_budget_mb"])
+    else:
+        merge_memory_budget_mb = None
+
+    # latency percentile past which a straggling group is invoked again, null turns hedging off
+    if "hedge_percentile" in event:
+        hedge_percentile = None if event["hedge_percentile"] is None else float(event["hedge_percentile"])
+    else:
+        hedge_percentile = HEDGE_PERCENTILE
+
+    # async mode: start workers with Event invokes and let the last one to finish trigger the join
+    if "async_workers" in event:
+        async_workers = bool(event["async_workers"])
+    else:
+        async_workers = False
+
+    # in async mode, wait for the workers here as long as the time budget allows instead of returning right away
+    if "poll_async" in event:
+        poll_async = bool(event["poll_async"])
+    else:
+        poll_async = False
+
+    report_options = {
+        "sketch_mode": sketch_mode,
+        "rebuild_windows": rebuild_windows,
+        "string_table": string_table,
+        "merge_memory_budget_mb": merge_memory_budget_mb,
+    }
+
+    # opt in: skip repos the activity index shows had no pushes in the window
+    if "activity_filter" in event:
+        activity_filter = bool(event["activity_filter"])
+    else:
+        activity_filter = False
+
+    # time kept back for the join and windows, past it the run is joined as it stands and marked partial
+    if "deadline_reserve_secs" in event:
+        deadline_reserve_secs = float(event["deadline_reserve_secs"])
+    else:
+        deadline_reserve_secs = DEADLINE_RESERVE_SECS
+
+    if "backfill_days" in event and bool(event["backfill_days"]):
+        # one scrape per day in [start_date, end_date], several days at a time
+        return backfill_days(
+            datetime.strptime(event["start_date"], "%Y-%m-%d"),
+            datetime.strptime(event["end_date"], "%Y-%m-%d"),
+            secrets,
+            report_options,
+            context,
+            max_concurrent_days=int(event.get("max_concurrent_days", BACKFILL_CONCURRENT_DAYS)),
+            max_inflight_workers=max_inflight_workers,
+            deadline_reserve_secs=deadline_reserve_secs,
+            force="force_backfill" in event and bool(event["force_backfill"]),
+            activity_filter=activity_filter,
+            manifest_index=manifest_index,
+        )
+
+    start = time.time()
+    run_client = _report_fetch_client()
+    history_client = run_client
+    duration_history = setup["duration_history"].result()
+
+    if "resume_run_id" in event:
+        # finish the groups a previous, partial run didn't get to
+        run_id = event["resume_run_id"]
+        run = load_run(run_client, run_id)
+        if run is None:
+            raise ValueError(f"no run {run_id} to resume")
+        start_date: datetime = datetime.strptime(run["start_date"], "%Y-%m-%d")
+        end_date: datetime = datetime.strptime(run["end_date"], "%Y-%m-%d")
+        repo_url_groups: List[List[str]] = run["repo_url_groups"]
+        report_options = run["options"]
+        # workers of an async run must not trigger a reduce while this invocation is joining
+        claim_reduce(_runs_client(), run_id)
+        completions = list_completions(run_client, run_id)
+        print(f"resuming run {run_id}: {len(completions)}/{len(repo_url_groups)} groups reported")
+    else:
+        if "start_date" in event and "end_date" in event:
+            # pass in start and end to orchestrator for backfilling
+            start_date: datetime = datetime.strptime(event["start_date"], "%Y-%m-%d")
+            end_date: datetime = datetime.strptime(event["end_date"], "%Y-%m-%d")
+            print(
+                f'Dates Passed In: orchestrating for {start_date.strftime("%Y-%m-%d")} thru {end_date.strftime("%Y-%m-%d")}'
+            )
+        else:
+            # just use today's date
+            end_date: datetime = datetime.strptime(
+                datetime.now().strftime("%Y-%m-%d"), "%Y-%m-%d"
+            )
+            start_date = end_date - timedelta(1)
+            start_date: datetime = datetime.strptime(
+                start_date.strftime("%Y-%m-%d"), "%Y-%m-%d"
+            )
+
+            print(
+                f"Today's date inferred: orchestrating for {start_date.strftime('%Y-%m-%d')} thru {end_date.strftime('%Y-%m-%d')}"
+            )
+
+        with span("plan_repo_groups"):
+            repo_url_groups = _plan_repo_groups(
+                start_date,
+                end_date,
+                secrets,
+                backfilling,
+                duration_history,
+                context,
+                activity_filter=activity_filter,
+                manifest_version=setup["manifest_version"].result(),
+                manifest_index=manifest_index,
+            )
+        run_id = f'{end_date.strftime("%Y-%m-%d")}-{context.aws_request_id[0:8]}'
+        completions = {}
+
+        if async_workers and len(repo_url_groups) > 0:
+            dispatch_async_run(run_id, repo_url_groups, start_date, end_date, report_options, s3=run_client)
+            if not poll_async:
+                return {"run_id": run_id, "dispatched_workers": len(repo_url_groups)}
+
+            completions = wait_for_completions(
+                run_client,
+                _runs_client(),
+                run_id,
+                len(repo_url_groups),
+                lambda: context.get_remaining_time_in_millis() / 1000.0,
+                ASYNC_REDUCE_RESERVE_SECS,
+            )
+            if len(completions) < len(repo_url_groups) or not claim_reduce(_runs_client(), run_id):
+                # the last worker will trigger the reduce
+                return {"run_id": run_id, "reported_workers": len(completions)}
+            return reduce_async_run(run_id, s3=run_client, completions=completions)
+
+        if len(repo_url_groups) > 0:
+            # the run doubles as the checkpoint, this invocation is its reducer
+            _save_new_run(run_client, run_id, repo_url_groups, start_date, end_date, report_options)
+            claim_reduce(_runs_client(), run_id)
+
+    def invoke_worker(repo_group, worker_id):
+        return _invoke_worker(
+            repo_group,
+            worker_id,
+            start_date,
+            end_date,
+            run_id,
+            len(repo_url_groups),
+            fetch_client,
+            invoke_client=_lambda_client(max_inflight_workers),
         )
-        return response["Payload"].read()
 
     results = []
+    valid_results = []
+    invalid_results = []
+    daily_aggregate = {}
+    durations = []
+    worker_durations = {}
+    fetch_client = _report_fetch_client()
+
+    def add_worker_result(worker_result: bytes, worker_report: Optional[Dict], duration_recorded: bool = False):
+        results.append(worker_result)
+        # fold each report in while the stragglers are still running, only join valid results
+        if worker_report is None:
+            invalid_results.append(worker_result)
+            return
+        valid_results.append(worker_result)
+        decoded_result = json.loads(worker_result.decode("utf-8"))
+        _record_duration(durations, decoded_result)
+        # a group checkpointed by an earlier invocation of this run is already in the history
+        if not duration_recorded:
+            worker_durations[int(decoded_result["worker_id"])] = float(decoded_result["worker_duration_secs"])
+        with span("merge"):
+            add_report(daily_aggregate, worker_report)
+
+    # groups checkpointed by an earlier invocation
+    finished_groups = {worker_id for worker_id, record in completions.items() if "report_path" in record}
+    checkpointed = {completions[worker_id]["report_path"]: worker_id for worker_id in finished_groups}
+    for report_path, worker_report in _fetch_reports(fetch_client, list(checkpointed), cache=False):
+        completion = completions[checkpointed[report_path]]
+        add_worker_result(
+            json.dumps(completion).encode("utf-8"),
+            worker_report,
+            duration_recorded=bool(completion.get("duration_recorded")),
+        )
+
     if len(repo_url_groups) == 0:
         print(f"Devs are sleeping, no commits anywhere between {start_date} {end_date}")
     else:
-        with ThreadPoolExecutor(max_workers=len(repo_url_groups)) as executor:
-            futures = [
-                executor.submit(invoke_worker, repo_group, i)
-                for i, repo_group in enumerate(repo_url_groups)
+        # only hold groups back on real predictions, not the no-history default
+        predicted_secs = None
+        if len(duration_history) > 0:
+            default_secs = default_prediction(duration_history)
+            predicted_secs = [
+                sum(predict_secs(repo_url, duration_history, default_secs) for repo_url in repo_group)
+                for repo_group in repo_url_groups
             ]
-
-            for future in as_completed(futures):
-                worker_result = future.result()
-                results.append(worker_result)
+        with span("fan_out", groups=len(repo_url_groups)):
+            for worker_id, (worker_result, worker_report) in _fan_out_workers(
+                invoke_worker,
+                repo_url_groups,
+                max_inflight=max_inflight_workers,
+                hedge_percentile=hedge_percentile,
+                worker_ids=[i for i in range(len(repo_url_groups)) if i not in finished_groups],
+                seconds_left=lambda: context.get_remaining_time_in_millis() / 1000.0 - deadline_reserve_secs,
+                predicted_secs=predicted_secs,
+            ):
                 print(
                     f"response came back from worker, seconds remaining: {context.get_remaining_time_in_millis() / 1000.0}"
                 )
                 print(worker_result)
-
-    """
-    with ThreadPoolExecutor(max_workers=len(repo_url_groups)) as executor:
-        for response in executor.map(
-            invoke_worker, repo_url_groups, range(len(repo_url_groups))
-        ):
-            results.append(response)
-    print(*results, sep="\n")
-    """
+                add_worker_result(worker_result, worker_report)
+                if worker_report is not None:
+                    finished_groups.add(worker_id)
+                    # this invocation saves the group's duration, a resume must not fold it in again
+                    completion = dict(json.loads(worker_result.decode("utf-8")), duration_recorded=True)
+                    write_completion(run_client, run_id, worker_id, completion)
 
     print(
-        f"joining valid resuts, seconds remaining: {context.get_remaining_time_in_millis() / 1000.0}"
+        f"all workers returned, seconds remaining: {context.get_remaining_time_in_millis() / 1000.0}"
     )
 
-    # only join valid results
-    valid_results = [
-        r for r in results if "report_path" in json.loads(r.decode("utf-8"))
-    ]
-    invalid_results = [
-        r for r in results if "report_path" not in json.loads(r.decode("utf-8"))
-    ]
-
     print(f"{len(results)} workers, valid results {len(valid_results)}")
 
-    if len(valid_results) > 0:
-        # join worker reports
-        join_worker_reports(valid_results, report_date=end_date)
+    unfinished_groups = [i for i in range(len(repo_url_groups)) if i not in finished_groups]
+    if len(unfinished_groups) > 0:
+        print(f"run {run_id} is partial, {len(unfinished_groups)} groups unfinished, resume with resume_run_id")
 
-        # make weekly raw report
-        _generate_windowed_report(7, "weekly_raw")
+    get_tracer().set_property("run_id", run_id)
+    get_tracer().set_property("partial", len(unfinished_groups) > 0)
+    record("repo_groups", len(repo_url_groups), "Count")
+    record("unfinished_groups", len(unfinished_groups), "Count")
 
-        # make monthly raw report
-        _generate_windowed_report(30, "monthly_raw")
-
-    else:
-        dump_empty_report(report_date=end_date)
+    if len(valid_results) > 0:
+        print("durations: ", durations)
+    if len(worker_durations) > 0:
+        with span("save_duration_history"):
+            _save_duration_history(
+                history_client, record_durations(duration_history, repo_url_groups, worker_durations)
+            )
+    # worker reports were already joined as they came back
+    with span("finish_daily_reports"):
+        _finish_daily_reports(daily_aggregate, len(valid_results) > 0, end_date, report_options)
+    _upload_report_status(
+        run_client,
+        end_date,
+        run_id,
+        len(repo_url_groups),
+        unfinished_groups,
+        manifest_version=setup["manifest_version"].result(),
+    )
 
     print(
         f"done generating reports, seconds remaining: {context.get_remaining_time_in_millis() / 1000.0}"
@@ -430,6 +1899,9 @@ def master_lambda_handler(event, context):
         "invalid_results": invalid_results,
         "duration": round(end - start, 3),
         "report": f'{end_date.strftime("%Y-%m-%d")}.json',
+        "run_id": run_id,
+        "partial": len(unfinished_groups) > 0,
+        "unfinished_groups": unfinished_groups,
     }
 
     print(
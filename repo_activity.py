@@ -0,0 +1,153 @@
+"""
+Repo activity index.
+
+Keeps the last seen HEAD sha and push time of every repo so repos that can't have commits in a scrape window are
+dropped before they are sent to a worker. GitHub repos are checked with the repos API (conditional requests, an
+unchanged repo costs a 304 that doesn't count against the rate limit), anything else with git ls-remote.
+A repo is only skipped on positive evidence of inactivity, any lookup failure keeps it in.
+"""
+
+import json
+import re
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+ACTIVITY_INDEX_KEY = "assets/repo_activity_index.json"
+# entries checked more recently than this aren't looked up again
+ACTIVITY_REFRESH_SECS = 3600
+ACTIVITY_LOOKUP_CONCURRENCY = 32
+ACTIVITY_LOOKUP_TIMEOUT_SECS = 10
+# commit and push times vs the scrape window's timezone
+ACTIVITY_SLACK = timedelta(days=1)
+
+GITHUB_REPO_PATTERN = re.compile(r"github\.com[/:]([^/]+)/([^/#?]+?)(?:\.git)?/?$")
+
+
+def github_slug(repo_url: str) -> Optional[str]:
+    match = GITHUB_REPO_PATTERN.search(repo_url)
+    if match is None:
+        return None
+    return f"{match.group(1)}/{match.group(2)}"
+
+
+def _github_lookup(slug: str, entry: Dict, token: Optional[str]) -> Dict:
+    request = urllib.request.Request(f"https://api.github.com/repos/{slug}")
+    request.add_header("Accept", "application/vnd.github+json")
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+    if "etag" in entry:
+        request.add_header("If-None-Match", entry["etag"])
+    try:
+        with urllib.request.urlopen(request, timeout=ACTIVITY_LOOKUP_TIMEOUT_SECS) as response:
+            repo = json.load(response)
+            return {"pushed_at": repo["pushed_at"], "etag": response.headers.get("ETag")}
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return {"pushed_at": entry["pushed_at"], "etag": entry["etag"]}
+        raise e
+
+
+def _ls_remote_head(repo_url: str) -> str:
+    output = subprocess.run(
+        ["git", "ls-remote", repo_url, "HEAD"],
+        capture_output=True,
+        text=True,
+        timeout=ACTIVITY_LOOKUP_TIMEOUT_SECS,
+        check=True,
+    ).stdout
+    return output.split()[0]
+
+
+def refresh_entry(repo_url: str, entry: Optional[Dict], token: Optional[str] = None) -> Optional[Dict]:
+    """
+    Look a repo up again, returns the updated entry or None if the lookup failed
+    """
+    entry = dict(entry) if entry is not None else {}
+    now = time.time()
+    try:
+        slug = github_slug(repo_url)
+        if slug is not None:
+            entry.update(_github_lookup(slug, entry, token))
+        else:
+            head_sha = _ls_remote_head(repo_url)
+            if entry.get("head_sha") != head_sha:
+                # HEAD moved somewhere between the last check and now
+                entry["head_sha"] = head_sha
+                entry["head_seen_at"] = now
+    except Exception as e:
+        print(f"activity lookup failed for {repo_url}: {e}")
+        return None
+    entry["checked_at"] = now
+    entry.pop("lookup_failed", None)
+    return entry
+
+
+def refresh_index(
+    index: Dict[str, Dict],
+    repo_urls: List[str],
+    token: Optional[str] = None,
+    max_workers: int = ACTIVITY_LOOKUP_CONCURRENCY,
+) -> int:
+    """
+    Refresh stale entries for repo_urls in place, returns the number of lookups made
+    """
+    now = time.time()
+    stale = [
+        repo_url
+        for repo_url in repo_urls
+        if repo_url not in index or now - index[repo_url].get("checked_at", 0) > ACTIVITY_REFRESH_SECS
+    ]
+    if len(stale) == 0:
+        return 0
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(stale))) as executor:
+        entries = executor.map(lambda repo_url: refresh_entry(repo_url, index.get(repo_url), token), stale)
+        for repo_url, entry in zip(stale, entries):
+            if entry is not None:
+                index[repo_url] = entry
+            elif repo_url in index:
+                # keep the old entry for its etag/sha, but don't trust it to skip the repo
+                index[repo_url]["lookup_failed"] = True
+    return len(stale)
+
+
+def is_active(entry: Optional[Dict], start_date: datetime) -> bool:
+    """
+    False only if the repo provably hasn't changed since before start_date
+    """
+    if entry is None or entry.get("lookup_failed"):
+        return True
+    cutoff = start_date - ACTIVITY_SLACK
+    if entry.get("pushed_at"):
+        return datetime.strptime(entry["pushed_at"], "%Y-%m-%dT%H:%M:%SZ") >= cutoff
+    if "head_seen_at" in entry:
+        # the current HEAD was first seen by a check at head_seen_at, it may have moved any time before that
+        return datetime.utcfromtimestamp(entry["head_seen_at"]) >= cutoff
+    return True
+
+
+def filter_active(
+    repo_url_groups: List[List[str]],
+    group_sizes: List[float],
+    index: Dict[str, Dict],
+    start_date: datetime,
+) -> Tuple[List[List[str]], List[float], int]:
+    """
+    Drop inactive repos from the groups, and the groups left empty. A group keeps its original size, which is still
+    a bound on what is left of it, regrouping is up to plan_groups. Returns (groups, sizes, repos dropped).
+    """
+    kept_groups: List[List[str]] = []
+    kept_sizes: List[float] = []
+    dropped = 0
+    for group, group_size in zip(repo_url_groups, group_sizes):
+        active = [repo_url for repo_url in group if is_active(index.get(repo_url), start_date)]
+        dropped += len(group) - len(active)
+        if len(active) > 0:
+            kept_groups.append(active)
+            kept_sizes.append(group_size)
+    return kept_groups, kept_sizes, dropped
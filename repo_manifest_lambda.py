@@ -1,37 +1,19 @@
-import boto3
-from botocore.exceptions import ClientError
-from datetime import datetime
-import json
 import time
 from typing import Dict
 
-from batch_scraper.manifest.manifest_manager import ManifestManager
+from lambda_runtime import get_client, get_secrets, lazy_import, warm_up
+from manifest_index import ManifestFormatError, publish_index
+from manifest_versions import publish_manifest
 
-
-def get_secrets() -> Dict[str, str]:
-    secret_name = "coincommitsecrets"
-    region_name = "us-west-1"
-
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
-
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
-        # For a list of exceptions thrown, see
-        # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
-        print("STS get_secrets:", e)
-        raise e
-
-    # Decrypts secret using the associated KMS key.
-    secrets = get_secret_value_response["SecretString"]
-    return json.loads(secrets)
+# imported by the first ManifestManager call, the publishing steps don't need batch_scraper
+ManifestManager = lazy_import("batch_scraper.manifest.manifest_manager", "ManifestManager")
 
 
 def lambda_handler(event, context):
 
-    secrets: Dict[str, str] = get_secrets()
+    # the S3 client comes up while the secrets are fetched
+    setup = warm_up(secrets=get_secrets, s3_client=lambda: get_client("s3"))
+    secrets: Dict[str, str] = setup["secrets"].result()
 
     # update local repo_manifest
     mm = ManifestManager(secrets)
@@ -41,16 +23,18 @@ def lambda_handler(event, context):
     manifest_end = time.time()
     print(f"manifest generation time: {round(manifest_end-manifest_start, 2)}")
 
-    # upload to S3
-    s3_client = boto3.resource("s3")
-    s3_client.Bucket("coincommit").upload_file(
-        local_manifest_path, "assets/repo_manifest.json"
-    )
-    s3_client.Bucket("coincommit").upload_file(
-        local_manifest_path,
-        f'assets/repo_manifest_{datetime.now().strftime("%Y-%m-%d")}.json',
-    )
-
-    lambda_response = {"status": "done"}
+    # upload to S3, only if the manifest changed
+    s3_client = setup["s3_client"].result()
+    published = publish_manifest(s3_client, local_manifest_path)
+    # the indexed copy the orchestrator can plan from without parsing the JSON
+    # the manifest is already published, a layout the index can't read only costs the orchestrator its fast path
+    index_start = time.time()
+    try:
+        publish_index(s3_client, local_manifest_path, published["sha256"])
+        print(f"manifest index time: {round(time.time() - index_start, 2)}")
+    except ManifestFormatError as e:
+        print(f"manifest can't be indexed, skipping the index: {e}")
+
+    lambda_response = {"status": "done", "manifest_changed": published["changed"]}
 
     return lambda_response
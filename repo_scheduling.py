@@ -0,0 +1,117 @@
+"""
+Duration aware repo grouping.
+
+Every run records how long each worker took, which is spread over the repos it scraped and folded into a per-repo
+moving average. The next run packs repos into workers by predicted runtime (longest processing time first) so the
+slowest worker, which gates the whole run, finishes as early as possible. The size limit per worker still holds.
+"""
+
+import heapq
+from statistics import median
+from typing import Dict, List, Optional, Set, Tuple
+
+DEFAULT_REPO_SECS = 30.0
+# weight of the latest run in the moving average
+DURATION_EWMA_ALPHA = 0.3
+
+
+def predict_secs(repo_url: str, history: Dict[str, Dict], default_secs: float) -> float:
+    if repo_url in history:
+        return history[repo_url]["secs"]
+    return default_secs
+
+
+def default_prediction(history: Dict[str, Dict]) -> float:
+    if len(history) == 0:
+        return DEFAULT_REPO_SECS
+    return median(entry["secs"] for entry in history.values())
+
+
+def record_durations(
+    history: Dict[str, Dict], repo_groups: List[List[str]], worker_durations: Dict[int, float]
+) -> Dict[str, Dict]:
+    """
+    Spread each worker's duration over its repos in proportion to their predicted runtime, and fold it into history
+    """
+    default_secs = default_prediction(history)
+    for worker_id, duration_secs in worker_durations.items():
+        repo_group = repo_groups[worker_id]
+        predictions = [predict_secs(repo_url, history, default_secs) for repo_url in repo_group]
+        total = sum(predictions)
+        for repo_url, predicted in zip(repo_group, predictions):
+            observed = duration_secs * predicted / total if total > 0 else duration_secs / len(repo_group)
+            if repo_url in history:
+                entry = history[repo_url]
+                entry["secs"] = round(
+                    DURATION_EWMA_ALPHA * observed + (1 - DURATION_EWMA_ALPHA) * entry["secs"], 3
+                )
+                entry["runs"] += 1
+            else:
+                history[repo_url] = {"secs": round(observed, 3), "runs": 1}
+    return history
+
+
+def makespan(repo_groups: List[List[str]], history: Dict[str, Dict]) -> float:
+    default_secs = default_prediction(history)
+    return max(
+        (sum(predict_secs(repo_url, history, default_secs) for repo_url in group) for group in repo_groups),
+        default=0.0,
+    )
+
+
+def plan_groups(
+    repo_groups: List[List[str]],
+    group_sizes: List[float],
+    history: Dict[str, Dict],
+    mem_limit_mb: float,
+    repo_sizes: Optional[Dict[str, float]] = None,
+) -> Tuple[List[List[str]], List[float]]:
+    """
+    Regroup repos to minimize the predicted makespan. Uses as many workers as the size based grouping did,
+    and only opens more if a repo doesn't fit under mem_limit_mb anywhere.
+
+    With repo_sizes each repo is charged its own size. Without them only the size of each original group is known,
+    so a worker holding any repo of a group is charged that whole group: any part of a group is no larger than the
+    group, which keeps the limit a true bound instead of an average.
+    """
+    default_secs = default_prediction(history)
+    repos = []
+    for origin, group in enumerate(repo_groups):
+        for repo_url in group:
+            repos.append((predict_secs(repo_url, history, default_secs), origin, repo_url))
+    repos.sort(reverse=True)
+
+    new_groups: List[List[str]] = [[] for _ in repo_groups]
+    new_sizes: List[float] = [0.0 for _ in repo_groups]
+    # original groups already charged to each worker
+    origins: List[Set[int]] = [set() for _ in repo_groups]
+    # (predicted secs, worker index)
+    loads = [(0.0, i) for i in range(len(new_groups))]
+    heapq.heapify(loads)
+
+    def charge(i: int, origin: int, repo_url: str) -> float:
+        if repo_sizes is not None:
+            return repo_sizes[repo_url]
+        return 0.0 if origin in origins[i] else group_sizes[origin]
+
+    for predicted, origin, repo_url in repos:
+        skipped = []
+        while loads:
+            load, i = heapq.heappop(loads)
+            if new_sizes[i] + charge(i, origin, repo_url) <= mem_limit_mb or len(new_groups[i]) == 0:
+                break
+            skipped.append((load, i))
+        else:
+            i, load = len(new_groups), 0.0
+            new_groups.append([])
+            new_sizes.append(0.0)
+            origins.append(set())
+        new_sizes[i] += charge(i, origin, repo_url)
+        origins[i].add(origin)
+        new_groups[i].append(repo_url)
+        heapq.heappush(loads, (load + predicted, i))
+        for entry in skipped:
+            heapq.heappush(loads, entry)
+
+    keep = [i for i, group in enumerate(new_groups) if len(group) > 0]
+    return [new_groups[i] for i in keep], [new_sizes[i] for i in keep]
@@ -0,0 +1,334 @@
+"""
+Per-token aggregation shared by every report joiner (worker reports, windowed reports and the weekly/monthly scripts).
+
+Report lists are kept as counted sets while merging: each distinct value maps to the number of reports it came from.
+That de-dupes for free, and still lets a window subtract a day that fell out of it.
+
+In sketch mode the distinct count fields are carried as fixed size sketches (see sketches.py) instead of values,
+and the exact lists are only filled back in for the tokens that get displayed. Every other token of a sketch mode
+join loses all of its SET_FIELDS lists (commit_messages, distinct_authors, commit_urls, changed_methods,
+active_repos) and only keeps distinct_counts for SKETCH_FIELDS. Daily sketches are stored in a sidecar next to the
+report (see serialize_sketches), never inside it.
+"""
+
+import sys
+from typing import Dict, Iterable, Optional, Set
+
+from sketches import FieldSketch
+
+SET_FIELDS = (
+    "commit_messages",
+    "distinct_authors",
+    "commit_urls",
+    "changed_methods",
+    "active_repos",
+)
+# fields that get a distinct count sketch in sketch mode, and the ones that also get a membership filter
+SKETCH_FIELDS = ("distinct_authors", "active_repos", "commit_urls")
+BLOOM_FIELDS = ("distinct_authors", "active_repos")
+# number of tokens, by commit count, that keep exact lists in a sketch mode join
+SKETCH_EXACT_TOP_N = 100
+
+
+def _sketch_values(token_data: Dict, stored: Optional[Dict] = None) -> Dict[str, FieldSketch]:
+    """
+    Sketches for a report token entry, read from its sidecar entry if there is one or built from its lists
+    """
+    stored = stored or {}
+    return {
+        field: FieldSketch.from_dict(stored[field])
+        if field in stored
+        else FieldSketch.from_values(token_data.get(field, []), with_bloom=field in BLOOM_FIELDS)
+        for field in SKETCH_FIELDS
+    }
+
+
+def _add_counts(counts: Dict, other: Dict):
+    for key, count in other.items():
+        counts[key] = counts.get(key, 0) + count
+
+
+def _subtract_counts(counts: Dict, other: Dict) -> bool:
+    """
+    Subtract other's counts, clamped at zero. False if other wasn't wholly in counts.
+    """
+    whole = True
+    for key, count in other.items():
+        remaining = counts.get(key, 0) - count
+        if remaining < 0:
+            whole = False
+        if remaining <= 0:
+            counts.pop(key, None)
+        else:
+            counts[key] = remaining
+    return whole
+
+
+class TokenStats:
+    __slots__ = (
+        "commit_count",
+        "lines_of_code",
+        "commit_messages",
+        "distinct_authors",
+        "commit_urls",
+        "changed_methods",
+        "active_repos",
+        "file_extensions",
+        "loc_changes_by_filetype",
+        "description",
+        "project_created_cmc",
+        "report_count",
+        "sketches",
+    )
+
+    def __init__(self):
+        self.commit_count = 0
+        self.lines_of_code = 0
+        self.commit_messages = {}
+        self.distinct_authors = {}
+        self.commit_urls = {}
+        self.changed_methods = {}
+        self.active_repos = {}
+        self.file_extensions = {}
+        self.loc_changes_by_filetype = {}
+        self.description = None
+        self.project_created_cmc = None
+        # number of reports merged into this token, it is dropped when a subtraction brings this to zero
+        self.report_count = 0
+        # field name -> FieldSketch, only set in sketch mode
+        self.sketches = None
+
+    @classmethod
+    def from_token_data(
+        cls, token_data: Dict, sketch_only: bool = False, stored_sketches: Optional[Dict] = None
+    ) -> "TokenStats":
+        """
+        Build stats from one token entry of a report as written to S3.
+        sketch_only skips the lists and keeps sketches of the distinct count fields instead, taken from
+        stored_sketches (the token's sidecar entry) when given.
+        """
+        stats = cls()
+        stats.commit_count = token_data.get("commit_count", 0)
+        stats.lines_of_code = token_data.get("lines_of_code", 0)
+        if sketch_only:
+            stats.sketches = _sketch_values(token_data, stored_sketches)
+        else:
+            # interning keeps one copy of each string no matter how many reports repeat it
+            for field in SET_FIELDS:
+                values = getattr(stats, field)
+                for value in token_data.get(field, []):
+                    values[sys.intern(value)] = 1
+        stats.file_extensions = dict(token_data.get("file_extensions", {}))
+        stats.loc_changes_by_filetype = {
+            action: dict(fext_data)
+            for action, fext_data in token_data.get("loc_changes_by_filetype", {}).items()
+        }
+        stats.description = token_data.get("description")
+        stats.project_created_cmc = token_data.get("project_created_cmc")
+        stats.report_count = 1
+        return stats
+
+    def merge(self, other: "TokenStats") -> "TokenStats":
+        """
+        Fold other into self, merging is associative and commutative apart from description/project_created_cmc,
+        which keep the first value seen
+        """
+        self.commit_count += other.commit_count
+        self.lines_of_code += other.lines_of_code
+        for field in SET_FIELDS:
+            _add_counts(getattr(self, field), getattr(other, field))
+        _add_counts(self.file_extensions, other.file_extensions)
+        for action, fext_data in other.loc_changes_by_filetype.items():
+            _add_counts(self.loc_changes_by_filetype.setdefault(action, {}), fext_data)
+        if self.description is None:
+            self.description = other.description
+        if self.project_created_cmc is None:
+            self.project_created_cmc = other.project_created_cmc
+        self.report_count += other.report_count
+        if other.sketches is not None:
+            if self.sketches is None:
+                self.sketches = other.sketches
+            else:
+                for field, sketch in other.sketches.items():
+                    self.sketches[field].merge(sketch)
+        return self
+
+    def fill_exact_lists(self, other: "TokenStats"):
+        """
+        Take the exact lists from other, used to give the displayed tokens of a sketch mode join their values back
+        """
+        for field in SET_FIELDS:
+            setattr(self, field, getattr(other, field))
+
+    def subtract(self, other: "TokenStats") -> bool:
+        """
+        Inverse of merge, other must have been merged into self before. Sketches can't be subtracted.
+        Counts are clamped at zero, returns False if other wasn't wholly in self, i.e. it changed since it was merged.
+        """
+        if self.sketches is not None or other.sketches is not None:
+            raise ValueError("sketch mode stats can't be subtracted, rebuild the window instead")
+        whole = other.commit_count <= self.commit_count and other.lines_of_code <= self.lines_of_code
+        self.commit_count = max(0, self.commit_count - other.commit_count)
+        self.lines_of_code = max(0, self.lines_of_code - other.lines_of_code)
+        for field in SET_FIELDS:
+            whole = _subtract_counts(getattr(self, field), getattr(other, field)) and whole
+        whole = _subtract_counts(self.file_extensions, other.file_extensions) and whole
+        for action, fext_data in other.loc_changes_by_filetype.items():
+            if action in self.loc_changes_by_filetype:
+                whole = _subtract_counts(self.loc_changes_by_filetype[action], fext_data) and whole
+            elif fext_data:
+                whole = False
+        self.report_count -= other.report_count
+        return whole
+
+    def to_token_data(self) -> Dict:
+        """
+        Serialize back to the report format, lists come out de-duped.
+        A sketch mode aggregate also gets the estimated distinct_counts, the sketches themselves are not written.
+        """
+        token_data = {
+            "commit_count": self.commit_count,
+            "lines_of_code": self.lines_of_code,
+        }
+        for field in SET_FIELDS:
+            token_data[field] = list(getattr(self, field))
+        token_data["file_extensions"] = dict(self.file_extensions)
+        token_data["loc_changes_by_filetype"] = {
+            action: dict(fext_data)
+            for action, fext_data in self.loc_changes_by_filetype.items()
+        }
+        token_data["description"] = self.description if self.description is not None else []
+        token_data["project_created_cmc"] = (
+            self.project_created_cmc if self.project_created_cmc is not None else []
+        )
+
+        if self.sketches is not None:
+            token_data["distinct_counts"] = {field: sketch.cardinality() for field, sketch in self.sketches.items()}
+        return token_data
+
+    def sketch_data(self) -> Dict:
+        sketches = self.sketches
+        if sketches is None:
+            sketches = _sketch_values({field: getattr(self, field) for field in SKETCH_FIELDS})
+        return {field: sketch.to_dict() for field, sketch in sketches.items()}
+
+    def to_state(self) -> Dict:
+        """
+        Like to_token_data but keeps the counts, so a window can be resumed and subtracted from later
+        """
+        state = self.to_token_data()
+        for field in SET_FIELDS:
+            state[field] = dict(getattr(self, field))
+        state["report_count"] = self.report_count
+        return state
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "TokenStats":
+        stats = cls.from_token_data({k: v for k, v in state.items() if k not in SET_FIELDS})
+        for field in SET_FIELDS:
+            # states encoded as string_table_v1 have [] for an empty counted field
+            counts = state.get(field) or {}
+            setattr(stats, field, {sys.intern(value): count for value, count in counts.items()})
+        stats.report_count = state["report_count"]
+        return stats
+
+
+def add_report(
+    aggregate: Dict[str, TokenStats], report: Optional[Dict], sketch_only: bool = False, sketches: Optional[Dict] = None
+):
+    """
+    Merge a report (token name -> token data, as stored in S3) into an aggregate.
+    sketches is the report's sketch sidecar, if it has one, and is only read with sketch_only.
+    """
+    sketches = sketches or {}
+    for token_name, token_data in (report or {}).items():
+        token_stats = TokenStats.from_token_data(
+            token_data, sketch_only=sketch_only, stored_sketches=sketches.get(token_name)
+        )
+        if token_name in aggregate:
+            aggregate[token_name].merge(token_stats)
+        else:
+            aggregate[token_name] = token_stats
+    return aggregate
+
+
+def subtract_report(aggregate: Dict[str, TokenStats], report: Optional[Dict]) -> bool:
+    """
+    Remove a report that was previously added to the aggregate. Returns False if the report wasn't wholly in the
+    aggregate, e.g. because it was regenerated after it was added, in which case the aggregate is off.
+    """
+    whole = True
+    for token_name, token_data in (report or {}).items():
+        if token_name not in aggregate:
+            whole = False
+            continue
+        token_stats = aggregate[token_name]
+        whole = token_stats.subtract(TokenStats.from_token_data(token_data)) and whole
+        if token_stats.report_count <= 0:
+            del aggregate[token_name]
+    return whole
+
+
+def merge_aggregates(aggregates: Iterable[Dict[str, TokenStats]]) -> Dict[str, TokenStats]:
+    merged = {}
+    for aggregate in aggregates:
+        for token_name, token_stats in aggregate.items():
+            if token_name in merged:
+                merged[token_name].merge(token_stats)
+            else:
+                merged[token_name] = token_stats
+    return merged
+
+
+def top_tokens(aggregate: Dict[str, TokenStats], n: int = SKETCH_EXACT_TOP_N) -> Set[str]:
+    ranked = sorted(aggregate, key=lambda token_name: aggregate[token_name].commit_count, reverse=True)
+    return set(ranked[:n])
+
+
+def add_exact_lists(exact: Dict[str, TokenStats], report: Optional[Dict], token_names: Set[str]):
+    """
+    Second pass of a sketch mode join: collect exact lists, only for token_names
+    """
+    add_report(
+        exact,
+        {token_name: token_data for token_name, token_data in (report or {}).items() if token_name in token_names},
+    )
+    return exact
+
+
+def fill_exact_lists(aggregate: Dict[str, TokenStats], exact: Dict[str, TokenStats]):
+    for token_name, exact_stats in exact.items():
+        if token_name in aggregate:
+            aggregate[token_name].fill_exact_lists(exact_stats)
+    return aggregate
+
+
+def serialize_report(aggregate: Dict[str, TokenStats]) -> Dict:
+    return {
+        token_name: token_stats.to_token_data()
+        for token_name, token_stats in aggregate.items()
+    }
+
+
+def serialize_sketches(aggregate: Dict[str, TokenStats]) -> Dict:
+    """
+    The sketch sidecar of a report: token name -> field -> sketch
+    """
+    return {
+        token_name: token_stats.sketch_data()
+        for token_name, token_stats in aggregate.items()
+    }
+
+
+def serialize_state(aggregate: Dict[str, TokenStats]) -> Dict:
+    return {
+        token_name: token_stats.to_state()
+        for token_name, token_stats in aggregate.items()
+    }
+
+
+def load_state(state: Dict) -> Dict[str, TokenStats]:
+    return {
+        token_name: TokenStats.from_state(token_state)
+        for token_name, token_state in state.items()
+    }
@@ -0,0 +1,141 @@
+"""
+Period arithmetic for the rollup pyramid.
+
+Daily reports are rolled up into ISO weeks and calendar months, months into quarters and quarters into years.
+A [start, end] range is answered by the fewest sealed rollups that tile it, plus daily reports for the ragged edges.
+The S3 side lives in orchestrator_lambda.py.
+"""
+
+from datetime import date, timedelta
+from typing import Callable, List, Tuple
+
+LEVELS = ("week", "month", "quarter", "year")
+# what each rollup is built from
+CHILD_LEVEL = {"week": "day", "month": "day", "quarter": "month", "year": "quarter"}
+
+Piece = Tuple[str, str]
+
+
+def period_key(level: str, day: date) -> str:
+    if level == "day":
+        return day.strftime("%Y-%m-%d")
+    if level == "week":
+        iso_year, iso_week, _ = day.isocalendar()
+        return f"{iso_year}-W{iso_week:02d}"
+    if level == "month":
+        return day.strftime("%Y-%m")
+    if level == "quarter":
+        return f"{day.year}-Q{(day.month - 1) // 3 + 1}"
+    if level == "year":
+        return str(day.year)
+    raise ValueError(f"unknown rollup level {level}")
+
+
+def _month_end(year: int, month: int) -> date:
+    if month == 12:
+        return date(year, 12, 31)
+    return date(year, month + 1, 1) - timedelta(days=1)
+
+
+def period_bounds(level: str, key: str) -> Tuple[date, date]:
+    """
+    First and last day (inclusive) of a period
+    """
+    if level == "day":
+        day = date.fromisoformat(key)
+        return day, day
+    if level == "week":
+        iso_year, iso_week = key.split("-W")
+        start = date.fromisocalendar(int(iso_year), int(iso_week), 1)
+        return start, start + timedelta(days=6)
+    if level == "month":
+        year, month = (int(piece) for piece in key.split("-"))
+        return date(year, month, 1), _month_end(year, month)
+    if level == "quarter":
+        year, quarter = key.split("-Q")
+        first_month = (int(quarter) - 1) * 3 + 1
+        return date(int(year), first_month, 1), _month_end(int(year), first_month + 2)
+    if level == "year":
+        return date(int(key), 1, 1), date(int(key), 12, 31)
+    raise ValueError(f"unknown rollup level {level}")
+
+
+def child_keys(level: str, key: str) -> List[str]:
+    """
+    Keys of the pieces a rollup is built from, in order
+    """
+    start, end = period_bounds(level, key)
+    child_level = CHILD_LEVEL[level]
+    keys = []
+    day = start
+    while day <= end:
+        child_key = period_key(child_level, day)
+        if child_key not in keys:
+            keys.append(child_key)
+        day = period_bounds(child_level, child_key)[1] + timedelta(days=1)
+    return keys
+
+
+def _decompose_days(start: date, end: date, is_sealed: Callable[[str, str], bool]) -> List[Piece]:
+    """
+    Tile [start, end] with whole sealed weeks where possible, days otherwise
+    """
+    pieces = []
+    day = start
+    while day <= end:
+        week_key = period_key("week", day)
+        week_start, week_end = period_bounds("week", week_key)
+        if week_start == day and week_end <= end and is_sealed("week", week_key):
+            pieces.append(("week", week_key))
+            day = week_end + timedelta(days=1)
+        else:
+            pieces.append(("day", period_key("day", day)))
+            day += timedelta(days=1)
+    return pieces
+
+
+def _decompose_months(start: date, end: date, is_sealed: Callable[[str, str], bool]) -> List[Piece]:
+    """
+    Tile [start, end], which begins and ends on month boundaries, with the largest sealed rollups
+    """
+    pieces = []
+    day = start
+    while day <= end:
+        for level in ("year", "quarter", "month"):
+            key = period_key(level, day)
+            period_start, period_end = period_bounds(level, key)
+            if period_start == day and period_end <= end and is_sealed(level, key):
+                pieces.append((level, key))
+                day = period_end + timedelta(days=1)
+                break
+        else:
+            # month not rolled up (yet), fall back to its weeks and days
+            month_end = period_bounds("month", period_key("month", day))[1]
+            pieces.extend(_decompose_days(day, month_end, is_sealed))
+            day = month_end + timedelta(days=1)
+    return pieces
+
+
+def decompose_range(start: date, end: date, is_sealed: Callable[[str, str], bool]) -> List[Piece]:
+    """
+    Split [start, end] into (level, key) pieces: the whole months in the middle come from month/quarter/year
+    rollups, the partial months at either end from week rollups and daily reports
+    """
+    if start.day == 1:
+        first_month_start = start
+    else:
+        first_month_start = period_bounds("month", period_key("month", start))[1] + timedelta(days=1)
+    last_month_end = period_bounds("month", period_key("month", end))[1]
+    if last_month_end != end:
+        last_month_end = date(end.year, end.month, 1) - timedelta(days=1)
+
+    if first_month_start > last_month_end:
+        return _decompose_days(start, end, is_sealed)
+
+    pieces = []
+    if start < first_month_start:
+        pieces.extend(_decompose_days(start, first_month_start - timedelta(days=1), is_sealed))
+    pieces.extend(_decompose_months(first_month_start, last_month_end, is_sealed))
+    if last_month_end < end:
+        pieces.extend(_decompose_days(last_month_end + timedelta(days=1), end, is_sealed))
+    return pieces
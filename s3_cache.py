@@ -0,0 +1,209 @@
+"""
+Content addressed on-disk cache for S3 objects.
+
+Entries are keyed by bucket, key and ETag. A cached object is revalidated with a conditional GET (If-None-Match),
+so an unchanged object costs one empty 304 response instead of a download. Least recently used entries are
+evicted to keep the cache under its size budget, except for entries pinned by a caller that is still reading them.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from botocore.exceptions import ClientError
+
+from tracing import count
+
+S3_CACHE_DIR = os.environ.get("S3_CACHE_DIR", "/tmp/s3_cache/")
+S3_CACHE_MB = float(os.environ.get("S3_CACHE_MB", "256"))
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+
+def _not_modified(e: ClientError) -> bool:
+    return (
+        e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") == 304
+        or e.response["Error"]["Code"] in ("304", "NotModified")
+    )
+
+
+def _missing(e: ClientError) -> bool:
+    return e.response["Error"]["Code"] in ("NoSuchKey", "404")
+
+
+class S3ObjectCache:
+    def __init__(self, cache_dir: str = S3_CACHE_DIR, max_mb: float = S3_CACHE_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * (1 << 20))
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.lock = threading.Lock()
+        # file name -> number of callers using it
+        self.pins = {}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r") as fp:
+                    self.index = json.load(fp)
+            except ValueError:
+                print(f"s3 cache index at {self.index_path} is unreadable, starting empty")
+
+        # drop entries whose file was cleaned up from under us
+        self.index = {
+            entry_key: entry
+            for entry_key, entry in self.index.items()
+            if os.path.exists(os.path.join(cache_dir, entry["file"]))
+        }
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as fp:
+            json.dump(self.index, fp)
+        os.replace(tmp_path, self.index_path)
+
+    def _remove_file(self, file_name: str):
+        file_path = os.path.join(self.cache_dir, file_name)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    def _pin(self, file_name: str):
+        self.pins[file_name] = self.pins.get(file_name, 0) + 1
+
+    def _unpin(self, file_name: str):
+        self.pins[file_name] -= 1
+        if self.pins[file_name] > 0:
+            return
+        del self.pins[file_name]
+        # the file was replaced by a newer version while it was in use
+        if all(entry["file"] != file_name for entry in self.index.values()):
+            self._remove_file(file_name)
+
+    def _evict(self):
+        # files in use are never evicted, which can leave the cache over budget until they are released
+        total = sum(entry["size"] for entry in self.index.values())
+        for entry_key, entry in sorted(self.index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if entry["file"] in self.pins:
+                continue
+            self._remove_file(entry["file"])
+            total -= entry["size"]
+            del self.index[entry_key]
+
+    def _fetch(self, s3_client, bucket: str, key: str) -> Optional[str]:
+        """
+        File name of a current copy of s3://bucket/key, downloading it if the cached copy is stale or missing.
+        The file comes back pinned and the caller must _unpin it. Returns None if the object does not exist.
+        """
+        entry_key = f"{bucket}/{key}"
+        with self.lock:
+            entry = self.index.get(entry_key)
+            # pinned while it is revalidated, so a 304 can't race an eviction
+            if entry is not None:
+                self._pin(entry["file"])
+
+        try:
+            try:
+                if entry is not None:
+                    response = s3_client.get_object(Bucket=bucket, Key=key, IfNoneMatch=entry["etag"])
+                else:
+                    response = s3_client.get_object(Bucket=bucket, Key=key)
+            except ClientError as e:
+                if entry is not None and _not_modified(e):
+                    count("s3_cache_hits")
+                    with self.lock:
+                        self._pin(entry["file"])
+                        entry["last_used"] = time.time()
+                        self._save_index()
+                    return entry["file"]
+                if _missing(e):
+                    with self.lock:
+                        self.index.pop(entry_key, None)
+                        self._save_index()
+                    return None
+                raise e
+
+            etag = response["ETag"]
+            file_name = hashlib.sha256(f"{bucket}/{key}/{etag}".encode("utf-8")).hexdigest()
+            file_path = os.path.join(self.cache_dir, file_name)
+            tmp_path = f"{file_path}.{threading.get_ident()}.part"
+            size = 0
+            with open(tmp_path, "wb") as fp:
+                for chunk in iter(lambda: response["Body"].read(DOWNLOAD_CHUNK_SIZE), b""):
+                    fp.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, file_path)
+            count("s3_cache_misses")
+            count("s3_bytes_downloaded", size, "Bytes")
+
+            with self.lock:
+                self._pin(file_name)
+                previous = self.index.get(entry_key)
+                self.index[entry_key] = {"etag": etag, "file": file_name, "size": size, "last_used": time.time()}
+                if previous is not None and previous["file"] != file_name and previous["file"] not in self.pins:
+                    self._remove_file(previous["file"])
+                self._evict()
+                self._save_index()
+            return file_name
+        finally:
+            if entry is not None:
+                with self.lock:
+                    self._unpin(entry["file"])
+
+    @contextmanager
+    def pinned(self, s3_client, bucket: str, key: str):
+        """
+        Local path of a current copy of s3://bucket/key, None if the object does not exist.
+        The file is kept on disk, whatever gets evicted meanwhile, until the block exits.
+        """
+        file_name = self._fetch(s3_client, bucket, key)
+        if file_name is None:
+            yield None
+            return
+        try:
+            yield os.path.join(self.cache_dir, file_name)
+        finally:
+            with self.lock:
+                self._unpin(file_name)
+
+    def get_bytes(self, s3_client, bucket: str, key: str) -> Optional[bytes]:
+        with self.pinned(s3_client, bucket, key) as file_path:
+            if file_path is None:
+                return None
+            with open(file_path, "rb") as fp:
+                return fp.read()
+
+    def open(self, s3_client, bucket: str, key: str):
+        """
+        Open the cached copy for reading, None if the object does not exist.
+        The open file stays readable if the entry is evicted afterwards.
+        """
+        with self.pinned(s3_client, bucket, key) as file_path:
+            return open(file_path, "rb") if file_path is not None else None
+
+    def download_file(self, s3_client, bucket: str, key: str, local_path: str) -> bool:
+        """
+        Drop in for s3_client.download_file, returns False if the object does not exist
+        """
+        data = self.get_bytes(s3_client, bucket, key)
+        if data is None:
+            return False
+        with open(local_path, "wb") as fp:
+            fp.write(data)
+        return True
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache() -> S3ObjectCache:
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = S3ObjectCache()
+        return _default_cache
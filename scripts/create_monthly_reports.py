@@ -1,114 +1,110 @@
 import boto3
 from datetime import datetime, timedelta
 import json
+import os
+import sys
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-def download_combine_monthly_json_files(
-    end_date,
-    bucket_name="coincommit",
-):
-    s3 = boto3.resource("s3")
-    bucket = s3.Bucket(bucket_name)
+from report_aggregation import (
+    add_exact_lists,
+    add_report,
+    fill_exact_lists,
+    serialize_report,
+    top_tokens,
+)
+from s3_cache import get_cache
+from string_table import decode_report
+from external_merge import SpillingAggregator, iter_report_tokens, write_report_stream
 
-    start_date = end_date - timedelta(days=29)
 
-    monthly_data = {}
+def _daily_reports(s3_client, bucket_name, start_date, end_date):
+    cache = get_cache()
+    for i in range((end_date - start_date).days + 1):
+        datestr = (start_date + timedelta(days=i)).strftime("%Y-%m-%d")
+        try:
+            file_content = cache.get_bytes(s3_client, bucket_name, f"reports/{datestr}/{datestr}.json")
+            if file_content is None:
+                print(f"No report for {datestr}")
+                continue
+            daily_data = decode_report(json.loads(file_content))
+        except:
+            print(f"Error downloading or parsing data for {datestr}")
+            continue
+        yield daily_data
+
 
+def _stream_combine(s3_client, bucket_name, start_date, end_date, memory_budget_mb, aggregation_path):
+    cache = get_cache()
+    aggregator = SpillingAggregator(int(memory_budget_mb * (1 << 20)))
     for i in range((end_date - start_date).days + 1):
         datestr = (start_date + timedelta(days=i)).strftime("%Y-%m-%d")
-        s3_object = bucket.Object(f"reports/{datestr}/{datestr}.json")
         try:
-            file_content = s3_object.get()["Body"].read().decode("utf-8")
-            daily_data = json.loads(file_content)
+            cached_report = cache.open(s3_client, bucket_name, f"reports/{datestr}/{datestr}.json")
+            if cached_report is None:
+                print(f"No report for {datestr}")
+                continue
+            with cached_report:
+                for token, token_data in iter_report_tokens(cached_report):
+                    aggregator.add(token, token_data)
         except:
             print(f"Error downloading or parsing data for {datestr}")
             continue
-        for token, metadata in daily_data.items():
-            if token in monthly_data:
-                existing_token_data = monthly_data[token]
-                existing_token_data["commit_count"] += metadata["commit_count"]
-                existing_token_data["lines_of_code"] += metadata["lines_of_code"]
-                existing_token_data["commit_messages"].extend(
-                    metadata["commit_messages"]
-                )
-                existing_token_data["distinct_authors"].extend(
-                    metadata["distinct_authors"]
-                )
-                if "active_repos" in metadata:
-                    if "active_repos" in existing_token_data:
-                        existing_token_data["active_repos"].extend(
-                            metadata["active_repos"]
-                        )
-                    else:
-                        existing_token_data["active_repos"] = metadata["active_repos"]
-                else:
-                    existing_token_data["active_repos"] = []
-
-                existing_token_data["commit_urls"].extend(metadata["commit_urls"])
-                existing_token_data["changed_methods"].extend(
-                    metadata["changed_methods"]
-                )
-                # these don't need to be appended, just assigned
-                if "description" in metadata:
-                    existing_token_data["description"] = metadata["description"]
-                else:
-                    existing_token_data["description"] = []
-
-                if "project_created_cmc" in metadata:
-                    existing_token_data["project_created_cmc"] = metadata[
-                        "project_created_cmc"
-                    ]
-                else:
-                    existing_token_data["project_created_cmc"] = []
-
-                merged_dict = existing_token_data["file_extensions"].copy()
-                for filetype, filecount in metadata["file_extensions"].items():
-                    if filetype in merged_dict:
-                        merged_dict[filetype] += filecount
-                    else:
-                        merged_dict[filetype] = filecount
-                existing_token_data["file_extensions"] = merged_dict
-
-                merged_dict = existing_token_data["loc_changes_by_filetype"].copy()
-                for action in ["insertions", "deletions", "net"]:
-                    actiondict = merged_dict[action]
-                    actiondict2 = metadata["loc_changes_by_filetype"][action]
-                    for filetype, filecount in actiondict2.items():
-                        if filetype in actiondict:
-                            actiondict[filetype] += filecount
-                        else:
-                            actiondict[filetype] = filecount
-                    merged_dict[action] = actiondict
-                monthly_data[token]["loc_changes_by_filetype"] = merged_dict
-            else:
-                monthly_data[token] = metadata
-
-        # de-dupe lists
-        for token, metadata in monthly_data.items():
-            monthly_data[token]["commit_messages"] = list(
-                set(metadata["commit_messages"])
-            )
-            monthly_data[token]["distinct_authors"] = list(
-                set(metadata["distinct_authors"])
-            )
-            monthly_data[token]["commit_urls"] = list(set(metadata["commit_urls"]))
-            monthly_data[token]["changed_methods"] = list(
-                set(metadata["changed_methods"])
-            )
-
-    monthly_file_content = json.dumps(monthly_data, indent=2)
+
+    with open(aggregation_path, "w") as f:
+        write_report_stream(f, aggregator.iter_merged())
+    aggregator.cleanup()
+    return aggregation_path
+
+
+def download_combine_monthly_json_files(
+    end_date,
+    bucket_name="coincommit",
+    sketch_mode=False,
+    memory_budget_mb=None,
+):
+    """
+    sketch_mode merges distinct counts as sketches and only keeps the exact lists of the top tokens,
+    at the cost of downloading the month twice.
+    memory_budget_mb parses each day token by token and spills to /tmp once the month outgrows the budget.
+    """
+    s3_client = boto3.client("s3")
+
+    start_date = end_date - timedelta(days=29)
+
+    if memory_budget_mb is not None and not sketch_mode:
+        return _stream_combine(s3_client, bucket_name, start_date, end_date, memory_budget_mb, f"/tmp/monthly.json")
+
+    monthly_data = {}
+
+    for daily_data in _daily_reports(s3_client, bucket_name, start_date, end_date):
+        add_report(monthly_data, daily_data, sketch_only=sketch_mode)
+
+    if sketch_mode:
+        displayed_tokens = top_tokens(monthly_data)
+        exact = {}
+        for daily_data in _daily_reports(s3_client, bucket_name, start_date, end_date):
+            add_exact_lists(exact, daily_data, displayed_tokens)
+        fill_exact_lists(monthly_data, exact)
+
+    monthly_file_content = json.dumps(serialize_report(monthly_data), indent=2)
     monthly_aggregation_path = f"/tmp/monthly.json"
     with open(monthly_aggregation_path, "w") as f:
         f.write(monthly_file_content)
 
     # s3_location = f'reports/{end_date.strftime("%Y-%m-%d")}/monthly.json'
-    # s3.Object(bucket_name, s3_location).put(Body=monthly_file_content)
+    # s3_client.put_object(Bucket=bucket_name, Key=s3_location, Body=monthly_file_content)
 
     return monthly_aggregation_path
 
 
 if __name__ == "__main__":
     end_date = datetime.today()
-    monthly_file_name = download_combine_monthly_json_files(end_date)
+    memory_budget_mb = None
+    if "--memory-budget-mb" in sys.argv:
+        memory_budget_mb = float(sys.argv[sys.argv.index("--memory-budget-mb") + 1])
+    monthly_file_name = download_combine_monthly_json_files(
+        end_date, sketch_mode="--sketch" in sys.argv, memory_budget_mb=memory_budget_mb
+    )
 
     print(f"monthly data has been saved to {monthly_file_name}")
@@ -0,0 +1,150 @@
+"""
+Cold start import profile for the Lambda handlers.
+
+Imports each handler in a fresh interpreter under python -X importtime, then loads every lazy_import target of the
+handler module the way an invocation that uses them does, and ranks the modules by import time.
+
+    python scripts/profile_imports.py [--handler orchestrator_lambda] [--top 25] [--eager] [--output report.json]
+
+By default handlers are profiled the way they run (LAZY_IMPORTS on), --eager profiles with every heavy dependency
+imported at module load, --compare profiles both.
+
+This covers import time only, not the rest of a cold invocation (secrets, clients, downloads), which needs AWS.
+A lazy import is only skipped by invocations that don't use it: the orchestrator's range report, reduce, sweep,
+window backfill, resume and manifest index paths, and the manifest manager's publishing steps. The worker and the
+orchestrator's grouping paths prefetch theirs in warm_up, overlapping the setup network calls. The profile splits the
+total into what is imported at module load and what is deferred to the invocation.
+"""
+
+from collections import defaultdict
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLERS = ["orchestrator_lambda", "worker_lambda", "repo_manifest_lambda", "birdbot_lambda"]
+# written to stderr between the module import and the deferred imports
+LOADED_MARKER = "handler module loaded"
+# what an invocation that uses every lazy import loads
+PROFILE_SCRIPT = """
+import sys
+import {handler} as handler
+from lambda_runtime import LazyImport
+sys.stderr.write("{marker}\\n")
+for target in list(vars(handler).values()):
+    if isinstance(target, LazyImport):
+        target.load()
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """
+    Parse -X importtime output, lines look like
+    import time:       123 |        456 |   package.module
+    """
+    modules = []
+    deferred = False
+    for line in stderr.splitlines():
+        if line == LOADED_MARKER:
+            deferred = True
+            continue
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append(
+            {
+                "module": name.strip(),
+                "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+                "self_ms": int(self_us) / 1000.0,
+                "cumulative_ms": int(cumulative_us) / 1000.0,
+                "deferred": deferred,
+            }
+        )
+    return modules
+
+
+def profile_handler(handler: str, lazy: bool = True) -> Dict:
+    env = dict(os.environ, LAZY_IMPORTS="1" if lazy else "0", PYTHONPATH=REPO_ROOT)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROFILE_SCRIPT.format(handler=handler, marker=LOADED_MARKER)],
+        cwd=REPO_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    modules = parse_importtime(result.stderr)
+
+    by_package = defaultdict(float)
+    for module in modules:
+        by_package[module["module"].split(".")[0]] += module["self_ms"]
+
+    error = None
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()[-1]
+
+    handler_entry = next((module for module in modules if module["module"] == handler), None)
+    return {
+        "handler": handler,
+        "lazy_imports": lazy,
+        "total_ms": round(sum(module["self_ms"] for module in modules), 3),
+        "load_ms": round(sum(module["self_ms"] for module in modules if not module["deferred"]), 3),
+        "deferred_ms": round(sum(module["self_ms"] for module in modules if module["deferred"]), 3),
+        "handler_cumulative_ms": handler_entry["cumulative_ms"] if handler_entry is not None else None,
+        "error": error,
+        "modules": sorted(modules, key=lambda module: module["cumulative_ms"], reverse=True),
+        "packages": dict(sorted(by_package.items(), key=lambda item: item[1], reverse=True)),
+    }
+
+
+def print_profile(profile: Dict, top: int):
+    mode = "lazy" if profile["lazy_imports"] else "eager"
+    print(
+        f"\n{profile['handler']} ({mode} imports): {round(profile['total_ms'], 1)}ms importing, "
+        f"{round(profile['load_ms'], 1)}ms at module load, {round(profile['deferred_ms'], 1)}ms deferred to warm_up"
+    )
+    if profile["error"] is not None:
+        print(f"  import failed, timings are up to the failure: {profile['error']}")
+
+    print(f"  {'package':<40} {'self ms':>10}")
+    for package, self_ms in list(profile["packages"].items())[:top]:
+        print(f"  {package:<40} {self_ms:>10.1f}")
+
+    print(f"  {'module':<60} {'cumulative ms':>14} {'self ms':>10}")
+    for module in profile["modules"][:top]:
+        print(f"  {module['module']:<60} {module['cumulative_ms']:>14.1f} {module['self_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    handlers = HANDLERS
+    if "--handler" in sys.argv:
+        handlers = [sys.argv[sys.argv.index("--handler") + 1]]
+    top = int(sys.argv[sys.argv.index("--top") + 1]) if "--top" in sys.argv else 25
+    if "--compare" in sys.argv:
+        modes = [False, True]
+    else:
+        modes = [False] if "--eager" in sys.argv else [True]
+
+    profiles = []
+    for handler in handlers:
+        for lazy in modes:
+            profile = profile_handler(handler, lazy=lazy)
+            print_profile(profile, top)
+            profiles.append(profile)
+
+    if "--compare" in sys.argv:
+        # the total barely moves, lazy imports change where the time is spent, not how much of it there is
+        print("\nlazy vs eager import time, at module load / total:")
+        for handler in handlers:
+            eager, lazy = [profile for profile in profiles if profile["handler"] == handler]
+            print(
+                f"  {handler:<30} {eager['load_ms']:>10.1f}ms / {eager['total_ms']:.1f}ms -> "
+                f"{lazy['load_ms']:>10.1f}ms / {lazy['total_ms']:.1f}ms"
+            )
+
+    if "--output" in sys.argv:
+        output_path = sys.argv[sys.argv.index("--output") + 1]
+        with open(output_path, "w") as fp:
+            json.dump(profiles, fp, indent=2)
+        print(f"\nwrote import profile to {output_path}")
@@ -0,0 +1,170 @@
+"""
+Fixed size, mergeable sketches used by sketch mode reports.
+
+A HyperLogLog answers "how many distinct values" and a Bloom filter answers "was this value seen". Both merge
+without needing the values themselves, so long windows can be joined in constant memory per token.
+
+Most tokens only see a handful of values a day, so both serialize sparsely (the set registers or bits only) until
+that stops being smaller than the dense form. A dense HyperLogLog is 1 KB and a dense Bloom filter 512 bytes.
+"""
+
+import base64
+import hashlib
+import math
+import struct
+from typing import Dict, Iterable, Optional
+
+HLL_PRECISION = 10
+BLOOM_BITS = 4096
+BLOOM_HASHES = 5
+
+
+def _hash64(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[bytearray] = None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    def add(self, value: str):
+        hashed = _hash64(value)
+        index = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remaining.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError(f"can't merge HyperLogLog precision {other.precision} into {self.precision}")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def cardinality(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # small range correction
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_dict(self) -> Dict:
+        # sparse is (index, rank) as 3 bytes per set register
+        nonzero = [(index, rank) for index, rank in enumerate(self.registers) if rank]
+        if 3 * len(nonzero) < len(self.registers):
+            packed = b"".join(struct.pack(">HB", index, rank) for index, rank in nonzero)
+            return {"p": self.precision, "sparse": base64.b64encode(packed).decode("ascii")}
+        return {"p": self.precision, "registers": base64.b64encode(bytes(self.registers)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "HyperLogLog":
+        if "sparse" in data:
+            hll = cls(data["p"])
+            for index, rank in struct.iter_unpack(">HB", base64.b64decode(data["sparse"])):
+                hll.registers[index] = rank
+            return hll
+        return cls(data["p"], bytearray(base64.b64decode(data["registers"])))
+
+
+class BloomFilter:
+    __slots__ = ("num_hashes", "bits")
+
+    def __init__(self, num_bits: int = BLOOM_BITS, num_hashes: int = BLOOM_HASHES, bits: Optional[bytearray] = None):
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray(num_bits // 8)
+
+    def _positions(self, value: str):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        num_bits = len(self.bits) * 8
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % num_bits
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def might_contain(self, value: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def merge(self, other: "BloomFilter") -> "BloomFilter":
+        if len(other.bits) != len(self.bits) or other.num_hashes != self.num_hashes:
+            raise ValueError("can't merge Bloom filters of different shapes")
+        self.bits = bytearray(a | b for a, b in zip(self.bits, other.bits))
+        return self
+
+    def to_dict(self) -> Dict:
+        # sparse is the positions of the set bits, 2 bytes each
+        positions = [
+            (byte_index << 3) + bit for byte_index, byte in enumerate(self.bits) if byte for bit in range(8)
+            if byte & (1 << bit)
+        ]
+        if 2 * len(positions) < len(self.bits):
+            packed = struct.pack(f">{len(positions)}H", *positions)
+            return {"k": self.num_hashes, "m": len(self.bits) * 8, "sparse": base64.b64encode(packed).decode("ascii")}
+        return {"k": self.num_hashes, "bits": base64.b64encode(bytes(self.bits)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BloomFilter":
+        if "sparse" in data:
+            bloom = cls(num_bits=data["m"], num_hashes=data["k"])
+            for (position,) in struct.iter_unpack(">H", base64.b64decode(data["sparse"])):
+                bloom.bits[position >> 3] |= 1 << (position & 7)
+            return bloom
+        return cls(num_hashes=data["k"], bits=bytearray(base64.b64decode(data["bits"])))
+
+
+class FieldSketch:
+    """
+    Distinct count sketch for one report list, with an optional membership filter
+    """
+
+    __slots__ = ("hll", "bloom")
+
+    def __init__(self, hll: Optional[HyperLogLog] = None, bloom: Optional[BloomFilter] = None):
+        self.hll = hll if hll is not None else HyperLogLog()
+        self.bloom = bloom
+
+    @classmethod
+    def from_values(cls, values: Iterable[str], with_bloom: bool = False) -> "FieldSketch":
+        sketch = cls(bloom=BloomFilter() if with_bloom else None)
+        for value in values:
+            sketch.hll.add(value)
+            if sketch.bloom is not None:
+                sketch.bloom.add(value)
+        return sketch
+
+    def merge(self, other: "FieldSketch") -> "FieldSketch":
+        self.hll.merge(other.hll)
+        if self.bloom is not None and other.bloom is not None:
+            self.bloom.merge(other.bloom)
+        else:
+            # membership is only answerable if every piece carried a filter
+            self.bloom = None
+        return self
+
+    def cardinality(self) -> int:
+        return self.hll.cardinality()
+
+    def might_contain(self, value: str) -> bool:
+        if self.bloom is None:
+            raise ValueError("sketch has no Bloom filter")
+        return self.bloom.might_contain(value)
+
+    def to_dict(self) -> Dict:
+        data = {"hll": self.hll.to_dict()}
+        if self.bloom is not None:
+            data["bloom"] = self.bloom.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "FieldSketch":
+        bloom = BloomFilter.from_dict(data["bloom"]) if "bloom" in data else None
+        return cls(HyperLogLog.from_dict(data["hll"]), bloom)
@@ -0,0 +1,85 @@
+"""
+String dictionary encoding for reports.
+
+Author names, repo URLs, commit messages and method names repeat across tokens and days. An encoded report stores
+every distinct string once in a table and the report lists hold integer ids into it. Decoding interns the table,
+so every copy of a string that flows through a join is the same object.
+"""
+
+import sys
+from typing import Dict, List
+
+from report_aggregation import SET_FIELDS
+
+ENCODING_NAME = "string_table_v2"
+# v1 wrote counted fields as [id, count] pairs, which made an empty one indistinguishable from an empty list
+ENCODING_NAMES = ("string_table_v1", ENCODING_NAME)
+
+
+class StringTable:
+    def __init__(self):
+        self.strings: List[str] = []
+        self.ids: Dict[str, int] = {}
+
+    def id_of(self, value: str) -> int:
+        if value not in self.ids:
+            self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return self.ids[value]
+
+
+def is_encoded(report) -> bool:
+    return isinstance(report, dict) and report.get("__encoding__") in ENCODING_NAMES
+
+
+def encode_report(report: Dict) -> Dict:
+    """
+    Encode a report (token name -> token data). List fields become lists of ids, counted fields (window state)
+    become objects of id -> count.
+    """
+    table = StringTable()
+    tokens = {}
+    for token_name, token_data in report.items():
+        encoded_data = dict(token_data)
+        for field in SET_FIELDS:
+            values = token_data.get(field)
+            if isinstance(values, dict):
+                encoded_data[field] = {str(table.id_of(value)): count for value, count in values.items()}
+            elif values is not None:
+                encoded_data[field] = [table.id_of(value) for value in values]
+        tokens[token_name] = encoded_data
+    return {"__encoding__": ENCODING_NAME, "__strings__": table.strings, "tokens": tokens}
+
+
+def intern_strings(strings: List[str]) -> List[str]:
+    return [sys.intern(value) for value in strings]
+
+
+def decode_token(token_data: Dict, strings: List[str]) -> Dict:
+    """
+    Decode one token entry in place, strings is the report's (interned) string table
+    """
+    for field in SET_FIELDS:
+        values = token_data.get(field)
+        if isinstance(values, dict):
+            token_data[field] = {strings[int(string_id)]: count for string_id, count in values.items()}
+        elif values and isinstance(values[0], list):
+            # v1 counted field
+            token_data[field] = {strings[string_id]: count for string_id, count in values}
+        elif values is not None:
+            token_data[field] = [strings[string_id] for string_id in values]
+    return token_data
+
+
+def decode_report(report):
+    """
+    Decode an encoded report, anything else (plain reports, other JSON documents) is returned untouched
+    """
+    if not is_encoded(report):
+        return report
+
+    strings = intern_strings(report["__strings__"])
+    return {
+        token_name: decode_token(token_data, strings)
+        for token_name, token_data in report["tokens"].items()
+    }
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# the modules live at the repo root, and s3_cache reads its directory at import
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("S3_CACHE_DIR", tempfile.mkdtemp(prefix="test_s3_cache_") + "/")
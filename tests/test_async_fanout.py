@@ -0,0 +1,114 @@
+import json
+import time
+from datetime import datetime
+
+import orchestrator_lambda
+from async_fanout import (
+    LocalDynamoDB,
+    LocalLambda,
+    LocalS3,
+    claim_reduce,
+    complete_worker,
+    record_completion,
+    sweep_overdue_runs,
+)
+
+REDUCER = "orchestrator"
+OPTIONS = {"sketch_mode": False, "rebuild_windows": False, "string_table": False, "merge_memory_budget_mb": None}
+START_DATE = datetime(2024, 3, 4)
+END_DATE = datetime(2024, 3, 5)
+
+
+def _local_run(crashing_workers=()):
+    s3, dynamodb, lambda_client = LocalS3(), LocalDynamoDB(), LocalLambda(timeout_secs=60.0)
+
+    def worker(event, context):
+        if event["worker_id"] in crashing_workers:
+            # killed, e.g. by its timeout, before it could write a completion record
+            return None
+        report_key = f"reports/workers/{event['run_id']}/{event['worker_id']}.json"
+        report = {
+            repo_url: {"commit_count": 1, "commit_messages": [repo_url]} for repo_url in event["repos_responsible_for"]
+        }
+        s3.put_object(Bucket="coincommit", Key=report_key, Body=json.dumps(report))
+        record = {
+            "report_path": f"s3://coincommit/{report_key}",
+            "invocation_id": context.aws_request_id,
+            "worker_duration_secs": 1.0,
+            "worker_id": str(event["worker_id"]),
+        }
+        complete_worker(
+            s3, dynamodb, lambda_client, event["run_id"], event["worker_id"], record, event["group_count"], REDUCER
+        )
+
+    reduced = []
+    lambda_client.register(orchestrator_lambda.WORKER_FUNCTION, worker)
+    lambda_client.register(
+        REDUCER,
+        lambda event, context: reduced.append(orchestrator_lambda.reduce_async_run(event["reduce_run_id"], s3=s3)),
+    )
+    return s3, dynamodb, lambda_client, reduced
+
+
+def _daily_report(s3):
+    body = s3.get_object(Bucket="coincommit", Key="reports/2024-03-05/2024-03-05.json")["Body"].read()
+    return json.loads(body)
+
+
+def test_last_worker_triggers_one_reduce():
+    s3, dynamodb, lambda_client, reduced = _local_run()
+    groups = [["a", "b"], ["c"], ["d"]]
+    orchestrator_lambda.dispatch_async_run(
+        "run1", groups, START_DATE, END_DATE, OPTIONS, s3=s3, invoke_client=lambda_client, dynamodb=dynamodb
+    )
+    lambda_client.join()
+
+    assert len(reduced) == 1
+    assert reduced[0]["missing_groups"] == [] and reduced[0]["valid_results_count"] == 3
+    assert sorted(_daily_report(s3)) == ["a", "b", "c", "d"]
+    status_key = "reports/2024-03-05/2024-03-05.status.json"
+    status = json.loads(s3.get_object(Bucket="coincommit", Key=status_key)["Body"].read())
+    assert status["partial"] is False
+    # the window reports were generated against the same client
+    assert s3.head_object(Bucket="coincommit", Key="reports/2024-03-05/weekly_raw.json")
+
+
+def test_crashed_worker_is_reduced_by_the_sweep():
+    s3, dynamodb, lambda_client, reduced = _local_run(crashing_workers={1})
+    orchestrator_lambda.dispatch_async_run(
+        "run2", [["a"], ["b"], ["c"]], START_DATE, END_DATE, OPTIONS,
+        s3=s3, invoke_client=lambda_client, dynamodb=dynamodb,
+    )
+    lambda_client.join()
+    assert reduced == []
+
+    # nothing is overdue until the deadline passes
+    assert sweep_overdue_runs(dynamodb, lambda_client, REDUCER) == []
+    assert sweep_overdue_runs(dynamodb, lambda_client, REDUCER, now=time.time() + 10 * 3600) == ["run2"]
+    lambda_client.join()
+
+    assert len(reduced) == 1 and reduced[0]["missing_groups"] == [1]
+    assert sorted(_daily_report(s3)) == ["a", "c"]
+    # a claimed run is never swept again
+    assert sweep_overdue_runs(dynamodb, lambda_client, REDUCER, now=time.time() + 10 * 3600) == []
+
+
+def test_completions_are_counted_once_and_claimed_once():
+    dynamodb = LocalDynamoDB()
+    assert record_completion(dynamodb, "run3", 0) == 1
+    # a retried or hedged worker reports again
+    assert record_completion(dynamodb, "run3", 0) == 1
+    assert record_completion(dynamodb, "run3", 1) == 2
+    assert claim_reduce(dynamodb, "run3") is True
+    assert claim_reduce(dynamodb, "run3") is False
+
+
+def test_repo_groups_of_earlier_manifests_are_pruned():
+    s3 = LocalS3()
+    old_key = orchestrator_lambda._repo_groups_key('"old"', START_DATE, END_DATE, False)
+    new_key = orchestrator_lambda._repo_groups_key('"new"', START_DATE, END_DATE, False)
+    s3.put_object(Bucket="coincommit", Key=old_key, Body=b"{}")
+    s3.put_object(Bucket="coincommit", Key=new_key, Body=b"{}")
+
+    assert orchestrator_lambda._prune_repo_groups(s3, '"new"') == 1
+    assert [s3_object["Key"] for s3_object in s3.list_objects_v2(Bucket="coincommit")["Contents"]] == [new_key]
@@ -0,0 +1,41 @@
+from datetime import datetime
+
+import orchestrator_lambda
+from async_fanout import _LocalContext
+
+OPTIONS = {"sketch_mode": False, "rebuild_windows": False, "string_table": False, "merge_memory_budget_mb": None}
+
+
+def test_a_failing_day_does_not_lose_the_others(monkeypatch):
+    def backfill_day(day, *args, **kwargs):
+        day_str = day.strftime("%Y-%m-%d")
+        if day_str == "2024-03-02":
+            raise RuntimeError("manifest download failed")
+        return {
+            "date": day_str,
+            "run_id": f"{day_str}-run",
+            "repo_url_groups": [["a"]],
+            "worker_durations": {0: 1.0},
+            "unfinished_groups": [],
+        }
+
+    monkeypatch.setattr(orchestrator_lambda, "_report_fetch_client", lambda: None)
+    monkeypatch.setattr(orchestrator_lambda, "_manifest_version", lambda s3: '"v1"')
+    monkeypatch.setattr(orchestrator_lambda, "_day_is_current", lambda s3, day_str, manifest_version: False)
+    monkeypatch.setattr(orchestrator_lambda, "_load_duration_history", lambda s3: {})
+    monkeypatch.setattr(orchestrator_lambda, "_save_duration_history", lambda s3, history: None)
+    monkeypatch.setattr(orchestrator_lambda, "_backfill_day", backfill_day)
+
+    result = orchestrator_lambda.backfill_days(
+        datetime(2024, 3, 1), datetime(2024, 3, 3), {}, OPTIONS, _LocalContext("orchestrator", "req", 900.0)
+    )
+    assert result["backfilled_days"] == ["2024-03-01", "2024-03-03"]
+    assert result["failed_days"] == {"2024-03-02": "manifest download failed"}
+    assert result["remaining_days"] == ["2024-03-02"]
+
+
+def test_lambda_client_pool_follows_the_inflight_limit():
+    # a pool smaller than the in-flight cap would queue invokes on connections
+    client = orchestrator_lambda._lambda_client(80)
+    assert client.meta.config.max_pool_connections == 80
+    assert orchestrator_lambda._lambda_client(80) is client
@@ -0,0 +1,96 @@
+import os
+import subprocess
+from types import SimpleNamespace
+
+import git_mirror_cache
+from git_mirror_cache import GitMirrorCache
+
+
+def _run(*args, cwd=None):
+    return subprocess.run(args, check=True, capture_output=True, text=True, cwd=cwd).stdout
+
+
+def _origin(tmp_path):
+    origin = tmp_path / "origin"
+    _run("git", "init", "--quiet", "-b", "main", str(origin))
+    _run("git", "config", "uploadpack.allowFilter", "true", cwd=origin)
+    (origin / "README").write_text("hello\n")
+    _run("git", "add", "README", cwd=origin)
+    _run("git", "-c", "user.name=t", "-c", "user.email=t@x.dev", "commit", "--quiet", "-m", "first", cwd=origin)
+    # a ref a --mirror clone would drag along
+    _run("git", "update-ref", "refs/pull/1/head", "HEAD", cwd=origin)
+    return f"file://{origin}"
+
+
+def _cache(tmp_path, monkeypatch, **kwargs):
+    scratch = tmp_path / "tmp"
+    scratch.mkdir(exist_ok=True)
+    monkeypatch.setattr(git_mirror_cache, "GIT_HOME_DIR", str(scratch / "git_home"))
+    for name in ("HOME", "GIT_CONFIG_GLOBAL", "GIT_NO_LAZY_FETCH"):
+        monkeypatch.setenv(name, os.environ.get(name, ""))
+    return GitMirrorCache(str(scratch / "git_mirrors"), tmp_dir=str(scratch), **kwargs)
+
+
+def test_clones_are_served_from_a_blobless_heads_only_mirror(tmp_path, monkeypatch):
+    repo_url = _origin(tmp_path)
+    cache = _cache(tmp_path, monkeypatch, budget_mb=100)
+    assert cache.prepare([repo_url]) == [repo_url]
+
+    mirror = cache.mirror_path(repo_url)
+    assert _run("git", "-C", mirror, "for-each-ref", "--format=%(refname)").split() == ["refs/heads/main"]
+    assert _run("git", "-C", mirror, "config", "remote.origin.partialclonefilter").strip() == "blob:none"
+
+    readme = _run("git", "-C", str(tmp_path / "origin"), "rev-parse", "HEAD:README").strip()
+    has_readme = ["git", "-C", mirror, "cat-file", "-e", readme]
+    assert subprocess.run(has_readme, env={**os.environ, "GIT_NO_LAZY_FETCH": "1"}).returncode != 0
+
+    # the clone goes through the mirror, which fetches the blob it is missing
+    checkout = tmp_path / "checkout"
+    _run("git", "clone", "--quiet", repo_url, str(checkout))
+    assert (checkout / "README").read_text() == "hello\n"
+    assert subprocess.run(has_readme).returncode == 0
+
+
+def test_failed_fetch_keeps_the_mirror_but_does_not_serve_it(tmp_path, monkeypatch):
+    repo_url = _origin(tmp_path)
+    cache = _cache(tmp_path, monkeypatch, budget_mb=100)
+    cache.prepare([repo_url])
+    os.rename(tmp_path / "origin", tmp_path / "gone")
+
+    assert cache.prepare([repo_url]) == []
+    assert os.path.isdir(cache.mirror_path(repo_url)) and repo_url in cache.index
+    cache.cleanup()
+    assert os.path.isdir(cache.mirror_path(repo_url))
+
+
+def test_failed_clone_leaves_nothing_behind(tmp_path, monkeypatch):
+    cache = _cache(tmp_path, monkeypatch, budget_mb=100)
+    repo_url = f"file://{tmp_path}/missing"
+    assert cache.prepare([repo_url]) == []
+    assert os.listdir(cache.mirror_dir) == ["index.json"]
+
+
+def test_limits_follow_the_size_of_tmp(tmp_path, monkeypatch):
+    monkeypatch.setattr(git_mirror_cache, "GIT_MIRROR_CACHE_MB", None)
+    monkeypatch.setattr(git_mirror_cache, "TMP_MIN_FREE_MB", None)
+    total = 512 << 20
+    disk_usage = SimpleNamespace(total=total, used=0, free=total)
+    monkeypatch.setattr(git_mirror_cache.shutil, "disk_usage", lambda path: disk_usage)
+    assert git_mirror_cache.tmp_limits(str(tmp_path)) == (256 << 20, 128 << 20)
+
+    # an explicit reserve larger than /tmp leaves no room for mirrors rather than a negative budget
+    monkeypatch.setattr(git_mirror_cache, "TMP_MIN_FREE_MB", 1024.0)
+    assert git_mirror_cache.tmp_limits(str(tmp_path)) == (0, 1024 << 20)
+
+
+def test_eviction_before_cloning_keeps_this_invocations_mirrors(tmp_path, monkeypatch):
+    repo_url = _origin(tmp_path)
+    cache = _cache(tmp_path, monkeypatch, budget_mb=100)
+    cache.prepare([repo_url])
+    cache.index["file:///old"] = {"dir": "old.git", "size": 1, "last_used": 0}
+    os.makedirs(os.path.join(cache.mirror_dir, "old.git"))
+
+    cache.budget_bytes = 0
+    cache.prepare([repo_url])
+    assert list(cache.index) == [repo_url]
+    assert not os.path.exists(os.path.join(cache.mirror_dir, "old.git"))
@@ -0,0 +1,70 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import orchestrator_lambda
+from async_fanout import LocalS3
+from manifest_index import MANIFEST_INDEX_KEY, ManifestFormatError, ManifestIndex, build_index
+from manifest_versions import MANIFEST_VERSIONS_KEY, manifest_hash
+
+MANIFEST = {
+    "BTC": {
+        "repos": [
+            {"repo_url": "https://github.com/bitcoin/bitcoin", "size_mb": 500.0, "last_activity": "2024-03-04T12:00Z"},
+            {"repo_url": "https://github.com/bitcoin/bips", "size_mb": 20, "last_activity": "2020-01-01T00:00Z"},
+        ]
+    },
+    "ETH": {"repos": [{"repo_url": "https://github.com/ethereum/go-ethereum", "size_mb": 400.0}]},
+}
+START_DATE = datetime(2024, 3, 4)
+END_DATE = datetime(2024, 3, 5)
+
+
+def _published(tmp_path, manifest, index_sha256=None, published_on="2024-03-04"):
+    manifest_path = tmp_path / "repo_manifest.json"
+    manifest_path.write_text(json.dumps(manifest))
+    sha256 = manifest_hash(manifest)
+    index_path = build_index(str(manifest_path), sha256=index_sha256 or sha256)
+
+    s3 = LocalS3()
+    with open(index_path, "rb") as fp:
+        s3.put_object(Bucket="coincommit", Key=MANIFEST_INDEX_KEY, Body=fp.read())
+    versions = {"sha256": sha256, "versions": [{"date": published_on, "sha256": sha256}]}
+    s3.put_object(Bucket="coincommit", Key=MANIFEST_VERSIONS_KEY, Body=json.dumps(versions))
+    return s3, index_path
+
+
+def test_index_lookups(tmp_path):
+    _, index_path = _published(tmp_path, MANIFEST)
+    with ManifestIndex(index_path) as index:
+        assert index.token_repos("ETH") == ["https://github.com/ethereum/go-ethereum"]
+        assert index.repo("https://github.com/bitcoin/bips")["size_mb"] == 20.0
+        active = [repo_url for repo_url, _, _ in index.iter_repos(active_since=START_DATE, largest_first=True)]
+        assert active == ["https://github.com/bitcoin/bitcoin", "https://github.com/ethereum/go-ethereum"]
+
+
+def test_repo_without_a_size_fails_the_build(tmp_path):
+    manifest = {"BTC": {"repos": [{"repo_url": "https://github.com/bitcoin/bitcoin", "size": 1024}]}}
+    manifest_path = tmp_path / "repo_manifest.json"
+    manifest_path.write_text(json.dumps(manifest))
+    with pytest.raises(ManifestFormatError, match="size_mb"):
+        build_index(str(manifest_path))
+
+
+def test_groups_from_a_current_index(tmp_path):
+    s3, _ = _published(tmp_path, MANIFEST)
+    urls, group_sizes, repo_sizes = orchestrator_lambda._group_repos_from_index(s3, START_DATE, END_DATE, False)
+    assert sorted(url for group in urls for url in group) == sorted(repo_sizes)
+    assert "https://github.com/bitcoin/bips" not in repo_sizes
+    assert sum(group_sizes) == 900.0
+
+
+def test_stale_index_backfills_and_past_windows_fall_back(tmp_path):
+    s3, _ = _published(tmp_path, MANIFEST, index_sha256="0" * 64)
+    assert orchestrator_lambda._group_repos_from_index(s3, START_DATE, END_DATE, False) is None
+
+    s3, _ = _published(tmp_path, MANIFEST)
+    assert orchestrator_lambda._group_repos_from_index(s3, START_DATE, END_DATE, True) is None
+    s3, _ = _published(tmp_path, MANIFEST, published_on="2024-03-06")
+    assert orchestrator_lambda._group_repos_from_index(s3, START_DATE, END_DATE, False) is None
@@ -0,0 +1,90 @@
+import io
+import json
+from datetime import date
+
+from botocore.exceptions import ClientError
+
+import repo_manifest_lambda
+from manifest_index import MANIFEST_INDEX_KEY
+from manifest_versions import MANIFEST_KEY, MANIFEST_VERSIONS_KEY, load_versions, publish_manifest
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        self.uploads += 1
+        with open(Filename, "rb") as fp:
+            self.objects[Key] = fp.read()
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"Metadata": {}}
+
+
+def _manifest(size_mb):
+    # the layout manifest_index reads
+    return {"BTC": {"repos": [{"repo_url": "https://github.com/bitcoin/bitcoin", "size_mb": size_mb}]}}
+
+
+def _publish(s3, tmp_path, manifest, day):
+    path = tmp_path / "repo_manifest.json"
+    path.write_text(json.dumps(manifest))
+    return publish_manifest(s3, str(path), today=day)
+
+
+def test_dated_copies_are_written_without_uploading_an_unchanged_manifest(tmp_path):
+    s3 = FakeS3()
+    manifest = _manifest(1.0)
+    assert _publish(s3, tmp_path, manifest, date(2024, 3, 4))["changed"] is True
+    assert _publish(s3, tmp_path, manifest, date(2024, 3, 5))["changed"] is False
+    assert s3.uploads == 1
+    for day in ("2024-03-04", "2024-03-05"):
+        assert json.loads(s3.objects[f"assets/repo_manifest_{day}.json"]) == manifest
+
+    changed = _manifest(2.0)
+    assert _publish(s3, tmp_path, changed, date(2024, 3, 6))["changed"] is True
+    assert json.loads(s3.objects["assets/repo_manifest_2024-03-06.json"]) == changed
+    assert json.loads(s3.objects[MANIFEST_KEY]) == changed
+    versions = load_versions(s3)
+    assert [version["date"] for version in versions["versions"]] == ["2024-03-04", "2024-03-06"]
+    assert versions["sha256"] == versions["versions"][-1]["sha256"]
+    # only the manifest, its dated copies and the versions record are stored
+    assert set(s3.objects) == {MANIFEST_KEY, MANIFEST_VERSIONS_KEY} | {
+        f"assets/repo_manifest_{day}.json" for day in ("2024-03-04", "2024-03-05", "2024-03-06")
+    }
+
+
+def test_a_manifest_the_index_cant_read_is_still_published(tmp_path, monkeypatch):
+    s3 = FakeS3()
+    path = tmp_path / "repo_manifest.json"
+    path.write_text(json.dumps({"BTC": {"repos": [{"repo_url": "https://github.com/bitcoin/bitcoin"}]}}))
+
+    class ManifestManager:
+        def __init__(self, secrets):
+            pass
+
+        def update_repo_metadata(self):
+            return str(path)
+
+    monkeypatch.setattr(repo_manifest_lambda, "get_secrets", lambda: {})
+    monkeypatch.setattr(repo_manifest_lambda, "get_client", lambda service: s3)
+    monkeypatch.setattr(repo_manifest_lambda, "ManifestManager", ManifestManager)
+
+    assert repo_manifest_lambda.lambda_handler({}, None) == {"status": "done", "manifest_changed": True}
+    assert s3.objects[MANIFEST_KEY] == path.read_bytes()
+    assert MANIFEST_INDEX_KEY not in s3.objects
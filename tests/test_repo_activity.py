@@ -0,0 +1,19 @@
+from datetime import datetime
+
+from repo_activity import filter_active
+
+START_DATE = datetime(2024, 3, 4)
+INDEX = {
+    "old": {"pushed_at": "2023-01-01T00:00:00Z", "checked_at": 0},
+    "new": {"pushed_at": "2024-03-04T12:00:00Z", "checked_at": 0},
+}
+
+
+def test_groups_shrink_in_place_and_keep_their_size_bound():
+    groups, sizes, dropped = filter_active(
+        [["old", "new"], ["old"], ["unknown"]], [700.0, 300.0, 50.0], INDEX, START_DATE
+    )
+    # repos without an entry are kept, emptied groups are dropped, nothing is repacked
+    assert groups == [["new"], ["unknown"]]
+    assert sizes == [700.0, 50.0]
+    assert dropped == 2
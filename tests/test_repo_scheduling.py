@@ -0,0 +1,27 @@
+from repo_scheduling import plan_groups
+
+
+def test_group_sizes_stay_a_bound_without_per_repo_sizes():
+    # one big repo next to a small one, and a group of small repos
+    groups = [["big", "tiny"], ["a", "b", "c", "d"]]
+    sizes = [900.0, 400.0]
+    history = {repo_url: {"secs": 10.0, "runs": 1} for repo_url in ["big", "tiny", "a", "b", "c", "d"]}
+    history["big"]["secs"] = 100.0
+
+    planned, planned_sizes = plan_groups(groups, sizes, history, mem_limit_mb=1000.0)
+    assert sorted(repo_url for group in planned for repo_url in group) == ["a", "b", "big", "c", "d", "tiny"]
+    for group, size in zip(planned, planned_sizes):
+        # charged the full size of every original group it draws from
+        charged = sum(size for origin, size in zip(groups, sizes) if set(origin) & set(group))
+        assert size == charged <= 1000.0 or len(group) == 1
+
+
+def test_per_repo_sizes_are_charged_exactly():
+    groups = [["big", "tiny"], ["a", "b"]]
+    repo_sizes = {"big": 880.0, "tiny": 20.0, "a": 200.0, "b": 200.0}
+    history = {"big": {"secs": 100.0, "runs": 1}, "tiny": {"secs": 50.0, "runs": 1}}
+
+    planned, planned_sizes = plan_groups(groups, [900.0, 400.0], history, 1000.0, repo_sizes=repo_sizes)
+    for group, size in zip(planned, planned_sizes):
+        assert size == sum(repo_sizes[repo_url] for repo_url in group)
+        assert size <= 1000.0
@@ -0,0 +1,54 @@
+import json
+
+import orchestrator_lambda
+from async_fanout import LocalDynamoDB, LocalLambda, LocalS3, _LocalContext, save_run, write_completion
+from orchestrator_lambda import DURATION_HISTORY_KEY
+
+OPTIONS = {"sketch_mode": False, "rebuild_windows": False, "string_table": False, "merge_memory_budget_mb": None}
+GROUPS = [["a"], ["b"], ["c"]]
+
+
+def _worker(s3):
+    def worker(event, context):
+        report_key = f"reports/workers/{event['run_id']}/{event['worker_id']}.json"
+        report = {repo_url: {"commit_count": 1} for repo_url in event["repos_responsible_for"]}
+        s3.put_object(Bucket="coincommit", Key=report_key, Body=json.dumps(report))
+        return {
+            "report_path": f"s3://coincommit/{report_key}",
+            "worker_duration_secs": 30.0,
+            "worker_id": str(event["worker_id"]),
+        }
+
+    return worker
+
+
+def _history(s3):
+    return json.loads(s3.get_object(Bucket="coincommit", Key=DURATION_HISTORY_KEY)["Body"].read())
+
+
+def test_resume_records_each_groups_duration_once(monkeypatch):
+    s3, dynamodb, lambda_client = LocalS3(), LocalDynamoDB(), LocalLambda()
+    lambda_client.register(orchestrator_lambda.WORKER_FUNCTION, _worker(s3))
+    monkeypatch.setattr(orchestrator_lambda, "get_secrets", lambda: {})
+    monkeypatch.setattr(orchestrator_lambda, "_report_fetch_client", lambda: s3)
+    monkeypatch.setattr(orchestrator_lambda, "_runs_client", lambda: dynamodb)
+    monkeypatch.setattr(orchestrator_lambda, "_lambda_client", lambda *args, **kwargs: lambda_client)
+
+    # a partial run: group 0 came back to the orchestrator, which saved its duration, group 1 was still running
+    # at the deadline and checkpointed itself, group 2 never ran
+    run_id = "2024-03-05-partial"
+    save_run(s3, run_id, {"start_date": "2024-03-04", "end_date": "2024-03-05", "repo_url_groups": GROUPS,
+                          "options": OPTIONS, "dispatched_at": 0.0})
+    context = _LocalContext("orchestrator", "req", 900.0)
+    for worker_id, duration_recorded in ((0, True), (1, False)):
+        record = _worker(s3)({"run_id": run_id, "worker_id": worker_id, "repos_responsible_for": GROUPS[worker_id]},
+                             context)
+        if duration_recorded:
+            record["duration_recorded"] = True
+        write_completion(s3, run_id, worker_id, record)
+    s3.put_object(Bucket="coincommit", Key=DURATION_HISTORY_KEY, Body=json.dumps({"a": {"secs": 30.0, "runs": 1}}))
+
+    result = orchestrator_lambda._handle_event({"resume_run_id": run_id}, context)
+
+    assert result["valid_results_count"] == 3
+    assert {repo_url: entry["runs"] for repo_url, entry in _history(s3).items()} == {"a": 1, "b": 1, "c": 1}
@@ -0,0 +1,64 @@
+import orchestrator_lambda
+from rollup_pyramid import child_keys
+
+REPORT = {"BTC": {"commit_count": 1, "lines_of_code": 1, "commit_messages": ["fix"]}}
+
+
+class RollupStore:
+    def __init__(self):
+        self.rollups = {}
+        self.deleted = []
+
+    def load(self, s3_client, level, key):
+        return self.rollups.get((level, key))
+
+    def save(self, s3_client, level, key, children, aggregate, sealed):
+        self.rollups[(level, key)] = {"children": sorted(children), "sealed": sealed, "aggregate": aggregate}
+
+    def delete_object(self, Bucket, Key):
+        self.deleted.append(Key)
+
+
+def _patch(monkeypatch, store):
+    monkeypatch.setattr(orchestrator_lambda, "_load_rollup", store.load)
+    monkeypatch.setattr(orchestrator_lambda, "_save_rollup", store.save)
+    monkeypatch.setattr(orchestrator_lambda, "_rollup_aggregate", lambda rollup: rollup["aggregate"])
+
+
+def test_rollup_seals_only_once_every_child_is_in(monkeypatch):
+    store = RollupStore()
+    _patch(monkeypatch, store)
+    days = child_keys("week", "2024-W10")
+
+    # the last day of the week arrives first, e.g. from a backfill
+    sealed, _ = orchestrator_lambda._add_to_rollup(
+        store, "week", "2024-W10", days[-1], orchestrator_lambda.add_report({}, REPORT)
+    )
+    assert not sealed
+    for day in days[:-1]:
+        sealed, aggregate = orchestrator_lambda._add_to_rollup(
+            store, "week", "2024-W10", day, orchestrator_lambda.add_report({}, REPORT)
+        )
+    assert sealed
+    assert aggregate["BTC"].commit_count == len(days)
+
+
+def test_rebuild_that_loses_a_child_unseals(monkeypatch):
+    store = RollupStore()
+    _patch(monkeypatch, store)
+    days = child_keys("week", "2024-W10")
+    for day in days:
+        orchestrator_lambda._add_to_rollup(store, "week", "2024-W10", day, orchestrator_lambda.add_report({}, REPORT))
+    assert store.rollups[("week", "2024-W10")]["sealed"]
+
+    # regenerating a day rebuilds from the others, and one of them is gone
+    monkeypatch.setattr(
+        orchestrator_lambda,
+        "_child_aggregate",
+        lambda s3_client, level, key: None if key == days[0] else orchestrator_lambda.add_report({}, REPORT),
+    )
+    sealed, _ = orchestrator_lambda._add_to_rollup(
+        store, "week", "2024-W10", days[1], orchestrator_lambda.add_report({}, REPORT)
+    )
+    assert not sealed
+    assert store.deleted == [orchestrator_lambda._rollup_key("week", "2024-W10", sealed=True)]
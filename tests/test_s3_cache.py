@@ -0,0 +1,58 @@
+import io
+import os
+
+from botocore.exceptions import ClientError
+
+from s3_cache import S3ObjectCache
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def put(self, key: str, body: bytes):
+        self.objects[key] = (body, f'"{key}-{len(body)}-{body[:4].hex()}"')
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body, etag = self.objects[Key]
+        if IfNoneMatch == etag:
+            raise ClientError({"Error": {"Code": "304"}, "ResponseMetadata": {"HTTPStatusCode": 304}}, "GetObject")
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+
+def test_entry_over_budget_is_readable_while_pinned(tmp_path):
+    s3 = FakeS3()
+    s3.put("big", b"x" * 4096)
+    cache = S3ObjectCache(str(tmp_path), max_mb=1024 / (1 << 20))
+
+    with cache.pinned(s3, "bucket", "big") as path:
+        assert open(path, "rb").read() == b"x" * 4096
+    # released, so the next eviction can drop it
+    s3.put("other", b"y" * 10)
+    assert cache.get_bytes(s3, "bucket", "other") == b"y" * 10
+    assert not os.path.exists(path)
+
+
+def test_pinned_entry_survives_eviction_and_replacement(tmp_path):
+    s3 = FakeS3()
+    s3.put("a", b"a" * 600)
+    cache = S3ObjectCache(str(tmp_path), max_mb=1000 / (1 << 20))
+
+    with cache.pinned(s3, "bucket", "a") as a_path:
+        # fetching b pushes the cache over budget, a is in use so it stays
+        s3.put("b", b"b" * 600)
+        assert cache.get_bytes(s3, "bucket", "b") == b"b" * 600
+        # a newer version of a doesn't delete the copy being read
+        s3.put("a", b"A" * 600)
+        assert cache.get_bytes(s3, "bucket", "a") == b"A" * 600
+        assert open(a_path, "rb").read() == b"a" * 600
+    assert not os.path.exists(a_path)
+    assert cache.pins == {}
+
+
+def test_missing_object(tmp_path):
+    cache = S3ObjectCache(str(tmp_path))
+    assert cache.get_bytes(FakeS3(), "bucket", "missing") is None
+    assert cache.download_file(FakeS3(), "bucket", "missing", str(tmp_path / "out")) is False
@@ -0,0 +1,51 @@
+import json
+
+from report_aggregation import add_report, serialize_report, serialize_sketches
+from sketches import BloomFilter, FieldSketch, HyperLogLog
+
+
+def test_sparse_sketches_round_trip_and_stay_small():
+    values = [f"author{i}@x.dev" for i in range(20)]
+    sketch = FieldSketch.from_values(values, with_bloom=True)
+    data = sketch.to_dict()
+    assert "sparse" in data["hll"] and "sparse" in data["bloom"]
+    assert len(json.dumps(data)) < 500
+
+    restored = FieldSketch.from_dict(json.loads(json.dumps(data)))
+    assert restored.hll.registers == sketch.hll.registers
+    assert restored.bloom.bits == sketch.bloom.bits
+    assert all(restored.might_contain(value) for value in values)
+
+
+def test_dense_sketches_round_trip():
+    hll = HyperLogLog()
+    bloom = BloomFilter()
+    for i in range(5000):
+        hll.add(str(i))
+        bloom.add(str(i))
+    assert "registers" in hll.to_dict() and "bits" in bloom.to_dict()
+    assert HyperLogLog.from_dict(hll.to_dict()).registers == hll.registers
+    assert BloomFilter.from_dict(bloom.to_dict()).bits == bloom.bits
+
+
+def test_sidecar_sketches_match_sketches_built_from_lists():
+    report = {
+        "BTC": {
+            "commit_count": 3,
+            "lines_of_code": 7,
+            "commit_messages": ["fix"],
+            "distinct_authors": ["a@x.dev", "b@x.dev"],
+            "commit_urls": ["u1", "u2", "u3"],
+            "changed_methods": [],
+            "active_repos": ["bitcoin/bitcoin"],
+        }
+    }
+    exact = add_report({}, report)
+    sidecar = json.loads(json.dumps(serialize_sketches(exact)))
+    # the report itself carries no sketches
+    assert "sketches" not in serialize_report(exact)["BTC"]
+
+    from_sidecar = serialize_report(add_report({}, report, sketch_only=True, sketches=sidecar))
+    from_lists = serialize_report(add_report({}, report, sketch_only=True))
+    assert from_sidecar == from_lists
+    assert from_sidecar["BTC"]["distinct_counts"] == {"distinct_authors": 2, "active_repos": 1, "commit_urls": 3}
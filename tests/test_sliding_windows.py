@@ -0,0 +1,70 @@
+import json
+from datetime import date, timedelta
+
+import orchestrator_lambda
+from async_fanout import LocalS3
+
+FIRST_DAY = date(2024, 3, 1)
+
+
+def _day(n: int) -> date:
+    return FIRST_DAY + timedelta(days=n)
+
+
+def _put_day(s3, n: int, commit_count: int, message: str = None):
+    day_str = _day(n).strftime("%Y-%m-%d")
+    message = message if message is not None else f"m{n}"
+    report = {"BTC": {"commit_count": commit_count, "lines_of_code": commit_count, "commit_messages": [message]}}
+    s3.put_object(Bucket="coincommit", Key=f"reports/{day_str}/{day_str}.json", Body=json.dumps(report))
+
+
+def _weekly(s3, n: int):
+    day_str = _day(n).strftime("%Y-%m-%d")
+    body = s3.get_object(Bucket="coincommit", Key=f"reports/{day_str}/weekly_raw.json")["Body"].read()
+    return json.loads(body)["BTC"]
+
+
+def _slide(s3, n: int):
+    orchestrator_lambda._generate_windowed_report(7, "weekly_raw", report_date=_day(n), s3_client=s3)
+
+
+def _built_windows(s3, last_day: int):
+    for n in range(last_day + 1):
+        _put_day(s3, n, 1)
+    for n in range(7, last_day + 1):
+        _slide(s3, n)
+
+
+def test_windows_covering_a_regenerated_day_are_rebuilt():
+    s3 = LocalS3()
+    _built_windows(s3, 9)
+
+    # day 2 is scraped again after the windows through day 9 were slid from its first version
+    _put_day(s3, 2, 5, message="m2 late")
+    orchestrator_lambda._rebuild_windows_covering(_day(2), s3_client=s3)
+    assert _weekly(s3, 9)["commit_count"] == 8 + 4
+    assert sorted(_weekly(s3, 9)["commit_messages"]) == sorted(["m2 late"] + [f"m{n}" for n in range(3, 10)])
+
+    # day 2 leaves the window cleanly
+    _put_day(s3, 10, 1)
+    _slide(s3, 10)
+    assert _weekly(s3, 10)["commit_count"] == 8
+    assert "m2 late" not in _weekly(s3, 10)["commit_messages"]
+
+
+def test_outgoing_day_that_changed_rebuilds_the_window():
+    s3 = LocalS3()
+    _built_windows(s3, 9)
+
+    # regenerated with commits the window never saw, without the windows being rebuilt
+    _put_day(s3, 2, 5, message="m2 late")
+    _put_day(s3, 10, 1)
+    _slide(s3, 10)
+    assert _weekly(s3, 10)["commit_count"] == 8
+
+
+def test_later_window_states_stop_at_the_range():
+    s3 = LocalS3()
+    _built_windows(s3, 9)
+    states = orchestrator_lambda._later_window_states(s3, _day(1), 7)
+    assert states == {"weekly_raw": [_day(7), _day(8)]}
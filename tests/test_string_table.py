@@ -0,0 +1,55 @@
+import json
+
+from report_aggregation import add_report, load_state, serialize_report, serialize_state
+from string_table import decode_report, encode_report, is_encoded
+
+REPORT = {
+    "BTC": {
+        "commit_count": 2,
+        "lines_of_code": 10,
+        "commit_messages": ["fix", "add"],
+        "distinct_authors": ["a@x.dev"],
+        "commit_urls": ["https://github.com/bitcoin/bitcoin/commit/1", "https://github.com/bitcoin/bitcoin/commit/2"],
+        "changed_methods": [],
+        "active_repos": [],
+        "file_extensions": {".cpp": 2},
+        "loc_changes_by_filetype": {"insertions": {".cpp": 12}, "deletions": {".cpp": 2}, "net": {".cpp": 10}},
+    }
+}
+
+
+def _round_trip(document):
+    return decode_report(json.loads(json.dumps(encode_report(document))))
+
+
+def test_state_with_empty_counted_fields_round_trips():
+    state = serialize_state(add_report({}, REPORT))
+    assert state["BTC"]["active_repos"] == {}
+
+    decoded = _round_trip(state)
+
+    assert decoded["BTC"]["active_repos"] == {}
+    assert decoded["BTC"]["changed_methods"] == {}
+    assert serialize_report(load_state(decoded)) == serialize_report(load_state(state))
+
+
+def test_report_lists_round_trip():
+    assert _round_trip(REPORT) == REPORT
+
+
+def test_v1_state_still_decodes():
+    v1 = {
+        "__encoding__": "string_table_v1",
+        "__strings__": ["a@x.dev"],
+        "tokens": {"BTC": {"distinct_authors": [[0, 3]], "active_repos": [], "report_count": 1}},
+    }
+
+    decoded = decode_report(v1)
+
+    assert decoded["BTC"]["distinct_authors"] == {"a@x.dev": 3}
+    assert load_state(decoded)["BTC"].active_repos == {}
+
+
+def test_non_report_documents_pass_through():
+    assert not is_encoded([".py", ".js"])
+    assert decode_report([".py", ".js"]) == [".py", ".js"]
@@ -0,0 +1,230 @@
+"""
+Phase tracing and metrics for the handlers.
+
+A handler starts a trace per invocation. Code under it wraps its phases in spans and records metric values and
+counters, from any thread. At the end of the invocation flush() emits:
+
+- CloudWatch embedded metric format (EMF) lines on stdout, which CloudWatch Logs turns into metrics without any API
+  calls. Every span becomes a {name}_secs metric, and metrics with many values (per worker durations, per report
+  downloads) keep all of them, so CloudWatch has the full distribution.
+- one trace summary line, with count/total/p50/p90/max per phase and metric.
+- with TRACE_JSONL set, every span and the summary appended to that file, for runs off Lambda.
+
+Without an active trace (scripts, benchmarks) spans and metrics are no-ops.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+TRACE_NAMESPACE = "CoinCommit"
+TRACE_JSONL = os.environ.get("TRACE_JSONL")
+# EMF lines are only worth printing where CloudWatch Logs reads them
+TRACE_EMF = os.environ.get("TRACE_EMF", "1" if "AWS_LAMBDA_FUNCTION_NAME" in os.environ else "0") != "0"
+# EMF limits per record
+EMF_MAX_METRICS = 100
+EMF_MAX_VALUES = 100
+
+
+def _percentile(ordered: List[float], percentile: float) -> float:
+    return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+
+def _summarize(values: List[float]) -> Dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "total": round(sum(ordered), 3),
+        "p50": round(_percentile(ordered, 0.5), 3),
+        "p90": round(_percentile(ordered, 0.9), 3),
+        "max": round(ordered[-1], 3),
+    }
+
+
+class Tracer:
+    def __init__(self, function_name: str, enabled: bool = True, **properties):
+        self.enabled = enabled
+        self.trace_id = uuid.uuid4().hex
+        self.dimensions = {"Function": function_name}
+        self.properties = dict(properties)
+        self.started = time.time()
+        self.spans: List[Dict] = []
+        # metric name -> {"unit", "values"}, counters are summed into a single value
+        self.metrics: Dict[str, Dict] = {}
+        self.counters: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _stack(self) -> List[Dict]:
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Time the block as a span, nested under the span this thread is in
+        """
+        if not self.enabled:
+            yield {}
+            return
+        stack = self._stack()
+        record = {
+            "name": name,
+            "span_id": uuid.uuid4().hex[:16],
+            "parent_id": stack[-1]["span_id"] if stack else None,
+            "start": time.time(),
+            "attributes": attributes,
+        }
+        stack.append(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = repr(e)[:500]
+            raise e
+        finally:
+            record["secs"] = time.perf_counter() - started
+            stack.pop()
+            with self.lock:
+                self.spans.append(record)
+            self.record(f"{name}_secs", record["secs"])
+
+    def record(self, name: str, value: float, unit: str = "Seconds"):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.metrics.setdefault(name, {"unit": unit, "values": []})["values"].append(value)
+
+    def count(self, name: str, value: float = 1, unit: str = "Count"):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters.setdefault(name, {"unit": unit, "value": 0})["value"] += value
+
+    def set_property(self, key: str, value):
+        self.properties[key] = value
+
+    def emf_records(self) -> List[Dict]:
+        """
+        The metrics as EMF records, metrics with more values than a record holds are spread over several
+        """
+        with self.lock:
+            metrics = {name: dict(metric, values=list(metric["values"])) for name, metric in self.metrics.items()}
+            counters = {name: dict(counter) for name, counter in self.counters.items()}
+
+        records = []
+        chunk = 0
+        while True:
+            values = {
+                name: metric["values"][chunk * EMF_MAX_VALUES : (chunk + 1) * EMF_MAX_VALUES]
+                for name, metric in metrics.items()
+            }
+            values = {name: chunk_values for name, chunk_values in values.items() if chunk_values}
+            if chunk == 0:
+                values.update({name: counter["value"] for name, counter in counters.items()})
+            if len(values) == 0:
+                break
+            names = sorted(values)
+            for start in range(0, len(names), EMF_MAX_METRICS):
+                record_names = names[start : start + EMF_MAX_METRICS]
+                units = {name: (metrics.get(name) or counters[name])["unit"] for name in record_names}
+                records.append(
+                    {
+                        "_aws": {
+                            "Timestamp": int(self.started * 1000),
+                            "CloudWatchMetrics": [
+                                {
+                                    "Namespace": TRACE_NAMESPACE,
+                                    "Dimensions": [list(self.dimensions)],
+                                    "Metrics": [{"Name": name, "Unit": units[name]} for name in record_names],
+                                }
+                            ],
+                        },
+                        **self.dimensions,
+                        "trace_id": self.trace_id,
+                        **self.properties,
+                        **{name: values[name] for name in record_names},
+                    }
+                )
+            chunk += 1
+        return records
+
+    def summary(self) -> Dict:
+        with self.lock:
+            spans_by_name: Dict[str, List[float]] = {}
+            for span in self.spans:
+                spans_by_name.setdefault(span["name"], []).append(span["secs"])
+            metrics = {
+                name: _summarize(metric["values"])
+                for name, metric in self.metrics.items()
+                if not name.endswith("_secs") or name[: -len("_secs")] not in spans_by_name
+            }
+            counters = {name: counter["value"] for name, counter in self.counters.items()}
+        return {
+            "trace_id": self.trace_id,
+            **self.dimensions,
+            **self.properties,
+            "total_secs": round(time.time() - self.started, 3),
+            "phases": {name: _summarize(secs) for name, secs in spans_by_name.items()},
+            "metrics": metrics,
+            "counters": counters,
+        }
+
+    def flush(self):
+        if not self.enabled:
+            return
+        if TRACE_EMF:
+            for record in self.emf_records():
+                print(json.dumps(record, default=str))
+        summary = self.summary()
+        print("trace summary: " + json.dumps(summary, default=str))
+        if TRACE_JSONL:
+            with self.lock:
+                spans = list(self.spans)
+            with open(TRACE_JSONL, "a") as fp:
+                for span in sorted(spans, key=lambda span: span["start"]):
+                    fp.write(json.dumps({"type": "span", "trace_id": self.trace_id, **span}, default=str) + "\n")
+                fp.write(json.dumps({"type": "summary", **summary}, default=str) + "\n")
+
+
+_disabled = Tracer("none", enabled=False)
+_active: Optional[Tracer] = None
+
+
+def start_trace(function_name: str, **properties) -> Tracer:
+    global _active
+    _active = Tracer(function_name, **properties)
+    return _active
+
+
+def get_tracer() -> Tracer:
+    return _active if _active is not None else _disabled
+
+
+def span(name: str, **attributes):
+    return get_tracer().span(name, **attributes)
+
+
+def record(name: str, value: float, unit: str = "Seconds"):
+    get_tracer().record(name, value, unit)
+
+
+def count(name: str, value: float = 1, unit: str = "Count"):
+    get_tracer().count(name, value, unit)
+
+
+def traced(name: str, fn: Callable) -> Callable:
+    """
+    fn wrapped in a span, for work handed to another thread (warm_up tasks)
+    """
+
+    def run(*args, **kwargs):
+        with span(name):
+            return fn(*args, **kwargs)
+
+    return run
@@ -1,32 +1,28 @@
-from batch_scraper.run import Runner
+from async_fanout import complete_worker
+from git_mirror_cache import GitMirrorCache
+from lambda_runtime import get_client, get_secrets, lazy_import, warm_up
 
-import boto3
-from botocore.exceptions import ClientError
-import json
-import os
 from typing import Dict
 import time
 
+# imported in the background while the git mirrors are fetched
+Runner = lazy_import("batch_scraper.run", "Runner")
 
-def get_secrets() -> Dict[str, str]:
-    secret_name = "coincommitsecrets"
-    region_name = "us-west-1"
+# async runs: the worker completing a run invokes the orchestrator to reduce it
+ORCHESTRATOR_FUNCTION = "arn:aws:lambda:us-west-1:665809458133:function:scrape-master"
 
-    # Create a Secrets Manager client
-    session = boto3.session.Session()
-    client = session.client(service_name="secretsmanager", region_name=region_name)
 
-    try:
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-    except ClientError as e:
-        # For a list of exceptions thrown, see
-        # https://docs.aws.amazon.com/secretsmanager/latest/apireference/API_GetSecretValue.html
-        print("STS get_secrets:", e)
-        raise e
-
-    # Decrypts secret using the associated KMS key.
-    secrets = get_secret_value_response["SecretString"]
-    return json.loads(secrets)
+def _complete_async(event, record: Dict):
+    complete_worker(
+        get_client("s3"),
+        get_client("dynamodb"),
+        get_client("lambda"),
+        event["run_id"],
+        event["worker_id"],
+        record,
+        int(event["group_count"]),
+        ORCHESTRATOR_FUNCTION,
+    )
 
 
 def lambda_handler(event, context):
@@ -43,9 +39,18 @@ def lambda_handler(event, context):
             f"{start_date} thru {end_date}, repos_for_processing contains {len(repos_for_processing)} items: {repos_for_processing}"
         )
 
-    secrets: Dict[str, str] = get_secrets()
+    # secrets and clients come up while the mirrors are fetched, warm containers have them cached already
+    setup = warm_up(secrets=get_secrets, s3_client=lambda: get_client("s3"), runner=Runner.load)
 
     start = time.time()
+    # serve the scraper's clones from mirrors kept across warm invocations
+    mirror_cache = GitMirrorCache()
+    mirrored = mirror_cache.prepare(repos_for_processing)
+    print(f"{len(mirrored)}/{len(repos_for_processing)} repos served from local mirrors, {round(time.time() - start, 2)}s")
+
+    secrets: Dict[str, str] = setup["secrets"].result()
+    setup["runner"].result()
+
     runner = Runner(
         start_date=start_date,
         end_date=end_date,
@@ -54,10 +59,19 @@ def lambda_handler(event, context):
         repos_responsible_for=repos_for_processing,
         sts_secrets=secrets,
     )
-    s3_generated_report_path = runner.run()
-
-    # cleanup
-    os.system("rm -rf /tmp/*")
+    try:
+        s3_generated_report_path = runner.run()
+    except Exception as e:
+        if "run_id" not in event:
+            raise e
+        # async runs wait on a completion record from every group, record the failure instead of dying silently
+        print(f"runner failed: {e}")
+        failure = {"error": str(e), "invocation_id": context.aws_request_id, "worker_id": worker_id}
+        _complete_async(event, failure)
+        return failure
+    finally:
+        # cleanup, everything but the mirrors, which are only evicted as far as the /tmp budget needs
+        mirror_cache.cleanup()
 
     s3_path = f"s3://coincommit/{s3_generated_report_path}"
     print(f"output: {s3_path}")
@@ -70,4 +84,7 @@ def lambda_handler(event, context):
         "worker_id": worker_id,
     }
 
+    if "run_id" in event:
+        _complete_async(event, lambda_response)
+
     return lambda_response